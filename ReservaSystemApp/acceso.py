@@ -0,0 +1,85 @@
+from django.core import signing
+from django.db import transaction
+from ReservaSystemApp.models import DisponibilidadParque, Reserva
+from ReservaSystemApp.documentos import verificar_token, huella_token
+
+def registrar_ingreso(token, fecha):
+    """
+    Valida el token del QR y marca la reserva como UTILIZADO con un solo
+    UPDATE condicional. Devuelve (reserva_id, motivo); motivo es None si el ingreso fue aceptado.
+    """
+    try:
+        datos = verificar_token(token)
+    except signing.BadSignature:
+        return None, 'TOKEN_INVALIDO'
+
+    if datos['fecha'] != fecha.isoformat():
+        return datos['reserva_id'], 'FECHA_INCORRECTA'
+
+    actualizadas = Reserva.objects.filter(
+        idReserva=datos['reserva_id'],
+        disponibilidad_id=datos['disponibilidad_id'],
+        estadoReserva=Reserva.Estado.ACTIVO
+    ).update(estadoReserva=Reserva.Estado.UTILIZADO)
+
+    if actualizadas:
+        return datos['reserva_id'], None
+
+    # Solo en el caso de rechazo se consulta el motivo
+    reserva = Reserva.objects.filter(idReserva=datos['reserva_id']).values_list('estadoReserva', 'disponibilidad_id').first()
+    if reserva is None:
+        return datos['reserva_id'], 'NO_EXISTE'
+    estado, disponibilidad_id = reserva
+    if estado == Reserva.Estado.ACTIVO and disponibilidad_id != datos['disponibilidad_id']:
+        # La reserva se movió de horario: este QR fue reemplazado por uno nuevo
+        return datos['reserva_id'], 'HORARIO_CAMBIADO'
+    return datos['reserva_id'], estado
+
+def manifiesto_del_dia(fecha):
+    """
+    Formato compacto para los dispositivos de acceso: listas en vez de objetos.
+    Cada reserva lleva la huella del token de su documento vigente (None si aún
+    no tiene), para validar sin conexión los QR escaneados con validar_sin_conexion.
+    """
+    horarios = DisponibilidadParque.objects.filter(fecha=fecha).order_by('horaInicio').values_list('id', 'horaInicio', 'horaFin')
+    reservas = Reserva.objects.filter(
+        disponibilidad__fecha=fecha,
+        estadoReserva=Reserva.Estado.ACTIVO
+    ).order_by('idReserva').values_list('idReserva', 'disponibilidad_id', 'cantidadVisitantes', 'documento__token')
+
+    return {
+        'fecha': fecha.isoformat(),
+        'horarios': [[id, inicio.strftime('%H:%M'), fin.strftime('%H:%M')] for id, inicio, fin in horarios],
+        'reservas': [
+            [id, disponibilidad_id, cantidad, huella_token(token) if token else None]
+            for id, disponibilidad_id, cantidad, token in reservas
+        ],
+    }
+
+def validar_sin_conexion(token, manifiesto, registradas=()):
+    """
+    Lo que hace un dispositivo sin conexión con un QR escaneado: lo acepta solo
+    si su huella corresponde al documento vigente de una reserva del manifiesto.
+    Un QR reemplazado, de otro día o alterado no aparece. registradas son las
+    reservas ya ingresadas en el dispositivo. Devuelve (reserva_id, motivo).
+    """
+    huella = huella_token(token)
+    reserva_id = next((reserva[0] for reserva in manifiesto['reservas'] if reserva[3] == huella), None)
+    if reserva_id is None:
+        return None, 'NO_EN_MANIFIESTO'
+    if reserva_id in registradas:
+        return reserva_id, 'UTILIZADO'
+    return reserva_id, None
+
+@transaction.atomic
+def sincronizar_ingresos(reserva_ids, fecha):
+    # Aplica en un solo UPDATE los ingresos registrados sin conexión por un dispositivo
+    pendientes = Reserva.objects.select_for_update(of=('self',)).filter(
+        idReserva__in=reserva_ids,
+        disponibilidad__fecha=fecha,
+        estadoReserva=Reserva.Estado.ACTIVO
+    )
+    aceptadas = sorted(pendientes.values_list('idReserva', flat=True))
+    Reserva.objects.filter(idReserva__in=aceptadas).update(estadoReserva=Reserva.Estado.UTILIZADO)
+
+    return aceptadas, sorted(set(reserva_ids) - set(aceptadas))
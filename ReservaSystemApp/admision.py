@@ -0,0 +1,175 @@
+"""
+Control de admisión delante de guardarReserva y retenerCupos.
+
+Antes de abrir la transacción, cada reserva ocupa un lugar entre las reservas
+en curso (en total y en su horario) y toma una ficha de la cubeta global. Si
+falta alguno, no toca la base de datos: recibe un turno en la sala de espera y
+un Retry-After calculado con su posición, y la página vuelve a enviar el
+formulario cuando se cumple el plazo, conservando el turno. Las retenciones
+comparten los mismos límites pero se piden con fetch: reciben un 429 en JSON
+con el Retry-After y el formulario vuelve a pedirlas, sin turno.
+
+El estado vive en la caché de Django para que todos los workers compartan los
+límites. La caché ofrece add e incr atómicos pero no comparar y reemplazar, así
+que la cubeta se rellena completa al empezar cada intervalo (un contador por
+intervalo) en vez de ficha a ficha. Los contadores de reservas en curso vencen
+tras ADMISION_TTL_SEGUNDOS sin entradas, por si un worker termina a mitad de una
+reserva, y nunca bajan de cero.
+"""
+
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.shortcuts import render
+
+CLAVE_EN_CURSO = 'admision:en_curso'
+CLAVE_TURNOS = 'admision:turnos'
+# Turno más alto ya admitido: la posición en la fila se cuenta desde aquí
+CLAVE_FRENTE = 'admision:frente'
+
+
+def incrementar(clave, timeout):
+    # add no pisa un contador existente; incr es atómico en los backends de caché de Django
+    cache.add(clave, 0, timeout)
+    try:
+        return cache.incr(clave)
+    except ValueError:
+        # Venció entre add e incr
+        return 1 if cache.add(clave, 1, timeout) else cache.incr(clave)
+
+def decrementar(clave):
+    try:
+        valor = cache.decr(clave)
+    except ValueError:
+        # El contador venció mientras la reserva estaba en curso
+        return
+    if valor < 0:
+        # Venció y se volvió a crear con reservas aún en curso: sin este piso, el
+        # contador negativo dejaría pasar más reservas que el límite
+        cache.incr(clave, -valor)
+
+def ocupar(clave, limite):
+    en_curso = incrementar(clave, settings.ADMISION_TTL_SEGUNDOS)
+    # Cada entrada renueva el vencimiento: solo vence un contador sin movimiento,
+    # como el que deja un worker que terminó a mitad de una reserva
+    cache.touch(clave, settings.ADMISION_TTL_SEGUNDOS)
+    if en_curso <= limite:
+        return True
+    decrementar(clave)
+    return False
+
+def tomar_ficha():
+    fichas = settings.ADMISION_FICHAS
+    if fichas is None:
+        return True
+    intervalo = settings.ADMISION_INTERVALO_SEGUNDOS
+    clave = f'admision:fichas:{int(time.time() // intervalo)}'
+    return incrementar(clave, intervalo * 2) <= fichas
+
+def entrar(disponibilidad_id):
+    """
+    Intenta admitir una reserva para el horario (None si no se pudo leer).
+    Devuelve las claves ocupadas, que se liberan con salir, o None si la
+    reserva debe esperar.
+    """
+    limites = [(CLAVE_EN_CURSO, settings.ADMISION_CONCURRENCIA_GLOBAL)]
+    if disponibilidad_id is not None:
+        limites.append((f'{CLAVE_EN_CURSO}:{disponibilidad_id}', settings.ADMISION_CONCURRENCIA_HORARIO))
+
+    ocupadas = []
+    for clave, limite in limites:
+        if limite is None:
+            continue
+        if not ocupar(clave, limite):
+            salir(ocupadas)
+            return None
+        ocupadas.append(clave)
+
+    # La ficha se toma al final: una reserva rechazada por concurrencia no gasta fichas
+    if not tomar_ficha():
+        salir(ocupadas)
+        return None
+    return ocupadas
+
+def salir(ocupadas):
+    for clave in ocupadas:
+        decrementar(clave)
+
+def leer_turno(valor):
+    return int(valor) if valor and valor.isdigit() else None
+
+def avanzar_frente(turno):
+    # Sin comparar y reemplazar, dos admisiones simultáneas pueden dejar el frente
+    # un poco atrás; la posición es una estimación para la sala de espera
+    if turno is not None and turno > cache.get(CLAVE_FRENTE, 0):
+        cache.set(CLAVE_FRENTE, turno, None)
+
+def pedir_turno(turno_anterior):
+    # Un reintento conserva su turno; la posición baja a medida que se admiten los anteriores
+    turno = turno_anterior if turno_anterior is not None else incrementar(CLAVE_TURNOS, None)
+    posicion = max(turno - cache.get(CLAVE_FRENTE, 0), 1)
+    return turno, posicion
+
+def segundos_de_espera(posicion):
+    # La cubeta admite ADMISION_FICHAS reservas por intervalo; sin cubeta, una por segundo
+    por_segundo = settings.ADMISION_FICHAS / settings.ADMISION_INTERVALO_SEGUNDOS if settings.ADMISION_FICHAS else 1
+    return min(max(math.ceil(posicion / por_segundo), 1), settings.ADMISION_ESPERA_MAXIMA_SEGUNDOS)
+
+def sala_espera(request):
+    turno, posicion = pedir_turno(leer_turno(request.POST.get('turno')))
+    espera = segundos_de_espera(posicion)
+    # Se reenvían los mismos datos, incluida la retención de cupos; el token CSRF lo pone la plantilla
+    campos = [
+        (nombre, valor)
+        for nombre in request.POST if nombre not in ('csrfmiddlewaretoken', 'turno')
+        for valor in request.POST.getlist(nombre)
+    ]
+    response = render(request, 'sala_espera.html', {
+        'turno': turno,
+        'posicion': posicion,
+        'espera': espera,
+        'campos': campos,
+    }, status=429)
+    response['Retry-After'] = str(espera)
+    return response
+
+def espera_json(request):
+    # Sin turno: pedirlo adelantaría la fila de las reservas con cada cambio de horario en el formulario
+    espera = segundos_de_espera(1)
+    response = JsonResponse({
+        'error': f'Hay muchas solicitudes en este momento; se reintentará en {espera} segundos',
+        'reintentar': espera,
+    }, status=429)
+    response['Retry-After'] = str(espera)
+    return response
+
+def con_admision(rechazar):
+    """
+    Decorador que admite cada POST según el horario en el campo hora. Las
+    peticiones que deben esperar reciben la respuesta de rechazar(request).
+    """
+    def decorador(vista):
+        @wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            if request.method != 'POST':
+                return vista(request, *args, **kwargs)
+
+            hora = request.POST.get('hora', '')
+            ocupadas = entrar(int(hora) if hora.isdigit() else None)
+            if ocupadas is None:
+                return rechazar(request)
+
+            avanzar_frente(leer_turno(request.POST.get('turno')))
+            try:
+                return vista(request, *args, **kwargs)
+            finally:
+                salir(ocupadas)
+        return envoltura
+    return decorador
+
+admision_reservas = con_admision(sala_espera)
+admision_retenciones = con_admision(espera_json)
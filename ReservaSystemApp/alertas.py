@@ -0,0 +1,87 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import IntegerField, OuterRef, Subquery, Sum, F, Value
+from django.db.models.functions import Coalesce
+from ReservaSystemApp.models import DisponibilidadParque, AlertaCapacidad, RetencionCupo
+from ReservaSystemApp.disponibilidad import rango_ventana
+from ReservaSystemApp.notificaciones import escribir_notificaciones
+
+def reservados():
+    # capacidadActual incluye los cupos retenidos mientras se completa el formulario
+    # (vigentes o vencidos sin liberar): las alertas cuentan solo los reservados
+    retenidos = RetencionCupo.objects.filter(
+        disponibilidad=OuterRef('pk')
+    ).order_by().values('disponibilidad').annotate(cupos=Sum('cantidadVisitantes')).values('cupos')
+    return F('capacidadActual') - Coalesce(Subquery(retenidos, output_field=IntegerField()), Value(0))
+
+def horarios_sobre_umbral(fecha_desde, fecha_hasta, umbral):
+    return DisponibilidadParque.objects.filter(
+        fecha__gte=fecha_desde,
+        fecha__lte=fecha_hasta,
+        capacidadMaxima__gt=0
+    ).annotate(
+        visitantes=reservados()
+    ).annotate(
+        ocupacion=F('visitantes') * 100
+    ).filter(
+        ocupacion__gt=F('capacidadMaxima') * umbral
+    ).values('id', 'fecha', 'horaInicio', 'visitantes', 'capacidadMaxima')
+
+def dias_sobre_umbral(fecha_desde, fecha_hasta, umbral):
+    return DisponibilidadParque.objects.filter(
+        fecha__gte=fecha_desde,
+        fecha__lte=fecha_hasta
+    ).annotate(
+        reservados=reservados()
+    ).values('fecha').annotate(
+        visitantes=Sum('reservados'),
+        capacidad=Sum('capacidadMaxima'),
+        ocupacion=Sum('reservados') * 100
+    ).filter(
+        capacidad__gt=0,
+        ocupacion__gt=F('capacidad') * umbral
+    ).order_by('fecha')
+
+def candidatas(fecha_desde, fecha_hasta):
+    umbral = settings.ALERTAS_UMBRAL_HORARIO
+    for horario in horarios_sobre_umbral(fecha_desde, fecha_hasta, umbral):
+        porcentaje = round(horario['visitantes'] * 100 / horario['capacidadMaxima'])
+        yield AlertaCapacidad(
+            alcance=AlertaCapacidad.Alcance.HORARIO,
+            referencia=str(horario['id']),
+            umbral=umbral,
+            porcentaje=porcentaje
+        ), f"Horario {horario['fecha']:%d/%m/%Y} {horario['horaInicio']:%H:%M} al {porcentaje}% de su capacidad."
+
+    umbral = settings.ALERTAS_UMBRAL_DIA
+    for dia in dias_sobre_umbral(fecha_desde, fecha_hasta, umbral):
+        porcentaje = round(dia['visitantes'] * 100 / dia['capacidad'])
+        yield AlertaCapacidad(
+            alcance=AlertaCapacidad.Alcance.DIA,
+            referencia=dia['fecha'].isoformat(),
+            umbral=umbral,
+            porcentaje=porcentaje
+        ), f"Ocupación del parque al {porcentaje}% el {dia['fecha']:%d/%m/%Y}."
+
+@transaction.atomic
+def evaluar_alertas():
+    # Cada (alcance, referencia, umbral) genera una sola alerta y una sola notificación
+    fecha_desde, fecha_hasta = rango_ventana()
+    nuevas = list(candidatas(fecha_desde, fecha_hasta))
+    if not nuevas:
+        return []
+
+    existentes = set(AlertaCapacidad.objects.filter(
+        referencia__in={alerta.referencia for alerta, _ in nuevas}
+    ).values_list('alcance', 'referencia', 'umbral'))
+    nuevas = [
+        (alerta, mensaje) for alerta, mensaje in nuevas
+        if (alerta.alcance, alerta.referencia, alerta.umbral) not in existentes
+    ]
+
+    AlertaCapacidad.objects.bulk_create([alerta for alerta, _ in nuevas], ignore_conflicts=True)
+    escribir_notificaciones([
+        {'fechaEnvio': alerta.fechaCreacion.date().isoformat(), 'tipo': 'ALERTA DE CAPACIDAD', 'mensaje': mensaje}
+        for alerta, mensaje in nuevas
+    ])
+    return nuevas
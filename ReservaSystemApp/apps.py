@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ReservasystemappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ReservaSystemApp'
+
+    def ready(self):
+        from ReservaSystemApp import signals, notificaciones  # noqa: F401
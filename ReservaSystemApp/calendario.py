@@ -0,0 +1,68 @@
+import datetime
+
+from django.db import connection, transaction
+from ReservaSystemApp.models import DisponibilidadParque, CapacidadDiaria
+from ReservaSystemApp.disponibilidad import invalidar_disponibilidad_al_confirmar
+from ReservaSystemApp.ocupacion import capacidad_desde_disponibilidad
+
+DIAS_SEMANA = ['lun', 'mar', 'mie', 'jue', 'vie', 'sab', 'dom']
+
+def leer_dias_semana(texto):
+    dias = set()
+    for parte in texto.split(','):
+        parte = parte.strip().lower()[:3]
+        if parte not in DIAS_SEMANA:
+            raise ValueError(f'Día de la semana no válido: {parte}')
+        dias.add(DIAS_SEMANA.index(parte))
+    return dias
+
+def expandir_plantilla(fecha_desde, fecha_hasta, dias_semana, apertura, cierre, duracion, capacidad, fechas_cerradas=()):
+    # Genera los horarios sin tocar la base de datos: un objeto por día abierto y bloque horario
+    if duracion <= datetime.timedelta(0):
+        raise ValueError('La duración del bloque debe ser positiva')
+
+    cerradas = set(fechas_cerradas)
+    fecha = fecha_desde
+    while fecha <= fecha_hasta:
+        if fecha.weekday() in dias_semana and fecha not in cerradas:
+            inicio = datetime.datetime.combine(fecha, apertura)
+            fin_dia = datetime.datetime.combine(fecha, cierre)
+            while inicio + duracion <= fin_dia:
+                yield DisponibilidadParque(
+                    fecha=fecha,
+                    horaInicio=inicio.time(),
+                    horaFin=(inicio + duracion).time(),
+                    capacidadMaxima=capacidad,
+                    capacidadActual=0
+                )
+                inicio += duracion
+        fecha += datetime.timedelta(days=1)
+
+@transaction.atomic
+def generar_horarios(horarios, fecha_desde, fecha_hasta, tamano_lote=1000):
+    # bulk_create no dispara señales: se actualizan a mano la capacidad diaria y la caché
+    lote = []
+    total = 0
+    for horario in horarios:
+        lote.append(horario)
+        if len(lote) >= tamano_lote:
+            DisponibilidadParque.objects.bulk_create(lote, ignore_conflicts=True)
+            total += len(lote)
+            lote = []
+    if lote:
+        DisponibilidadParque.objects.bulk_create(lote, ignore_conflicts=True)
+        total += len(lote)
+
+    CapacidadDiaria.objects.bulk_create(
+        [
+            CapacidadDiaria(fecha=fecha, capacidadMaxima=capacidad)
+            for fecha, capacidad in capacidad_desde_disponibilidad(fecha_desde, fecha_hasta).items()
+        ],
+        update_conflicts=True,
+        # MySQL resuelve el conflicto con cualquier clave única y no acepta unique_fields
+        unique_fields=['fecha'] if connection.features.supports_update_conflicts_with_target else None,
+        update_fields=['capacidadMaxima'],
+        batch_size=tamano_lote
+    )
+    invalidar_disponibilidad_al_confirmar()
+    return total
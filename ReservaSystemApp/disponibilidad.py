@@ -0,0 +1,122 @@
+import datetime
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from ReservaSystemApp.models import DisponibilidadParque, TipoVisita
+
+VERSION_KEY = 'disponibilidad:version'
+
+def version_disponibilidad():
+    # La versión cambia cada vez que cambia la capacidad o el calendario de horarios
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+def invalidar_disponibilidad():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, time.time_ns(), None)
+
+def invalidar_disponibilidad_al_confirmar():
+    # Dentro de una transacción se espera al commit, para que ninguna lectura
+    # concurrente vuelva a guardar en caché los valores anteriores
+    transaction.on_commit(invalidar_disponibilidad)
+
+def reservar_capacidad(disponibilidad_id, cantidad):
+    # UPDATE condicional: la comprobación y el incremento ocurren en una sola
+    # sentencia, por lo que dos reservas concurrentes no pueden sobrevender el horario
+    actualizadas = DisponibilidadParque.objects.filter(
+        id=disponibilidad_id,
+        capacidadActual__lte=F('capacidadMaxima') - cantidad
+    ).update(capacidadActual=F('capacidadActual') + cantidad)
+
+    if actualizadas:
+        invalidar_disponibilidad_al_confirmar()
+    return actualizadas == 1
+
+def liberar_capacidad(disponibilidad_id, cantidad):
+    DisponibilidadParque.objects.filter(id=disponibilidad_id).update(
+        capacidadActual=F('capacidadActual') - cantidad
+    )
+    invalidar_disponibilidad_al_confirmar()
+
+def rango_ventana():
+    hoy = timezone.localdate()
+    return hoy, hoy + datetime.timedelta(days=settings.DISPONIBILIDAD_DIAS_VENTANA)
+
+def consultar_disponibilidades(fecha_desde, fecha_hasta):
+    return DisponibilidadParque.objects.filter(
+        fecha__gte=fecha_desde,
+        fecha__lte=fecha_hasta
+    ).order_by('fecha', 'horaInicio').values(
+        'id', 'fecha', 'horaInicio', 'horaFin', 'capacidadMaxima', 'capacidadActual',
+        cupos_disponibles=F('capacidadMaxima') - F('capacidadActual'),
+    )
+
+def obtener_disponibilidades(fecha_desde=None, fecha_hasta=None):
+    if fecha_desde is None:
+        fecha_desde, fecha_hasta = rango_ventana()
+    key = f'disponibilidad:{version_disponibilidad()}:{fecha_desde}:{fecha_hasta}'
+
+    disponibilidades = cache.get(key)
+    if disponibilidades is None:
+        disponibilidades = list(consultar_disponibilidades(fecha_desde, fecha_hasta))
+        cache.set(key, disponibilidades, settings.DISPONIBILIDAD_CACHE_TIMEOUT)
+    return disponibilidades
+
+def version_fragmentos():
+    # Clave de los fragmentos de form.html: cambia con la disponibilidad y cuando
+    # la ventana avanza un día, igual que la clave de obtener_disponibilidades
+    return f'{version_disponibilidad()}:{rango_ventana()[0]}'
+
+def consultar_tipos_visita():
+    return TipoVisita.objects.all().order_by('nombre').values('id', 'nombre', 'descripcion')
+
+def obtener_tipos_visita():
+    key = f'tipos_visita:{version_disponibilidad()}'
+
+    tipos_visita = cache.get(key)
+    if tipos_visita is None:
+        tipos_visita = list(consultar_tipos_visita())
+        cache.set(key, tipos_visita, settings.DISPONIBILIDAD_CACHE_TIMEOUT)
+    return tipos_visita
+
+# Versiones para las vistas asíncronas: mismas claves de caché que las anteriores,
+# con la API asíncrona de la caché y del ORM
+
+async def aversion_disponibilidad():
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        await cache.aadd(VERSION_KEY, time.time_ns(), None)
+        version = await cache.aget(VERSION_KEY)
+    return version
+
+async def aobtener_disponibilidades(fecha_desde=None, fecha_hasta=None):
+    if fecha_desde is None:
+        fecha_desde, fecha_hasta = rango_ventana()
+    key = f'disponibilidad:{await aversion_disponibilidad()}:{fecha_desde}:{fecha_hasta}'
+
+    disponibilidades = await cache.aget(key)
+    if disponibilidades is None:
+        disponibilidades = [d async for d in consultar_disponibilidades(fecha_desde, fecha_hasta)]
+        await cache.aset(key, disponibilidades, settings.DISPONIBILIDAD_CACHE_TIMEOUT)
+    return disponibilidades
+
+async def aversion_fragmentos():
+    return f'{await aversion_disponibilidad()}:{rango_ventana()[0]}'
+
+async def aobtener_tipos_visita():
+    key = f'tipos_visita:{await aversion_disponibilidad()}'
+
+    tipos_visita = await cache.aget(key)
+    if tipos_visita is None:
+        tipos_visita = [tipo async for tipo in consultar_tipos_visita()]
+        await cache.aset(key, tipos_visita, settings.DISPONIBILIDAD_CACHE_TIMEOUT)
+    return tipos_visita
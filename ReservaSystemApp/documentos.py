@@ -0,0 +1,145 @@
+import hashlib
+import secrets
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core import signing
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from ReservaSystemApp.models import Reserva, DocumentoAcceso
+from ReservaSystemApp.qr import generar_png
+
+SALT_ACCESO = 'ReservaSystemApp.acceso'
+
+def firmar_token(reserva_id, disponibilidad_id, fecha):
+    # n distingue cada emisión: la marca de tiempo de la firma es por segundo
+    return signing.dumps(
+        {'r': reserva_id, 'd': disponibilidad_id, 'f': fecha.isoformat(), 'n': secrets.token_urlsafe(4)},
+        salt=SALT_ACCESO,
+        compress=True
+    )
+
+def verificar_token(token):
+    # Solo comprueba la firma: el escáner no necesita consultar la base de datos
+    datos = signing.loads(token, salt=SALT_ACCESO)
+    return {'reserva_id': datos['r'], 'disponibilidad_id': datos['d'], 'fecha': datos['f']}
+
+def huella_token(token):
+    # Verificador del manifiesto: permite comparar un QR escaneado sin publicar el token
+    return hashlib.sha256(token.encode()).hexdigest()[:16]
+
+def reservas_sin_documento(fecha=None):
+    reservas = Reserva.objects.filter(
+        documento__isnull=True,
+        estadoReserva=Reserva.Estado.ACTIVO,
+        disponibilidad__isnull=False
+    )
+    if fecha:
+        reservas = reservas.filter(disponibilidad__fecha=fecha)
+    else:
+        reservas = reservas.filter(disponibilidad__fecha__gte=timezone.localdate())
+    return reservas.order_by('idReserva').values('idReserva', 'disponibilidad_id', 'disponibilidad__fecha')
+
+def nombre_qr(reserva_id):
+    # Nombre único por emisión: un archivo nunca se reemplaza mientras una fila confirmada lo use
+    return f"qr/reserva-{reserva_id}-{secrets.token_hex(8)}.png"
+
+@transaction.atomic
+def reclamar_documentos(tokens):
+    """
+    Inserta con un solo bulk_create los documentos de las reservas que aún no
+    tienen y devuelve [(reserva_id, token, nombre)] de las filas que insertó
+    esta llamada: las que otro proceso reclamó antes quedan con su token (cada
+    emisión es distinta) y su PNG.
+    """
+    hoy = timezone.localdate()
+    nombres = {reserva_id: nombre_qr(reserva_id) for reserva_id in tokens}
+    DocumentoAcceso.objects.bulk_create([
+        DocumentoAcceso(
+            reserva_id=reserva_id,
+            codigoQR=nombres[reserva_id],
+            fechaGeneracion=hoy,
+            rutVisitante=True,
+            token=token
+        )
+        for reserva_id, token in tokens.items()
+    ], ignore_conflicts=True)
+    return [
+        (reserva_id, token, nombres[reserva_id])
+        for reserva_id, token in DocumentoAcceso.objects.filter(reserva_id__in=tokens).values_list('reserva_id', 'token')
+        if tokens[reserva_id] == token
+    ]
+
+def devolver_a_pendientes(propias):
+    # Una fila sin su PNG se borra para que procesar_pendientes la vuelva a generar
+    DocumentoAcceso.objects.filter(
+        reserva_id__in=[reserva_id for reserva_id, _, _ in propias],
+        token__in=[token for _, token, _ in propias]
+    ).delete()
+
+def escribir_png(propias, imagenes):
+    for i, ((_, _, nombre), png) in enumerate(zip(propias, imagenes)):
+        try:
+            default_storage.save(nombre, ContentFile(png))
+        except BaseException:
+            devolver_a_pendientes(propias[i:])
+            raise
+
+def generar_documentos(reservas, pool=None):
+    """
+    Genera y guarda los documentos de acceso de un lote de reservas. Los
+    registros se reclaman primero en una transacción corta; los PNG se
+    producen después, en el pool de procesos (si se entrega), solo para las
+    filas de este lote, y se escriben cuando esas filas están confirmadas.
+    Devuelve la cantidad generada.
+    """
+    tokens = {
+        reserva['idReserva']: firmar_token(reserva['idReserva'], reserva['disponibilidad_id'], reserva['disponibilidad__fecha'])
+        for reserva in reservas
+    }
+    if not tokens:
+        return 0
+
+    propias = reclamar_documentos(tokens)
+    try:
+        if pool:
+            imagenes = list(pool.map(generar_png, [token for _, token, _ in propias], chunksize=16))
+        else:
+            imagenes = [generar_png(token) for _, token, _ in propias]
+    except BaseException:
+        devolver_a_pendientes(propias)
+        raise
+    # Fuera de una transacción se escriben de inmediato; dentro de una, solo si confirma
+    transaction.on_commit(lambda: escribir_png(propias, imagenes))
+    return len(propias)
+
+def descartar_documento(reserva_id):
+    """
+    Descarta el documento de una reserva cuyo horario cambió, porque el token
+    firmado fija el horario y la fecha. Se llama dentro de la transacción del
+    cambio: solo borra la fila, y el archivo al confirmar; el documento nuevo lo
+    genera procesar_pendientes, fuera de la petición.
+    """
+    documento = DocumentoAcceso.objects.filter(reserva_id=reserva_id).first()
+    if documento is None:
+        return
+    documento.delete()
+    transaction.on_commit(lambda: default_storage.delete(documento.codigoQR.name))
+
+def procesar_pendientes(fecha=None, procesos=None, tamano_lote=None):
+    # Genera por lotes los documentos de todas las reservas pendientes; produce la cantidad por lote
+    procesos = settings.DOCUMENTOS_QR_PROCESOS if procesos is None else procesos
+    tamano_lote = tamano_lote or settings.DOCUMENTOS_QR_LOTE
+    pool = ProcessPoolExecutor(max_workers=procesos) if procesos else None
+
+    try:
+        while True:
+            lote = list(reservas_sin_documento(fecha)[:tamano_lote])
+            if not lote:
+                break
+            yield generar_documentos(lote, pool)
+    finally:
+        if pool:
+            pool.shutdown()
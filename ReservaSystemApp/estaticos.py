@@ -0,0 +1,82 @@
+import re
+
+import rcssmin
+import rjsmin
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.contrib.staticfiles import finders
+from django.core.files.base import ContentFile
+from whitenoise.middleware import WhiteNoiseMiddleware
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+SOURCE_MAP = re.compile(r'^\s*(?://|/\*)# sourceMappingURL=(\S+?)(?:\s*\*/)?\s*$', re.MULTILINE)
+
+MINIFICADORES = {
+    '.js': rjsmin.jsmin,
+    '.css': rcssmin.cssmin,
+}
+
+
+class AlmacenEstaticos(CompressedManifestStaticFilesStorage):
+    """
+    Almacenamiento de producción para collectstatic: minifica JS y CSS al
+    copiarlos, y luego ManifestStaticFilesStorage agrega el hash del contenido
+    al nombre y WhiteNoise genera las variantes .gz y .br.
+    """
+
+    def save(self, name, content, max_length=None):
+        # collectstatic copia cada archivo con save()
+        extension = name[name.rfind('.'):]
+        if extension in MINIFICADORES:
+            texto = content.read().decode('utf-8')
+            texto = quitar_source_maps_faltantes(name, texto)
+            if not name.endswith(f'.min{extension}'):
+                texto = MINIFICADORES[extension](texto)
+            content = ContentFile(texto.encode('utf-8'))
+        return super().save(name, content, max_length)
+
+    def post_process(self, paths, dry_run=False, **options):
+        # El manifiesto lee por defecto los archivos de los directorios de origen:
+        # se le entregan las copias ya minificadas para que el hash sea el de estas
+        if not dry_run:
+            paths = {ruta: (self, ruta) for ruta in paths}
+        yield from super().post_process(paths, dry_run, **options)
+
+
+def quitar_source_maps_faltantes(name, texto):
+    # El manifiesto falla si un archivo apunta a un .map que no se publica
+    directorio = name.rsplit('/', 1)[0] + '/' if '/' in name else ''
+
+    def reemplazar(coincidencia):
+        return coincidencia.group(0) if finders.find(directorio + coincidencia.group(1)) else ''
+
+    return SOURCE_MAP.sub(reemplazar, texto)
+
+
+class WhiteNoiseAsincrono(WhiteNoiseMiddleware):
+    """
+    WhiteNoiseMiddleware solo es síncrono: bajo ASGI obligaría a Django a pasar
+    cada petición por un hilo antes de llegar a las vistas asíncronas. Aquí
+    solo los archivos estáticos se sirven en un hilo; el resto sigue en el bucle de eventos.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
@@ -0,0 +1,221 @@
+"""
+Formato del CSV: una fila por persona, agrupadas por la columna grupo.
+
+    grupo,rol,rut,nombre,apellido,telefono,correo,fecha_nacimiento,fecha,hora,tipo_visita
+
+La fila con rol=titular define el visitante principal, el horario (fecha y
+hora de inicio) y el tipo de visita; las filas con rol=acompanante solo
+necesitan rut, nombre y fecha_nacimiento.
+"""
+
+import csv
+import datetime
+
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from ReservaSystemApp.models import DisponibilidadParque, Visitante, Acompañante, Reserva, TipoVisita
+from ReservaSystemApp.disponibilidad import invalidar_disponibilidad_al_confirmar
+from ReservaSystemApp.ocupacion import registrar_ocupacion
+from ReservaSystemApp.rut import normalizar_rut
+
+
+COLUMNAS = ['grupo', 'rol', 'rut', 'nombre', 'apellido', 'telefono', 'correo', 'fecha_nacimiento', 'fecha', 'hora', 'tipo_visita']
+TAMANO_LOTE = 1000
+ROLES = {'titular', 'acompanante', 'acompañante'}
+
+
+class Grupo:
+    def __init__(self, clave):
+        self.clave = clave
+        self.lineas = []
+        self.titular = None
+        self.acompanantes = []
+        self.horario = None
+        self.tipo_visita = None
+        self.errores = []
+
+    @property
+    def cantidad(self):
+        return 1 + len(self.acompanantes)
+
+
+def leer_fila(fila):
+    datos = {
+        'rut': normalizar_rut(fila.get('rut')),
+        'nombre': (fila.get('nombre') or '').strip(),
+        'fecha_nacimiento': datetime.date.fromisoformat((fila.get('fecha_nacimiento') or '').strip()),
+    }
+    if not datos['nombre']:
+        raise ValueError('falta el nombre')
+    return datos
+
+
+def leer_grupos(archivo):
+    # Primera pasada: valida todas las filas sin tocar la base de datos
+    lector = csv.DictReader(archivo)
+    faltantes = set(COLUMNAS) - set(lector.fieldnames or [])
+    if faltantes:
+        raise ValueError(f"Faltan columnas en el CSV: {', '.join(sorted(faltantes))}")
+
+    grupos = {}
+    for linea, fila in enumerate(lector, start=2):
+        clave = (fila['grupo'] or '').strip()
+        grupo = grupos.setdefault(clave, Grupo(clave))
+        grupo.lineas.append(linea)
+
+        try:
+            rol = (fila['rol'] or '').strip().lower()
+            if rol not in ROLES:
+                raise ValueError(f"rol desconocido: {fila['rol']} (se espera titular o acompanante)")
+            datos = leer_fila(fila)
+            if rol == 'titular':
+                if grupo.titular:
+                    raise ValueError('el grupo tiene más de un titular')
+                for campo in ['apellido', 'telefono', 'correo']:
+                    datos[campo] = (fila[campo] or '').strip()
+                    if not datos[campo]:
+                        raise ValueError(f'falta {campo}')
+                grupo.titular = datos
+                grupo.horario = (
+                    datetime.date.fromisoformat(fila['fecha'].strip()),
+                    datetime.time.fromisoformat(fila['hora'].strip())
+                )
+                grupo.tipo_visita = fila['tipo_visita'].strip()
+            else:
+                grupo.acompanantes.append(datos)
+        except (ValueError, AttributeError) as e:
+            grupo.errores.append((linea, str(e)))
+
+    for grupo in grupos.values():
+        if not grupo.titular and not grupo.errores:
+            grupo.errores.append((grupo.lineas[0], 'el grupo no tiene titular'))
+    return list(grupos.values())
+
+
+def resolver_referencias(grupos):
+    # Horarios y tipos de visita del archivo completo en dos consultas
+    horarios = {grupo.horario for grupo in grupos if not grupo.errores}
+    disponibles = {}
+    if horarios:
+        filtro = Q()
+        for fecha, hora in horarios:
+            filtro |= Q(fecha=fecha, horaInicio=hora)
+        disponibles = {
+            (fecha, hora): id
+            for id, fecha, hora in DisponibilidadParque.objects.filter(filtro).values_list('id', 'fecha', 'horaInicio')
+        }
+    tipos = dict(TipoVisita.objects.values_list('nombre', 'id'))
+
+    por_horario = {}
+    for grupo in grupos:
+        if grupo.errores:
+            continue
+        if grupo.horario not in disponibles:
+            grupo.errores.append((grupo.lineas[0], f'no existe el horario {grupo.horario[0]} {grupo.horario[1]}'))
+        elif grupo.tipo_visita not in tipos:
+            grupo.errores.append((grupo.lineas[0], f'tipo de visita desconocido: {grupo.tipo_visita}'))
+        else:
+            grupo.tipo_visita = tipos[grupo.tipo_visita]
+            por_horario.setdefault(disponibles[grupo.horario], []).append(grupo)
+    return por_horario
+
+
+def guardar_visitantes(titulares, actualizar=False):
+    # Como en guardarReserva, un RUT ya registrado conserva sus datos; con actualizar,
+    # el CSV los reemplaza (importar_reservas --actualizar-visitantes)
+    visitantes = [Visitante(rutNormalizado=datos['rut'], **datos) for datos in titulares.values()]
+    if actualizar:
+        Visitante.objects.bulk_create(
+            visitantes,
+            update_conflicts=True,
+            unique_fields=['rutNormalizado'] if connection.features.supports_update_conflicts_with_target else None,
+            update_fields=['rut', 'nombre', 'apellido', 'telefono', 'correo', 'fecha_nacimiento'],
+            batch_size=TAMANO_LOTE
+        )
+    else:
+        Visitante.objects.bulk_create(visitantes, ignore_conflicts=True, batch_size=TAMANO_LOTE)
+    ids = {}
+    ruts = list(titulares)
+    for inicio in range(0, len(ruts), TAMANO_LOTE):
+        ids.update(Visitante.objects.filter(
+            rutNormalizado__in=ruts[inicio:inicio + TAMANO_LOTE]
+        ).values_list('rutNormalizado', 'idVisitante'))
+    return ids
+
+
+@transaction.atomic
+def importar_horario(disponibilidad_id, grupos, actualizar_visitantes=False):
+    """
+    Asigna capacidad a todos los grupos de un horario con un solo bloqueo de
+    la fila de DisponibilidadParque y los inserta con bulk_create. Los datos
+    de los titulares ya registrados solo se reemplazan con actualizar_visitantes.
+    Devuelve los grupos aceptados.
+    """
+    disponibilidad = DisponibilidadParque.objects.select_for_update().get(id=disponibilidad_id)
+    restante = disponibilidad.capacidadMaxima - disponibilidad.capacidadActual
+
+    aceptados = []
+    titulares = set()
+    for grupo in grupos:
+        if grupo.titular['rut'] in titulares:
+            grupo.errores.append((grupo.lineas[0], 'el titular ya tiene un grupo en este horario'))
+        elif grupo.cantidad > restante:
+            grupo.errores.append((grupo.lineas[0], f'sin capacidad: quedan {restante} cupos'))
+        else:
+            restante -= grupo.cantidad
+            titulares.add(grupo.titular['rut'])
+            aceptados.append(grupo)
+
+    if not aceptados:
+        return []
+
+    total = sum(grupo.cantidad for grupo in aceptados)
+    DisponibilidadParque.objects.filter(id=disponibilidad_id).update(capacidadActual=F('capacidadActual') + total)
+
+    visitantes = guardar_visitantes({grupo.titular['rut']: grupo.titular for grupo in aceptados}, actualizar_visitantes)
+
+    ultimo_id = Reserva.objects.order_by('-idReserva').values_list('idReserva', flat=True).first() or 0
+    # Todas las reservas del lote llevan la misma fechaCreacion, que sirve de marca de la importación
+    marca = timezone.now()
+    reservas = Reserva.objects.bulk_create([
+        Reserva(
+            visitante_id=visitantes[grupo.titular['rut']],
+            disponibilidad_id=disponibilidad_id,
+            cantidadVisitantes=grupo.cantidad,
+            tipoVisita_id=grupo.tipo_visita,
+            estadoReserva=Reserva.Estado.ACTIVO,
+            fechaCreacion=marca
+        )
+        for grupo in aceptados
+    ], batch_size=TAMANO_LOTE)
+
+    if reservas and reservas[0].pk is None:
+        # MySQL no devuelve los ids de un INSERT múltiple. El bloqueo del horario no basta
+        # para reconocerlas: guardarReserva inserta sin tocar la fila cuando confirma una
+        # retención. Se buscan por la marca y los titulares, que no se repiten en el lote
+        ids = dict(Reserva.objects.filter(
+            disponibilidad_id=disponibilidad_id,
+            idReserva__gt=ultimo_id,
+            fechaCreacion=marca,
+            visitante_id__in=[reserva.visitante_id for reserva in reservas]
+        ).values_list('visitante_id', 'idReserva'))
+        for reserva in reservas:
+            reserva.pk = ids[reserva.visitante_id]
+
+    Acompañante.objects.bulk_create([
+        Acompañante(rutVisitante_id=reserva.visitante_id, reserva_id=reserva.pk, **datos)
+        for grupo, reserva in zip(aceptados, reservas)
+        for datos in grupo.acompanantes
+    ], batch_size=TAMANO_LOTE)
+
+    # bulk_create no dispara señales: se actualizan el resumen y la caché a mano
+    por_tipo = {}
+    for grupo in aceptados:
+        reservas_tipo, visitantes_tipo = por_tipo.get(grupo.tipo_visita, (0, 0))
+        por_tipo[grupo.tipo_visita] = (reservas_tipo + 1, visitantes_tipo + grupo.cantidad)
+    for tipo_visita_id, (reservas_tipo, visitantes_tipo) in por_tipo.items():
+        registrar_ocupacion(disponibilidad.fecha, tipo_visita_id, reservas_tipo, visitantes_tipo)
+    invalidar_disponibilidad_al_confirmar()
+
+    return aceptados
@@ -0,0 +1,132 @@
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError, transaction
+from django.db.models import Case, When, Value, Count, Min, OuterRef, Subquery
+from ReservaSystemApp.models import Visitante, Acompañante, Reserva
+from ReservaSystemApp.rut import normalizar_rut
+
+
+def en_lotes(elementos, tamano):
+    for inicio in range(0, len(elementos), tamano):
+        yield elementos[inicio:inicio + tamano]
+
+
+class Command(BaseCommand):
+    help = 'Unifica los visitantes con el mismo RUT normalizado y reasigna sus reservas y acompañantes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500, help='Filas por UPDATE')
+        parser.add_argument('--simular', action='store_true', help='Solo informa lo que se haría')
+
+    def handle(self, *args, **options):
+        lote = options['lote']
+
+        duplicados, normalizar, invalidos = self.agrupar(lote)
+        self.stdout.write(
+            f'{len(duplicados)} visitantes duplicados, {len(normalizar)} RUT por normalizar, '
+            f'{len(invalidos)} RUT no válidos.'
+        )
+        for id_visitante, rut in invalidos[:20]:
+            self.stderr.write(f'Visitante {id_visitante}: RUT no válido "{rut}"')
+
+        if options['simular']:
+            return
+
+        self.asignar_reserva_a_acompanantes(lote)
+
+        for grupo in en_lotes(list(duplicados.items()), lote):
+            self.unificar(grupo)
+
+        unificados = len(duplicados)
+        for grupo in en_lotes(list(normalizar.items()), lote):
+            unificados += self.normalizar(grupo)
+
+        self.stdout.write(self.style.SUCCESS(f'{unificados} visitantes unificados.'))
+
+    def agrupar(self, lote):
+        # Canónico: el visitante que ya tiene rutNormalizado o, si no hay, el de menor id
+        grupos = {}
+        con_normalizado = {}
+        invalidos = []
+
+        visitantes = Visitante.objects.order_by('idVisitante').values_list('idVisitante', 'rut', 'rutNormalizado')
+        for id_visitante, rut, rut_normalizado in visitantes.iterator(chunk_size=lote):
+            try:
+                normalizado = rut_normalizado or normalizar_rut(rut)
+            except ValueError:
+                invalidos.append((id_visitante, rut))
+                continue
+            grupos.setdefault(normalizado, []).append(id_visitante)
+            if rut_normalizado:
+                con_normalizado[normalizado] = id_visitante
+
+        duplicados = {}
+        normalizar = {}
+        for normalizado, ids in grupos.items():
+            canonico = con_normalizado.get(normalizado, ids[0])
+            if normalizado not in con_normalizado:
+                normalizar[canonico] = normalizado
+            for id_visitante in ids:
+                if id_visitante != canonico:
+                    duplicados[id_visitante] = canonico
+
+        return duplicados, normalizar, invalidos
+
+    def asignar_reserva_a_acompanantes(self, lote):
+        # Antes de unificar, cada acompañante queda ligado a la única reserva de su visitante
+        reserva_unica = Reserva.objects.filter(
+            visitante_id=OuterRef('rutVisitante_id')
+        ).values('visitante_id').annotate(
+            reservas=Count('idReserva'), primera=Min('idReserva')
+        ).filter(reservas=1).values('primera')
+
+        ultimo = Acompañante.objects.order_by('-idAcompañante').values_list('idAcompañante', flat=True).first() or 0
+        for inicio in range(0, ultimo, lote):
+            Acompañante.objects.filter(
+                reserva__isnull=True,
+                idAcompañante__gt=inicio,
+                idAcompañante__lte=inicio + lote
+            ).update(reserva_id=Subquery(reserva_unica))
+
+    def normalizar(self, grupo, intentos=3):
+        # Sin bloqueo de rango (PostgreSQL), una inserción puede colarse igual: se reintenta el lote
+        for intento in range(intentos):
+            try:
+                with transaction.atomic():
+                    return self.normalizar_lote(grupo)
+            except IntegrityError:
+                if intento == intentos - 1:
+                    raise
+
+    def normalizar_lote(self, grupo):
+        """
+        Escribe rutNormalizado en los visitantes del lote. Una reserva puede haber
+        registrado el mismo RUT después de agrupar: ese visitante se unifica con la
+        fila nueva en vez de hacer fallar el lote. Devuelve cuántos se unificaron.
+        """
+        ruts = dict(grupo)
+        list(Visitante.objects.select_for_update().filter(idVisitante__in=ruts).values_list('idVisitante', flat=True))
+        # En MySQL la lectura con bloqueo sobre el índice único también impide insertar esos RUT hasta confirmar
+        existentes = dict(Visitante.objects.select_for_update().filter(
+            rutNormalizado__in=ruts.values()
+        ).values_list('rutNormalizado', 'idVisitante'))
+
+        unificar = [(id_visitante, existentes[rut]) for id_visitante, rut in grupo if rut in existentes]
+        if unificar:
+            self.unificar(unificar)
+        Visitante.objects.bulk_update(
+            [Visitante(idVisitante=id_visitante, rut=rut, rutNormalizado=rut) for id_visitante, rut in grupo if rut not in existentes],
+            ['rut', 'rutNormalizado']
+        )
+        return len(unificar)
+
+    @transaction.atomic
+    def unificar(self, grupo):
+        ids = [id_visitante for id_visitante, _ in grupo]
+
+        Reserva.objects.filter(visitante_id__in=ids).update(visitante_id=Case(
+            *[When(visitante_id=duplicado, then=Value(canonico)) for duplicado, canonico in grupo]
+        ))
+        Acompañante.objects.filter(rutVisitante_id__in=ids).update(rutVisitante_id=Case(
+            *[When(rutVisitante_id=duplicado, then=Value(canonico)) for duplicado, canonico in grupo]
+        ))
+        Visitante.objects.filter(idVisitante__in=ids).delete()
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from ReservaSystemApp.alertas import evaluar_alertas
+
+
+class Command(BaseCommand):
+    help = 'Evalúa los umbrales de ocupación por horario y por día y registra las alertas nuevas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--intervalo',
+            type=int,
+            default=0,
+            help='Segundos entre evaluaciones; 0 evalúa una sola vez (para cron)'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            nuevas = evaluar_alertas()
+            for _, mensaje in nuevas:
+                self.stdout.write(mensaje)
+            self.stdout.write(self.style.SUCCESS(f'{len(nuevas)} alertas nuevas.'))
+
+            if not options['intervalo']:
+                break
+            close_old_connections()
+            time.sleep(options['intervalo'])
@@ -0,0 +1,40 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from ReservaSystemApp.documentos import procesar_pendientes
+
+
+class Command(BaseCommand):
+    help = 'Genera los documentos de acceso con código QR firmado de las reservas que aún no lo tienen'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fecha', type=datetime.date.fromisoformat, help='Solo las reservas de este día (AAAA-MM-DD)')
+        parser.add_argument('--procesos', type=int, help='Procesos del pool; 0 genera en el proceso actual')
+        parser.add_argument('--lote', type=int, help='Reservas por lote')
+        parser.add_argument(
+            '--intervalo',
+            type=int,
+            default=0,
+            help='Segundos entre revisiones de reservas nuevas; 0 procesa una vez y termina'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            total = 0
+            inicio = time.perf_counter()
+            for generados in procesar_pendientes(options['fecha'], options['procesos'], options['lote']):
+                total += generados
+
+            duracion = time.perf_counter() - inicio
+            if total or not options['intervalo']:
+                velocidad = total / duracion if duracion else 0
+                self.stdout.write(self.style.SUCCESS(
+                    f'{total} documentos generados en {duracion:.2f} s ({velocidad:.0f} códigos/s).'
+                ))
+
+            if not options['intervalo']:
+                break
+            close_old_connections()
+            time.sleep(options['intervalo'])
@@ -0,0 +1,57 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from ReservaSystemApp.models import DisponibilidadParque
+from ReservaSystemApp.calendario import leer_dias_semana, expandir_plantilla, generar_horarios
+
+
+class Command(BaseCommand):
+    help = 'Genera los horarios de DisponibilidadParque de una temporada a partir de una plantilla semanal'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', required=True, type=datetime.date.fromisoformat, help='Primer día (AAAA-MM-DD)')
+        parser.add_argument('--hasta', required=True, type=datetime.date.fromisoformat, help='Último día (AAAA-MM-DD)')
+        parser.add_argument('--dias', default='lun,mar,mie,jue,vie,sab,dom', help='Días abiertos, p. ej. mar,mie,jue,vie,sab')
+        parser.add_argument('--apertura', default='09:00', type=datetime.time.fromisoformat, help='Hora de apertura (HH:MM)')
+        parser.add_argument('--cierre', default='18:00', type=datetime.time.fromisoformat, help='Hora de cierre (HH:MM)')
+        parser.add_argument('--duracion', default=60, type=int, help='Duración de cada bloque en minutos')
+        parser.add_argument('--capacidad', required=True, type=int, help='Capacidad máxima de cada bloque')
+        parser.add_argument(
+            '--cerrado',
+            action='append',
+            default=[],
+            type=datetime.date.fromisoformat,
+            help='Fecha cerrada (AAAA-MM-DD); se puede repetir'
+        )
+        parser.add_argument('--lote', default=1000, type=int, help='Filas por INSERT')
+
+    def handle(self, *args, **options):
+        if options['desde'] > options['hasta']:
+            raise CommandError('--desde debe ser anterior o igual a --hasta')
+
+        try:
+            horarios = expandir_plantilla(
+                options['desde'],
+                options['hasta'],
+                leer_dias_semana(options['dias']),
+                options['apertura'],
+                options['cierre'],
+                datetime.timedelta(minutes=options['duracion']),
+                options['capacidad'],
+                options['cerrado']
+            )
+            rango = DisponibilidadParque.objects.filter(fecha__gte=options['desde'], fecha__lte=options['hasta'])
+            existentes = rango.aggregate(total=Count('id'))['total']
+
+            inicio = time.perf_counter()
+            generados = generar_horarios(horarios, options['desde'], options['hasta'], options['lote'])
+            duracion = time.perf_counter() - inicio
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        creados = rango.aggregate(total=Count('id'))['total'] - existentes
+        self.stdout.write(self.style.SUCCESS(
+            f'{creados} horarios creados ({generados - creados} ya existían) en {duracion:.2f} s.'
+        ))
@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from ReservaSystemApp.importacion import leer_grupos, resolver_referencias, importar_horario
+
+
+class Command(BaseCommand):
+    help = 'Importa reservas de grupos (colegios, agencias) desde un CSV, con una transacción por horario'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Ruta del CSV')
+        parser.add_argument('--simular', action='store_true', help='Solo valida el archivo, sin reservar')
+        parser.add_argument(
+            '--actualizar-visitantes', action='store_true',
+            help='Reemplaza con los del CSV los datos de contacto de los titulares ya registrados'
+        )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        try:
+            with open(options['archivo'], newline='', encoding='utf-8-sig') as archivo:
+                grupos = leer_grupos(archivo)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        por_horario = resolver_referencias(grupos)
+
+        aceptados = []
+        if not options['simular']:
+            for disponibilidad_id, grupos_horario in por_horario.items():
+                aceptados.extend(importar_horario(disponibilidad_id, grupos_horario, options['actualizar_visitantes']))
+
+        rechazados = [grupo for grupo in grupos if grupo.errores]
+        for grupo in rechazados:
+            for linea, motivo in grupo.errores:
+                self.stderr.write(f'Línea {linea} (grupo {grupo.clave}): {motivo}')
+
+        duracion = time.perf_counter() - inicio
+        if options['simular']:
+            validos = sum(len(grupos_horario) for grupos_horario in por_horario.values())
+            self.stdout.write(f'{validos} grupos válidos y {len(rechazados)} rechazados.')
+            return
+
+        visitantes = sum(grupo.cantidad for grupo in aceptados)
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(aceptados)} grupos importados ({visitantes} visitantes) y {len(rechazados)} rechazados '
+            f'en {duracion:.2f} s.'
+        ))
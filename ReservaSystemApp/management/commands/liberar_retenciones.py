@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from ReservaSystemApp.retenciones import liberar_retenciones_vencidas
+
+
+class Command(BaseCommand):
+    help = 'Devuelve a sus horarios los cupos de las retenciones vencidas, en lotes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500, help='Retenciones por transacción')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            liberadas = liberar_retenciones_vencidas(tamano_lote=options['lote'])
+            if not liberadas:
+                break
+            total += liberadas
+
+        self.stdout.write(self.style.SUCCESS(f'{total} retenciones vencidas liberadas.'))
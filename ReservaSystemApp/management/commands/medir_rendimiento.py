@@ -0,0 +1,110 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from ReservaSystemApp.notificaciones import buffer_notificaciones
+from ReservaSystemApp.rendimiento import ESCENARIOS, sembrar_datos, medir, medir_asgi, comparar
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide latencia, rendimiento y consultas por petición de cada ruta con clientes concurrentes, '
+        'sobre una base SQLite temporal; las respuestas 4xx se cuentan aparte. '
+        'Ejecutar con --settings=SGRAproject.settings_rendimiento'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reservas', type=int, default=5000, help='Reservas sembradas')
+        parser.add_argument('--dias', type=int, default=30, help='Días con horarios, desde hoy')
+        parser.add_argument('--horarios-por-dia', type=int, default=8, help='Bloques de una hora por día')
+        parser.add_argument('--capacidad', type=int, default=200, help='Capacidad máxima de cada bloque')
+        parser.add_argument('--clientes', type=int, default=8, help='Clientes concurrentes')
+        parser.add_argument('--peticiones', type=int, default=200, help='Peticiones por escenario')
+        parser.add_argument('--escenario', action='append', default=[], help='Solo este escenario; se puede repetir')
+        parser.add_argument(
+            '--interfaz', choices=['wsgi', 'asgi', 'ambas'], default='wsgi',
+            help='wsgi: un hilo por cliente; asgi: clientes concurrentes en un bucle de eventos. '
+                 'Los resultados ASGI se guardan como <escenario>@asgi'
+        )
+        parser.add_argument('--salida', help='Archivo JSON donde guardar los resultados')
+        parser.add_argument('--comparar', help='Resultados JSON de una ejecución anterior')
+        parser.add_argument('--umbral', type=float, default=20, help='Porcentaje de empeoramiento tolerado')
+        parser.add_argument('--conservar', action='store_true', help='No borra la base de datos temporal')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('medir_rendimiento usa una base SQLite: ejecútelo con --settings=SGRAproject.settings_rendimiento')
+
+        escenarios = [e for e in ESCENARIOS if not options['escenario'] or e.nombre in options['escenario']]
+        if not escenarios:
+            raise CommandError(f"Escenarios disponibles: {', '.join(e.nombre for e in ESCENARIOS)}")
+
+        base = None
+        if options['comparar']:
+            with open(options['comparar'], encoding='utf-8') as archivo:
+                base = json.load(archivo)['resultados']
+
+        setup_test_environment()
+        nombre_anterior = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            resultados = self.ejecutar(escenarios, options)
+        finally:
+            # Las notificaciones pendientes se escriben en la base temporal, no al cerrar el proceso
+            buffer_notificaciones.vaciar()
+            connection.creation.destroy_test_db(nombre_anterior, verbosity=0, keepdb=options['conservar'])
+            teardown_test_environment()
+
+        if options['salida']:
+            parametros = {
+                clave: options[clave]
+                for clave in ['reservas', 'dias', 'horarios_por_dia', 'capacidad', 'clientes', 'peticiones', 'interfaz']
+            }
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                json.dump({
+                    'fecha': timezone.now().isoformat(),
+                    'parametros': parametros,
+                    'resultados': resultados,
+                }, archivo, indent=2, ensure_ascii=False)
+            self.stdout.write(f"Resultados guardados en {options['salida']}")
+
+        if base is not None:
+            regresiones = comparar(base, resultados, options['umbral'])
+            if regresiones:
+                for regresion in regresiones:
+                    self.stderr.write(regresion)
+                raise CommandError(f'{len(regresiones)} regresiones sobre el umbral de {options["umbral"]} %.')
+            self.stdout.write(self.style.SUCCESS(f'Sin regresiones sobre el umbral de {options["umbral"]} %.'))
+
+    def ejecutar(self, escenarios, options):
+        try:
+            contexto = sembrar_datos(options['reservas'], options['dias'], options['horarios_por_dia'], options['capacidad'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        usuario = User.objects.create_user('rendimiento', password='rendimiento', is_staff=True)
+
+        self.stdout.write(
+            f"{'escenario':<30}{'pet/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'consultas':>11}{'4xx':>7}{'errores':>9}"
+        )
+        interfaces = ['wsgi', 'asgi'] if options['interfaz'] == 'ambas' else [options['interfaz']]
+        resultados = {}
+        # Primero las lecturas, para que las escrituras no cambien los datos que miden
+        for escenario in sorted(escenarios, key=lambda e: e.escribe):
+            for interfaz in interfaces:
+                if interfaz == 'asgi':
+                    nombre = f'{escenario.nombre}@asgi'
+                    resultado = medir_asgi(escenario, contexto, options['clientes'], options['peticiones'], usuario)
+                else:
+                    nombre = escenario.nombre
+                    resultado = medir(escenario, contexto, options['clientes'], options['peticiones'], usuario)
+                resultados[nombre] = resultado
+                # Sin respuestas exitosas no hay latencias ni consultas: se muestra un guion
+                celda = lambda clave: '-' if resultado[clave] is None else resultado[clave]
+                self.stdout.write(
+                    f"{nombre:<30}{resultado['peticiones_por_segundo']:>9}{celda('p50_ms'):>9}"
+                    f"{celda('p95_ms'):>9}{celda('p99_ms'):>9}{celda('consultas_promedio'):>11}"
+                    f"{resultado['rechazadas']:>7}{resultado['errores']:>9}"
+                )
+        return resultados
@@ -0,0 +1,60 @@
+import csv
+import datetime
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from ReservaSystemApp.models import TipoVisita
+from ReservaSystemApp.pronostico import pronosticar_ocupacion, guardar_pronostico
+
+
+class Command(BaseCommand):
+    help = 'Proyecta la ocupación final de los horarios futuros y la guarda para el panel de monitoreo'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', type=datetime.date.fromisoformat, help='Primer día (AAAA-MM-DD); por defecto hoy')
+        parser.add_argument('--hasta', type=datetime.date.fromisoformat, help='Último día (AAAA-MM-DD); por defecto el fin de la ventana publicada')
+        parser.add_argument('--csv', help='Archivo donde escribir el pronóstico por horario y tipo de visita, para planificar capacidad')
+
+    def handle(self, *args, **options):
+        if (options['desde'] is None) != (options['hasta'] is None):
+            raise CommandError('--desde y --hasta se indican juntos')
+        if options['desde'] and options['desde'] > options['hasta']:
+            raise CommandError('--desde debe ser anterior o igual a --hasta')
+
+        inicio = time.perf_counter()
+        pronostico = pronosticar_ocupacion(options['desde'], options['hasta'])
+        duracion = time.perf_counter() - inicio
+        guardar_pronostico(pronostico)
+
+        if options['csv']:
+            self.escribir_csv(options['csv'], pronostico)
+
+        umbral = settings.ALERTAS_UMBRAL_HORARIO
+        en_riesgo = sum(1 for horario in pronostico if horario['porcentaje'] >= umbral)
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(pronostico)} horarios pronosticados en {duracion:.2f} s; '
+            f'{en_riesgo} con ocupación proyectada de {umbral}% o más.'
+        ))
+
+    def escribir_csv(self, ruta, pronostico):
+        nombres = dict(TipoVisita.objects.values_list('id', 'nombre'))
+        tipos = sorted({tipo for horario in pronostico for tipo in horario['por_tipo']}, key=lambda tipo: (tipo is None, tipo or 0))
+
+        with open(ruta, 'w', newline='', encoding='utf-8') as archivo:
+            escritor = csv.writer(archivo)
+            escritor.writerow([
+                'fecha', 'horaInicio', 'horaFin', 'capacidadMaxima', 'reservados', 'demanda', 'porcentaje',
+                *[nombres.get(tipo, 'Sin tipo') for tipo in tipos]
+            ])
+            for horario in pronostico:
+                escritor.writerow([
+                    horario['fecha'].isoformat(),
+                    horario['horaInicio'].strftime('%H:%M'),
+                    horario['horaFin'].strftime('%H:%M'),
+                    horario['capacidadMaxima'],
+                    horario['reservados'],
+                    horario['demanda'],
+                    horario['porcentaje'],
+                    *[horario['por_tipo'].get(tipo, 0) for tipo in tipos]
+                ])
@@ -0,0 +1,78 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from ReservaSystemApp.models import OcupacionDiaria, CapacidadDiaria
+from ReservaSystemApp.ocupacion import ocupacion_desde_reservas, capacidad_desde_disponibilidad
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el resumen diario de ocupación y capacidad desde las tablas de reservas y disponibilidad'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help='Fecha inicial (AAAA-MM-DD)')
+        parser.add_argument('--hasta', help='Fecha final (AAAA-MM-DD)')
+        parser.add_argument(
+            '--solo-verificar',
+            action='store_true',
+            help='Compara el resumen con las tablas originales sin modificarlo'
+        )
+
+    def handle(self, *args, **options):
+        desde, hasta = options['desde'], options['hasta']
+
+        if not options['solo_verificar']:
+            self.reconstruir(desde, hasta)
+
+        diferencias = self.verificar(desde, hasta)
+        if diferencias:
+            for diferencia in diferencias:
+                self.stderr.write(diferencia)
+            raise CommandError(f'El resumen no coincide con las tablas originales ({len(diferencias)} diferencias).')
+
+        self.stdout.write(self.style.SUCCESS('El resumen de ocupación coincide con las reservas.'))
+
+    def filtrar(self, queryset, desde, hasta):
+        if desde:
+            queryset = queryset.filter(fecha__gte=desde)
+        if hasta:
+            queryset = queryset.filter(fecha__lte=hasta)
+        return queryset
+
+    @transaction.atomic
+    def reconstruir(self, desde, hasta):
+        ocupacion = ocupacion_desde_reservas(desde, hasta)
+        capacidad = capacidad_desde_disponibilidad(desde, hasta)
+
+        self.filtrar(OcupacionDiaria.objects.all(), desde, hasta).delete()
+        self.filtrar(CapacidadDiaria.objects.all(), desde, hasta).delete()
+
+        OcupacionDiaria.objects.bulk_create([
+            OcupacionDiaria(fecha=fecha, tipoVisita_id=tipo_visita_id, totalReservas=reservas, totalVisitantes=visitantes)
+            for (fecha, tipo_visita_id), (reservas, visitantes) in ocupacion.items()
+        ], batch_size=1000)
+        CapacidadDiaria.objects.bulk_create([
+            CapacidadDiaria(fecha=fecha, capacidadMaxima=capacidad_maxima)
+            for fecha, capacidad_maxima in capacidad.items()
+        ], batch_size=1000)
+
+        self.stdout.write(f'{len(ocupacion)} filas de ocupación y {len(capacidad)} días de capacidad reconstruidos.')
+
+    def verificar(self, desde, hasta):
+        diferencias = []
+
+        esperado = ocupacion_desde_reservas(desde, hasta)
+        actual = {
+            (fila.fecha, fila.tipoVisita_id): (fila.totalReservas, fila.totalVisitantes)
+            for fila in self.filtrar(OcupacionDiaria.objects.all(), desde, hasta)
+            if fila.totalReservas or fila.totalVisitantes
+        }
+        for clave in sorted(set(esperado) | set(actual), key=str):
+            if esperado.get(clave, (0, 0)) != actual.get(clave, (0, 0)):
+                diferencias.append(f'Ocupación {clave}: esperado {esperado.get(clave, (0, 0))}, resumen {actual.get(clave, (0, 0))}')
+
+        esperado = capacidad_desde_disponibilidad(desde, hasta)
+        actual = dict(self.filtrar(CapacidadDiaria.objects.all(), desde, hasta).values_list('fecha', 'capacidadMaxima'))
+        for fecha in sorted(set(esperado) | set(actual)):
+            if esperado.get(fecha) != actual.get(fecha):
+                diferencias.append(f'Capacidad {fecha}: esperado {esperado.get(fecha)}, resumen {actual.get(fecha)}')
+
+        return diferencias
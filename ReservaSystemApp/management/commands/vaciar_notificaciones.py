@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand, CommandError
+from ReservaSystemApp.notificaciones import vaciar_outbox
+
+
+class Command(BaseCommand):
+    # El buffer en memoria es de cada worker y se vacía al terminar sus peticiones y al cerrar:
+    # este proceso solo puede cargar lo que los workers dejaron en el directorio outbox
+    help = 'Escribe en la base de datos las notificaciones pendientes en el directorio outbox'
+
+    def handle(self, *args, **options):
+        try:
+            en_outbox = vaciar_outbox()
+        except Exception as e:
+            raise CommandError(f'No se pudo vaciar el outbox; los archivos pendientes se reintentan en la próxima ejecución: {e}')
+        self.stdout.write(self.style.SUCCESS(f'{en_outbox} notificaciones escritas desde el outbox.'))
@@ -0,0 +1,31 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+from ReservaSystemApp.vencimiento import vencer_reservas
+
+
+class Command(BaseCommand):
+    help = 'Marca como vencidas las reservas activas de horarios ya pasados, en lotes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hasta', type=datetime.date.fromisoformat, help='Vence horarios anteriores a esta fecha (por defecto hoy)')
+        parser.add_argument('--lote', type=int, default=500, help='Reservas por UPDATE')
+        parser.add_argument('--pausa', type=float, default=0, help='Segundos de espera entre lotes')
+
+    def handle(self, *args, **options):
+        total = 0
+        inicio = time.perf_counter()
+
+        for fecha, vencidas in vencer_reservas(options['hasta'], options['lote']):
+            total += vencidas
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{fecha}: {vencidas} reservas vencidas')
+            if options['pausa']:
+                time.sleep(options['pausa'])
+
+        duracion = time.perf_counter() - inicio
+        velocidad = total / duracion if duracion else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} reservas marcadas como vencidas en {duracion:.2f} s ({velocidad:.0f} reservas/s).'
+        ))
@@ -0,0 +1,248 @@
+import bisect
+import heapq
+import logging
+import threading
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('ReservaSystemApp.metricas')
+
+
+class MedicionSQL:
+    """
+    execute_wrapper que cuenta las consultas de una petición, su tiempo y las
+    filas que informa el driver (rowcount: MySQL lo entrega también para SELECT,
+    SQLite solo para escrituras, por eso con SQLite no se exportan). Si hay
+    registro de peticiones lentas, guarda además las METRICAS_SQL_LENTO_MAX
+    sentencias más lentas.
+    """
+
+    def __init__(self, guardar_sql):
+        self.consultas = 0
+        self.duracion = 0.0
+        self.filas = 0
+        self.sentencias = [] if guardar_sql else None
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracion = time.perf_counter() - inicio
+            self.consultas += 1
+            self.duracion += duracion
+            filas = getattr(context['cursor'], 'rowcount', -1)
+            if filas and filas > 0:
+                self.filas += filas
+            if self.sentencias is not None:
+                if len(self.sentencias) < settings.METRICAS_SQL_LENTO_MAX:
+                    heapq.heappush(self.sentencias, (duracion, sql))
+                else:
+                    heapq.heappushpop(self.sentencias, (duracion, sql))
+
+
+class MetricasVista:
+    def __init__(self, limites):
+        self.buckets = [0] * (len(limites) + 1)
+        self.peticiones = 0
+        self.duracion = 0.0
+        self.consultas = 0
+        self.duracion_sql = 0.0
+        self.filas = 0
+
+
+class RegistroMetricas:
+    """
+    Acumula por nombre de ruta un histograma de latencia y los totales de SQL.
+    Los valores son de este proceso: con varios workers, Prometheus los
+    consulta por separado y los suma.
+    """
+
+    def __init__(self, limites):
+        self.limites = sorted(limites)
+        self.lock = threading.Lock()
+        self.vistas = {}
+
+    def observar(self, vista, duracion, medicion):
+        with self.lock:
+            metricas = self.vistas.get(vista)
+            if metricas is None:
+                metricas = self.vistas[vista] = MetricasVista(self.limites)
+            metricas.buckets[bisect.bisect_left(self.limites, duracion)] += 1
+            metricas.peticiones += 1
+            metricas.duracion += duracion
+            metricas.consultas += medicion.consultas
+            metricas.duracion_sql += medicion.duracion
+            metricas.filas += medicion.filas
+
+    def reiniciar(self):
+        with self.lock:
+            self.vistas = {}
+
+    def exportar(self):
+        # Formato de texto de Prometheus (version 0.0.4)
+        with self.lock:
+            vistas = sorted(self.vistas.items())
+            lineas = [
+                '# HELP sgra_peticion_duracion_segundos Latencia de las peticiones por ruta.',
+                '# TYPE sgra_peticion_duracion_segundos histogram',
+            ]
+            for vista, metricas in vistas:
+                etiqueta = escapar_etiqueta(vista)
+                acumulado = 0
+                for limite, cantidad in zip(self.limites + [None], metricas.buckets):
+                    acumulado += cantidad
+                    le = '+Inf' if limite is None else repr(limite)
+                    lineas.append(f'sgra_peticion_duracion_segundos_bucket{{vista="{etiqueta}",le="{le}"}} {acumulado}')
+                lineas.append(f'sgra_peticion_duracion_segundos_sum{{vista="{etiqueta}"}} {metricas.duracion}')
+                lineas.append(f'sgra_peticion_duracion_segundos_count{{vista="{etiqueta}"}} {metricas.peticiones}')
+
+            contadores = [
+                ('sgra_sql_consultas_total', 'consultas', 'Consultas SQL ejecutadas por ruta.'),
+                ('sgra_sql_duracion_segundos_total', 'duracion_sql', 'Tiempo en consultas SQL por ruta.'),
+            ]
+            if informa_filas_leidas():
+                contadores.append(('sgra_sql_filas_total', 'filas', 'Filas informadas por el driver por ruta.'))
+            for nombre, atributo, descripcion in contadores:
+                lineas.append(f'# HELP {nombre} {descripcion}')
+                lineas.append(f'# TYPE {nombre} counter')
+                for vista, metricas in vistas:
+                    lineas.append(f'{nombre}{{vista="{escapar_etiqueta(vista)}"}} {getattr(metricas, atributo)}')
+        return '\n'.join(lineas) + '\n'
+
+
+def informa_filas_leidas():
+    # Con SQLite el contador de filas omitiría todas las lecturas: no se publica
+    return all(connections[alias].vendor != 'sqlite' for alias in connections)
+
+def escapar_etiqueta(valor):
+    return valor.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registro_metricas = RegistroMetricas(settings.METRICAS_LIMITES_SEGUNDOS)
+
+
+class MetricasMiddleware:
+    """
+    Mide cada petición con un execute_wrapper en todas las conexiones: no
+    depende de DEBUG ni guarda las consultas salvo que se registren las peticiones lentas.
+    Debe ir primero en MIDDLEWARE para incluir el trabajo de los demás middleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        medicion = MedicionSQL(guardar_sql=settings.METRICAS_UMBRAL_LENTO_MS is not None)
+        inicio = time.perf_counter()
+        with ExitStack() as pila:
+            envolver_conexiones(pila, medicion)
+            response = self.get_response(request)
+        return terminar_medicion(request, response, inicio, medicion)
+
+    async def __acall__(self, request):
+        # Las conexiones son locales a cada hilo y el ORM asíncrono consulta desde
+        # el hilo síncrono de la petición (ThreadSensitiveContext de ASGIHandler):
+        # los wrappers se instalan y se retiran en ese hilo
+        medicion = MedicionSQL(guardar_sql=settings.METRICAS_UMBRAL_LENTO_MS is not None)
+        pila = ExitStack()
+        inicio = time.perf_counter()
+        await sync_to_async(envolver_conexiones)(pila, medicion)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(pila.close)()
+        return terminar_medicion(request, response, inicio, medicion)
+
+
+class MedicionDeFlujo:
+    """
+    Contenido de una respuesta en streaming (como exportarReservas), que consulta
+    mientras se envía: cada fragmento se produce con los wrappers instalados en
+    el hilo que consulta, y la petición se registra al cerrar la respuesta, con
+    la duración hasta el último fragmento. StreamingHttpResponse llama a close
+    con contenido síncrono o asíncrono.
+    """
+
+    def __init__(self, contenido, request, inicio, medicion):
+        self.contenido = contenido
+        self.request = request
+        self.inicio = inicio
+        self.medicion = medicion
+        self.registrada = False
+
+    def close(self):
+        if not self.registrada:
+            self.registrada = True
+            registrar_medicion(self.request, time.perf_counter() - self.inicio, self.medicion)
+
+
+class FlujoMedido(MedicionDeFlujo):
+    def __iter__(self):
+        self.contenido = iter(self.contenido)
+        return self
+
+    def __next__(self):
+        with ExitStack() as pila:
+            envolver_conexiones(pila, self.medicion)
+            return next(self.contenido)
+
+
+class FlujoMedidoAsincrono(MedicionDeFlujo):
+    # El ORM asíncrono consulta en el hilo síncrono de la petición: ahí se instalan los wrappers
+    def __aiter__(self):
+        self.contenido = aiter(self.contenido)
+        return self
+
+    async def __anext__(self):
+        pila = ExitStack()
+        await sync_to_async(envolver_conexiones)(pila, self.medicion)
+        try:
+            return await anext(self.contenido)
+        finally:
+            await sync_to_async(pila.close)()
+
+
+def terminar_medicion(request, response, inicio, medicion):
+    if response.streaming:
+        flujo = FlujoMedidoAsincrono if response.is_async else FlujoMedido
+        response.streaming_content = flujo(response.streaming_content, request, inicio, medicion)
+    else:
+        registrar_medicion(request, time.perf_counter() - inicio, medicion)
+    return response
+
+
+def envolver_conexiones(pila, medicion):
+    for conexion in connections.all():
+        pila.enter_context(conexion.execute_wrapper(medicion))
+
+
+def registrar_medicion(request, duracion, medicion):
+    match = request.resolver_match
+    vista = match.view_name if match else 'sin_ruta'
+    registro_metricas.observar(vista, duracion, medicion)
+
+    umbral = settings.METRICAS_UMBRAL_LENTO_MS
+    if umbral is not None and duracion * 1000 >= umbral:
+        registrar_peticion_lenta(request, vista, duracion, medicion)
+
+
+def registrar_peticion_lenta(request, vista, duracion, medicion):
+    sentencias = sorted(medicion.sentencias, reverse=True)
+    logger.warning(
+        'Petición lenta %s %s (%s): %.0f ms, %d consultas en %.0f ms\n%s',
+        request.method, request.path, vista, duracion * 1000, medicion.consultas, medicion.duracion * 1000,
+        '\n'.join(f'  {tiempo * 1000:.1f} ms  {sql}' for tiempo, sql in sentencias)
+    )
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ReservaSystemApp', '0002_remove_acompañante_edad_remove_visitante_edad_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CapacidadDiaria',
+            fields=[
+                ('fecha', models.DateField(primary_key=True, serialize=False)),
+                ('capacidadMaxima', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'capacidadDiaria',
+            },
+        ),
+        migrations.CreateModel(
+            name='OcupacionDiaria',
+            fields=[
+                ('idOcupacion', models.AutoField(primary_key=True, serialize=False)),
+                ('fecha', models.DateField()),
+                ('totalReservas', models.IntegerField(default=0)),
+                ('totalVisitantes', models.IntegerField(default=0)),
+                ('tipoVisita', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ocupaciones', to='ReservaSystemApp.tipovisita')),
+            ],
+            options={
+                'db_table': 'ocupacionDiaria',
+                'unique_together': {('fecha', 'tipoVisita')},
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ReservaSystemApp', '0003_ocupaciondiaria_capacidaddiaria'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='acompañante',
+            index=models.Index(fields=['rutVisitante', 'idAcompañante'], name='acompanante_visitante_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(fields=['estadoReserva', '-idReserva'], name='reserva_estado_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(fields=['disponibilidad', 'estadoReserva'], name='reserva_disp_estado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visitante',
+            index=models.Index(fields=['rut'], name='visitante_rut_idx'),
+        ),
+    ]
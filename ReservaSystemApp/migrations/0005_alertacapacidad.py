@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:54
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ReservaSystemApp', '0004_indices_reservas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertaCapacidad',
+            fields=[
+                ('idAlerta', models.AutoField(primary_key=True, serialize=False)),
+                ('alcance', models.CharField(choices=[('HORARIO', 'Horario'), ('DIA', 'Día')], max_length=10)),
+                ('referencia', models.CharField(max_length=30)),
+                ('umbral', models.IntegerField()),
+                ('porcentaje', models.IntegerField()),
+                ('fechaCreacion', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'db_table': 'alertaCapacidad',
+                'unique_together': {('alcance', 'referencia', 'umbral')},
+            },
+        ),
+    ]
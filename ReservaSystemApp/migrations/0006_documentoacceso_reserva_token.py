@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ReservaSystemApp', '0005_alertacapacidad'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentoacceso',
+            name='reserva',
+            field=models.OneToOneField(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='documento', to='ReservaSystemApp.reserva'),
+        ),
+        migrations.AddField(
+            model_name='documentoacceso',
+            name='token',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
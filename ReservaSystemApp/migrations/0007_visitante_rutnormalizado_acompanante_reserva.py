@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ReservaSystemApp', '0006_documentoacceso_reserva_token'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='acompañante',
+            name='reserva',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='acompanantes', to='ReservaSystemApp.reserva'),
+        ),
+        migrations.AddField(
+            model_name='visitante',
+            name='rutNormalizado',
+            field=models.CharField(max_length=12, null=True, unique=True),
+        ),
+    ]
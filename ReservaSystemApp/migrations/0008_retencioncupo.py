@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ReservaSystemApp', '0007_visitante_rutnormalizado_acompanante_reserva'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RetencionCupo',
+            fields=[
+                ('idRetencion', models.AutoField(primary_key=True, serialize=False)),
+                ('token', models.CharField(max_length=32, unique=True)),
+                ('cantidadVisitantes', models.IntegerField()),
+                ('expira', models.DateTimeField()),
+                ('disponibilidad', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='retenciones', to='ReservaSystemApp.disponibilidadparque')),
+            ],
+            options={
+                'db_table': 'retencionCupo',
+                'indexes': [models.Index(fields=['expira'], name='retencion_expira_idx')],
+            },
+        ),
+    ]
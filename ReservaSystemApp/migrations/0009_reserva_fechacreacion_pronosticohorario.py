@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:56
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ReservaSystemApp', '0008_retencioncupo'),
+    ]
+
+    operations = [
+        # Sin default al agregar la columna: las reservas existentes quedan en NULL
+        # en vez de recibir la fecha de la migración
+        migrations.AddField(
+            model_name='reserva',
+            name='fechaCreacion',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='reserva',
+            name='fechaCreacion',
+            field=models.DateTimeField(default=django.utils.timezone.now, null=True),
+        ),
+        migrations.CreateModel(
+            name='PronosticoHorario',
+            fields=[
+                ('disponibilidad', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='pronostico', serialize=False, to='ReservaSystemApp.disponibilidadparque')),
+                ('reservados', models.IntegerField()),
+                ('demanda', models.FloatField()),
+                ('porcentaje', models.IntegerField()),
+                ('fechaCalculo', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'db_table': 'pronosticoHorario',
+            },
+        ),
+    ]
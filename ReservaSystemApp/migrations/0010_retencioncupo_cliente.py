@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ReservaSystemApp', '0009_reserva_fechacreacion_pronosticohorario'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='retencioncupo',
+            name='cliente',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=32),
+        ),
+    ]
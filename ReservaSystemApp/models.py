@@ -49,6 +49,13 @@ class DocumentoAcceso(models.Model):
     codigoQR = models.ImageField()
     fechaGeneracion = models.DateField()
     rutVisitante = models.BooleanField()
+    reserva = models.OneToOneField(
+        'Reserva',
+        on_delete=models.CASCADE,
+        related_name='documento',
+        null=True,
+    )
+    token = models.CharField(max_length=255, blank=True)
 
     def __str__(self):
         return f"Documento {self.idDocumento} - Fecha: {self.fechaGeneracion}"
@@ -59,6 +66,7 @@ class DocumentoAcceso(models.Model):
 class Visitante(models.Model):
     idVisitante = models.AutoField(primary_key=True)
     rut = models.CharField(max_length=11) 
+    rutNormalizado = models.CharField(max_length=12, unique=True, null=True)
     nombre = models.CharField(max_length=30)
     apellido = models.CharField(max_length=30)
     telefono = models.CharField(max_length=15)
@@ -70,6 +78,9 @@ class Visitante(models.Model):
     
     class Meta:
         db_table = 'visitante'
+        indexes = [
+            models.Index(fields=['rut'], name='visitante_rut_idx'),
+        ]
 
 class SistemaNotificaciones(models.Model):
     idNotificacion = models.AutoField(primary_key=True)
@@ -97,6 +108,12 @@ class Acompañante(models.Model):
     idAcompañante = models.AutoField(primary_key=True)
     rut = models.CharField(max_length=11)
     rutVisitante = models.ForeignKey(Visitante, on_delete=models.CASCADE)
+    reserva = models.ForeignKey(
+        'Reserva',
+        on_delete=models.CASCADE,
+        related_name='acompanantes',
+        null=True,
+    )
     nombre = models.CharField(max_length=60)
     fecha_nacimiento = models.DateField(null=True)
 
@@ -105,6 +122,9 @@ class Acompañante(models.Model):
     
     class Meta:
         db_table = 'acompañante'
+        indexes = [
+            models.Index(fields=['rutVisitante', 'idAcompañante'], name='acompanante_visitante_idx'),
+        ]
 
 class Reserva(models.Model):
     class Estado(models.TextChoices):
@@ -133,12 +153,45 @@ class Reserva(models.Model):
         null=True,
     )
     estadoReserva = models.CharField(max_length=30, choices=Estado.choices, default=Estado.ACTIVO)
+    # Curvas de llenado del pronóstico; las reservas anteriores a esta columna quedan sin fecha
+    fechaCreacion = models.DateTimeField(default=timezone.now, null=True)
 
     def __str__(self):
         return f"Reserva {self.idReserva} - {self.visitante.nombre}"
 
     class Meta:
         db_table = 'reserva'
+        indexes = [
+            # validarReserva: filtro por estado ordenado por idReserva descendente
+            models.Index(fields=['estadoReserva', '-idReserva'], name='reserva_estado_id_idx'),
+            # filtros por fecha del horario (validarReserva, resumen de ocupación) combinados con el estado
+            models.Index(fields=['disponibilidad', 'estadoReserva'], name='reserva_disp_estado_idx'),
+        ]
+
+class RetencionCupo(models.Model):
+    # Cupos apartados mientras se completa el formulario: ya están sumados en
+    # DisponibilidadParque.capacidadActual hasta que se confirman o se liberan
+    idRetencion = models.AutoField(primary_key=True)
+    token = models.CharField(max_length=32, unique=True)
+    disponibilidad = models.ForeignKey(
+        DisponibilidadParque,
+        on_delete=models.CASCADE,
+        related_name='retenciones'
+    )
+    cantidadVisitantes = models.IntegerField()
+    expira = models.DateTimeField()
+    # Huella de la IP que pidió la retención, para limitar los cupos apartados por cliente
+    cliente = models.CharField(max_length=32, blank=True, default='', db_index=True)
+
+    def __str__(self):
+        return f"Retención {self.idRetencion} - {self.cantidadVisitantes} cupos hasta {self.expira:%Y-%m-%d %H:%M}"
+
+    class Meta:
+        db_table = 'retencionCupo'
+        indexes = [
+            # liberación de retenciones vencidas
+            models.Index(fields=['expira'], name='retencion_expira_idx'),
+        ]
 
 class RegistroCambioReserva(models.Model):
     idRegistro = models.AutoField(primary_key=True)
@@ -153,3 +206,70 @@ class RegistroCambioReserva(models.Model):
     class Meta:
         db_table = 'registroCambioReserva'
 
+
+class OcupacionDiaria(models.Model):
+    idOcupacion = models.AutoField(primary_key=True)
+    fecha = models.DateField()
+    tipoVisita = models.ForeignKey(
+        TipoVisita,
+        on_delete=models.CASCADE,
+        related_name='ocupaciones',
+        null=True,
+    )
+    totalReservas = models.IntegerField(default=0)
+    totalVisitantes = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"Ocupación {self.fecha} - {self.tipoVisita}: {self.totalVisitantes} visitantes"
+
+    class Meta:
+        db_table = 'ocupacionDiaria'
+        unique_together = ['fecha', 'tipoVisita']
+
+class CapacidadDiaria(models.Model):
+    fecha = models.DateField(primary_key=True)
+    capacidadMaxima = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"Capacidad {self.fecha}: {self.capacidadMaxima}"
+
+    class Meta:
+        db_table = 'capacidadDiaria'
+
+class PronosticoHorario(models.Model):
+    # Ocupación final proyectada por manage.py pronosticar_ocupacion (ver ReservaSystemApp.pronostico)
+    disponibilidad = models.OneToOneField(
+        DisponibilidadParque,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='pronostico'
+    )
+    reservados = models.IntegerField()
+    demanda = models.FloatField()
+    porcentaje = models.IntegerField()
+    fechaCalculo = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Pronóstico {self.disponibilidad}: {self.porcentaje}%"
+
+    class Meta:
+        db_table = 'pronosticoHorario'
+
+class AlertaCapacidad(models.Model):
+    class Alcance(models.TextChoices):
+        HORARIO = 'HORARIO', 'Horario'
+        DIA = 'DIA', 'Día'
+
+    idAlerta = models.AutoField(primary_key=True)
+    alcance = models.CharField(max_length=10, choices=Alcance.choices)
+    referencia = models.CharField(max_length=30)
+    umbral = models.IntegerField()
+    porcentaje = models.IntegerField()
+    fechaCreacion = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Alerta {self.alcance} {self.referencia} al {self.porcentaje}%"
+
+    class Meta:
+        db_table = 'alertaCapacidad'
+        unique_together = ['alcance', 'referencia', 'umbral']
@@ -0,0 +1,147 @@
+import atexit
+import datetime
+import json
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import transaction
+from django.utils import timezone
+from ReservaSystemApp.models import SistemaNotificaciones
+
+
+class BufferNotificaciones:
+    """
+    Acumula notificaciones en memoria y las escribe con un solo bulk_create.
+
+    El vaciado ocurre al terminar una petición (después de enviar la respuesta)
+    cuando el lote está lleno o es demasiado antiguo, y al cerrar el proceso.
+    Si la base de datos no acepta el lote, se guarda en el directorio outbox
+    para que el comando vaciar_notificaciones lo cargue más tarde.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pendientes = []
+        self.primera = None
+
+    def agregar(self, tipo, mensaje):
+        with self.lock:
+            if not self.pendientes:
+                self.primera = time.monotonic()
+            self.pendientes.append({
+                'fechaEnvio': timezone.now().date().isoformat(),
+                'tipo': tipo,
+                'mensaje': mensaje,
+            })
+
+    def debe_vaciarse(self):
+        with self.lock:
+            if not self.pendientes:
+                return False
+            return (
+                len(self.pendientes) >= settings.NOTIFICACIONES_TAMANO_LOTE
+                or time.monotonic() - self.primera >= settings.NOTIFICACIONES_INTERVALO
+            )
+
+    def vaciar(self):
+        with self.lock:
+            lote, self.pendientes = self.pendientes, []
+        if not lote:
+            return 0
+
+        try:
+            escribir_notificaciones(lote)
+        except Exception as e:
+            print(f"Error al escribir notificaciones, se guardan en el outbox: {e}")
+            guardar_en_outbox(lote)
+        return len(lote)
+
+
+def escribir_notificaciones(lote):
+    SistemaNotificaciones.objects.bulk_create([
+        SistemaNotificaciones(
+            fechaEnvio=datetime.date.fromisoformat(datos['fechaEnvio']),
+            tipo=datos['tipo'],
+            mensaje=datos['mensaje']
+        )
+        for datos in lote
+    ], batch_size=settings.NOTIFICACIONES_TAMANO_LOTE)
+
+
+def guardar_en_outbox(lote):
+    directorio = Path(settings.NOTIFICACIONES_OUTBOX_DIR)
+    directorio.mkdir(parents=True, exist_ok=True)
+    with open(directorio / f'notificaciones-{os.getpid()}.jsonl', 'a', encoding='utf-8') as archivo:
+        for datos in lote:
+            archivo.write(json.dumps(datos, ensure_ascii=False) + '\n')
+
+
+def reclamar(archivo):
+    """
+    Renombra el archivo a un nombre .procesando único y devuelve la nueva ruta,
+    o None si otro vaciado lo reclamó antes. Un proceso activo abre un .jsonl
+    nuevo y un .procesando de un intento fallido nunca se sobrescribe.
+    """
+    base = archivo.name.split('.', 1)[0].split('~', 1)[0]
+    en_proceso = archivo.with_name(f'{base}~{time.time_ns()}-{uuid.uuid4().hex[:8]}.procesando')
+    try:
+        os.rename(archivo, en_proceso)
+    except FileNotFoundError:
+        return None
+    return en_proceso
+
+
+def vaciar_outbox():
+    """
+    Escribe en la base las notificaciones del outbox y devuelve cuántas escribió.
+    Primero reintenta los .procesando que dejó un vaciado fallido. Si un archivo
+    no se puede escribir se conserva para el próximo intento y, al terminar con
+    los demás, se lanza el primer error.
+    """
+    directorio = Path(settings.NOTIFICACIONES_OUTBOX_DIR)
+    if not directorio.exists():
+        return 0
+
+    pendientes = sorted(directorio.glob('notificaciones-*.procesando')) + sorted(directorio.glob('notificaciones-*.jsonl'))
+    total = 0
+    errores = []
+    for archivo in pendientes:
+        en_proceso = reclamar(archivo)
+        if en_proceso is None:
+            continue
+        try:
+            with open(en_proceso, encoding='utf-8') as contenido:
+                lote = [json.loads(linea) for linea in contenido if linea.strip()]
+            with transaction.atomic():
+                escribir_notificaciones(lote)
+        except Exception as e:
+            errores.append(e)
+            continue
+        en_proceso.unlink()
+        total += len(lote)
+
+    if errores:
+        raise errores[0]
+    return total
+
+
+buffer_notificaciones = BufferNotificaciones()
+
+
+def encolar_notificacion(tipo, mensaje):
+    # Solo se encola si la transacción de la petición se confirma
+    transaction.on_commit(lambda: buffer_notificaciones.agregar(tipo, mensaje))
+
+
+def vaciar_al_terminar_peticion(sender, **kwargs):
+    if buffer_notificaciones.debe_vaciarse():
+        buffer_notificaciones.vaciar()
+
+
+request_finished.connect(vaciar_al_terminar_peticion, dispatch_uid='vaciar_notificaciones')
+atexit.register(buffer_notificaciones.vaciar)
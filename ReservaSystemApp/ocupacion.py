@@ -0,0 +1,119 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Sum, Count, F
+from ReservaSystemApp.models import (
+    DisponibilidadParque, Reserva, OcupacionDiaria, CapacidadDiaria
+)
+
+# Solo estos estados ocupan capacidad en el panel de monitoreo
+ESTADOS_OCUPACION = [Reserva.Estado.ACTIVO, Reserva.Estado.UTILIZADO]
+
+def registrar_ocupacion(fecha, tipo_visita_id, reservas, visitantes):
+    if not reservas and not visitantes:
+        return
+
+    filas = OcupacionDiaria.objects.filter(fecha=fecha, tipoVisita_id=tipo_visita_id)
+    incremento = {
+        'totalReservas': F('totalReservas') + reservas,
+        'totalVisitantes': F('totalVisitantes') + visitantes,
+    }
+
+    if filas.update(**incremento):
+        return
+
+    try:
+        with transaction.atomic():
+            OcupacionDiaria.objects.create(
+                fecha=fecha,
+                tipoVisita_id=tipo_visita_id,
+                totalReservas=reservas,
+                totalVisitantes=visitantes
+            )
+    except IntegrityError:
+        # Otra transacción creó la fila entre el UPDATE y el INSERT
+        filas.update(**incremento)
+
+def contribucion_reserva(fecha, tipo_visita_id, estado, cantidad_visitantes):
+    # Lo que una reserva aporta al resumen: (fecha, tipo, reservas, visitantes)
+    if fecha is None or estado not in ESTADOS_OCUPACION:
+        return None
+    return (fecha, tipo_visita_id, 1, cantidad_visitantes)
+
+def aplicar_cambio_contribucion(anterior, nueva):
+    if anterior == nueva:
+        return
+
+    if anterior:
+        fecha, tipo_visita_id, reservas, visitantes = anterior
+        registrar_ocupacion(fecha, tipo_visita_id, -reservas, -visitantes)
+
+    if nueva:
+        fecha, tipo_visita_id, reservas, visitantes = nueva
+        registrar_ocupacion(fecha, tipo_visita_id, reservas, visitantes)
+
+def contribucion_guardada(reserva_id):
+    fila = Reserva.objects.filter(idReserva=reserva_id).values(
+        'disponibilidad__fecha', 'tipoVisita_id', 'estadoReserva', 'cantidadVisitantes'
+    ).first()
+
+    if fila is None:
+        return None
+    return contribucion_reserva(
+        fila['disponibilidad__fecha'], fila['tipoVisita_id'],
+        fila['estadoReserva'], fila['cantidadVisitantes']
+    )
+
+def registrar_cambio_estado(reservas, estado_anterior, estado_nuevo):
+    # Para UPDATE masivos de estadoReserva, que no disparan señales: recibe el
+    # queryset de las reservas afectadas antes de actualizarlo y ajusta el resumen por grupo
+    ocupaba_antes = estado_anterior in ESTADOS_OCUPACION
+    ocupa_despues = estado_nuevo in ESTADOS_OCUPACION
+    if ocupaba_antes == ocupa_despues:
+        return
+
+    signo = 1 if ocupa_despues else -1
+    grupos = reservas.filter(disponibilidad__isnull=False).values(
+        'disponibilidad__fecha', 'tipoVisita_id'
+    ).annotate(reservas=Count('idReserva'), visitantes=Sum('cantidadVisitantes')).order_by()
+
+    for grupo in grupos:
+        registrar_ocupacion(
+            grupo['disponibilidad__fecha'], grupo['tipoVisita_id'],
+            signo * grupo['reservas'], signo * grupo['visitantes']
+        )
+
+def recalcular_capacidad(*fechas):
+    for fecha in set(fechas):
+        capacidad = DisponibilidadParque.objects.filter(fecha=fecha).aggregate(
+            total=Sum('capacidadMaxima')
+        )['total']
+
+        if capacidad is None:
+            CapacidadDiaria.objects.filter(fecha=fecha).delete()
+        else:
+            CapacidadDiaria.objects.update_or_create(fecha=fecha, defaults={'capacidadMaxima': capacidad})
+
+def ocupacion_desde_reservas(fecha_desde=None, fecha_hasta=None):
+    reservas = Reserva.objects.filter(estadoReserva__in=ESTADOS_OCUPACION, disponibilidad__isnull=False)
+    if fecha_desde:
+        reservas = reservas.filter(disponibilidad__fecha__gte=fecha_desde)
+    if fecha_hasta:
+        reservas = reservas.filter(disponibilidad__fecha__lte=fecha_hasta)
+
+    return {
+        (fila['disponibilidad__fecha'], fila['tipoVisita_id']): (fila['reservas'], fila['visitantes'])
+        for fila in reservas.values('disponibilidad__fecha', 'tipoVisita_id').annotate(
+            reservas=Count('idReserva'), visitantes=Sum('cantidadVisitantes')
+        ).order_by()
+    }
+
+def capacidad_desde_disponibilidad(fecha_desde=None, fecha_hasta=None):
+    disponibilidades = DisponibilidadParque.objects.all()
+    if fecha_desde:
+        disponibilidades = disponibilidades.filter(fecha__gte=fecha_desde)
+    if fecha_hasta:
+        disponibilidades = disponibilidades.filter(fecha__lte=fecha_hasta)
+
+    return {
+        fila['fecha']: fila['capacidad']
+        for fila in disponibilidades.values('fecha').annotate(capacidad=Sum('capacidadMaxima')).order_by()
+    }
@@ -0,0 +1,172 @@
+"""
+Pronóstico de la ocupación final de los horarios futuros.
+
+Cada franja (día de la semana y hora de inicio) y tipo de visita tiene una
+curva de llenado histórica: cuántos visitantes estaban reservados a cada
+anticipación, en días antes de la visita, y con cuántos terminó el horario.
+Un horario futuro se proyecta sumando a lo ya reservado lo que en promedio
+llegó después de esa misma anticipación en su franja (pickup aditivo).
+
+Las reservas se leen con una sola consulta agrupada y las curvas se ajustan
+con operaciones de NumPy sobre arreglos, sin recorrer las reservas en Python.
+Las reservas sin fechaCreacion (anteriores a esa columna) se cuentan como
+reservadas con la máxima anticipación: suman a la ocupación final sin
+inventar llegadas de último momento.
+"""
+
+import datetime
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import CharField, Sum, Value
+from django.db.models.functions import Cast, Coalesce, ExtractHour, ExtractMinute, Substr
+from django.utils import timezone
+from ReservaSystemApp.models import DisponibilidadParque, Reserva, PronosticoHorario
+from ReservaSystemApp.disponibilidad import rango_ventana
+
+def dias(fechas):
+    # Fechas (date o texto AAAA-MM-DD) como datetime64[D]; '' queda como NaT
+    return np.array(fechas, dtype='datetime64[D]')
+
+def leer_horarios(fecha_desde, fecha_hasta):
+    return list(DisponibilidadParque.objects.filter(
+        fecha__gte=fecha_desde,
+        fecha__lte=fecha_hasta
+    ).annotate(
+        minuto=ExtractHour('horaInicio') * 60 + ExtractMinute('horaInicio')
+    ).order_by('id').values_list('id', 'fecha', 'horaInicio', 'horaFin', 'capacidadMaxima', 'minuto'))
+
+def leer_llegadas(fecha_desde, fecha_hasta):
+    # Visitantes por horario, tipo de visita y día en que se reservaron
+    filas = list(Reserva.objects.filter(
+        disponibilidad__fecha__gte=fecha_desde,
+        disponibilidad__fecha__lte=fecha_hasta
+    ).annotate(
+        # Fecha en UTC como texto AAAA-MM-DD ('' si falta): se agrupa por día sin la función
+        # por fila de TruncDate en SQLite, y NumPy convierte el texto sin pasar por date
+        creado=Coalesce(Substr(Cast('fechaCreacion', CharField()), 1, 10), Value(''))
+    ).values_list('disponibilidad_id', 'tipoVisita_id', 'creado').annotate(
+        visitantes=Sum('cantidadVisitantes')
+    ).order_by())
+
+    if not filas:
+        return np.zeros(0, dtype=np.int64), np.zeros(0), dias([]), np.zeros(0)
+    horarios, tipos, creados, visitantes = zip(*filas)
+    # Sin tipo de visita queda como NaN
+    return np.array(horarios), np.array(tipos, dtype=float), dias(creados), np.array(visitantes, dtype=float)
+
+def pronosticar_ocupacion(fecha_desde=None, fecha_hasta=None):
+    """
+    Proyecta la ocupación final de los horarios entre fecha_desde y fecha_hasta
+    (la ventana publicada por defecto). Devuelve un dict por horario, ordenado
+    por fecha y hora, con la demanda proyectada en total y por tipo de visita
+    (None para las reservas sin tipo). La demanda puede superar la capacidad.
+    """
+    hoy = timezone.localdate()
+    if fecha_desde is None:
+        fecha_desde, fecha_hasta = rango_ventana()
+    fecha_desde = max(fecha_desde, hoy)
+    inicio_historia = hoy - datetime.timedelta(days=settings.PRONOSTICO_DIAS_HISTORIA)
+    maxima = settings.PRONOSTICO_DIAS_ANTICIPACION
+
+    horarios = leer_horarios(inicio_historia, fecha_hasta)
+    if not horarios:
+        return []
+    columnas = list(zip(*horarios))
+    ids = np.array(columnas[0])
+    fechas = dias(columnas[1])
+    capacidades = np.array(columnas[4])
+    minutos = np.array(columnas[5])
+
+    # Franja de cada horario: día de la semana (el 1970-01-01 fue jueves) y hora de inicio
+    dia_semana = (fechas.astype(np.int64) + 3) % 7
+    _, franja = np.unique(dia_semana * 1440 + minutos, return_inverse=True)
+    n_franjas = franja.max() + 1
+    historicos = fechas < np.datetime64(hoy)
+    futuros = fechas >= np.datetime64(fecha_desde)
+
+    reserva_horario, reserva_tipo, creado, visitantes = leer_llegadas(inicio_historia, fecha_hasta)
+    tipos, reserva_tipo = np.unique(np.nan_to_num(reserva_tipo, nan=-1), return_inverse=True)
+    n_tipos = len(tipos)
+    # ids viene ordenado: posición de cada horario reservado en los arreglos de horarios
+    reserva_horario = np.searchsorted(ids, reserva_horario)
+
+    # Curvas de llenado: llegadas por grupo (franja, tipo) y anticipación, solo de horarios pasados
+    anticipacion = np.clip((fechas[reserva_horario] - creado).astype(np.int64), 0, maxima)
+    anticipacion[np.isnat(creado)] = maxima
+    grupo = franja[reserva_horario] * n_tipos + reserva_tipo
+    pasadas = historicos[reserva_horario]
+    llegadas = np.zeros((n_franjas * n_tipos, maxima + 1))
+    np.add.at(llegadas, (grupo[pasadas], anticipacion[pasadas]), visitantes[pasadas])
+
+    # Reservados con al menos d días de anticipación: suma acumulada desde la mayor anticipación.
+    # Lo que falta para el total final, promediado por los horarios de la franja, es el pickup
+    reservados = llegadas[:, ::-1].cumsum(axis=1)[:, ::-1]
+    horarios_por_franja = np.repeat(np.bincount(franja[historicos], minlength=n_franjas), n_tipos)[:, None]
+    pickup = np.divide(
+        reservados[:, :1] - reservados, horarios_por_franja,
+        out=np.zeros_like(reservados), where=horarios_por_franja > 0
+    )
+
+    # Reservado hasta hoy en cada horario futuro, por tipo
+    indices = np.flatnonzero(futuros)
+    posicion = np.full(len(ids), -1)
+    posicion[indices] = np.arange(len(indices))
+    actuales = np.zeros((len(indices), n_tipos))
+    vigentes = futuros[reserva_horario]
+    np.add.at(actuales, (posicion[reserva_horario[vigentes]], reserva_tipo[vigentes]), visitantes[vigentes])
+
+    restantes = np.clip((fechas[indices] - np.datetime64(hoy)).astype(np.int64), 0, maxima)
+    grupos_futuros = franja[indices][:, None] * n_tipos + np.arange(n_tipos)
+    demanda = actuales + pickup[grupos_futuros, restantes[:, None]]
+    total = demanda.sum(axis=1)
+    porcentaje = np.divide(
+        total * 100, capacidades[indices],
+        out=np.zeros_like(total), where=capacidades[indices] > 0
+    )
+
+    tipos = [None if tipo < 0 else int(tipo) for tipo in tipos]
+    orden = np.lexsort((minutos[indices], fechas[indices]))
+    demanda, total, porcentaje = demanda.round(1).tolist(), total.tolist(), porcentaje.round().tolist()
+    reservados_actuales = actuales.sum(axis=1).astype(int).tolist()
+    pronostico = []
+    for i in orden.tolist():
+        horario_id, fecha, hora_inicio, hora_fin, capacidad, _ = horarios[indices[i]]
+        pronostico.append({
+            'id': horario_id,
+            'fecha': fecha,
+            'horaInicio': hora_inicio,
+            'horaFin': hora_fin,
+            'capacidadMaxima': capacidad,
+            'reservados': reservados_actuales[i],
+            'demanda': round(total[i], 1),
+            'porcentaje': int(porcentaje[i]),
+            'por_tipo': dict(zip(tipos, demanda[i])),
+        })
+    return pronostico
+
+@transaction.atomic
+def guardar_pronostico(pronostico):
+    # Reemplaza el pronóstico de los horarios recalculados; el panel de monitoreo lo lee de PronosticoHorario
+    ids = [horario['id'] for horario in pronostico]
+    PronosticoHorario.objects.filter(disponibilidad_id__in=ids).delete()
+    PronosticoHorario.objects.bulk_create([
+        PronosticoHorario(
+            disponibilidad_id=horario['id'],
+            reservados=horario['reservados'],
+            demanda=horario['demanda'],
+            porcentaje=horario['porcentaje'],
+        )
+        for horario in pronostico
+    ], batch_size=1000)
+
+def horarios_en_riesgo(umbral, limite=10):
+    # Horarios futuros cuya ocupación proyectada alcanza el umbral, los más llenos primero
+    return PronosticoHorario.objects.filter(
+        disponibilidad__fecha__gte=timezone.localdate(),
+        porcentaje__gte=umbral
+    ).order_by('-porcentaje', 'disponibilidad__fecha', 'disponibilidad__horaInicio').values(
+        'disponibilidad__fecha', 'disponibilidad__horaInicio', 'disponibilidad__horaFin',
+        'disponibilidad__capacidadMaxima', 'reservados', 'demanda', 'porcentaje'
+    )[:limite]
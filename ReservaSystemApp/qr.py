@@ -0,0 +1,11 @@
+# Sin imports de Django: este módulo se carga en los procesos del pool de generación
+import io
+
+import qrcode
+
+
+def generar_png(token):
+    imagen = qrcode.make(token, error_correction=qrcode.constants.ERROR_CORRECT_M, box_size=6, border=2)
+    contenido = io.BytesIO()
+    imagen.save(contenido, format='PNG')
+    return contenido.getvalue()
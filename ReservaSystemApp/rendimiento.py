@@ -0,0 +1,422 @@
+"""
+Pruebas de carga de las rutas de ReservaSystemApp (ver manage.py medir_rendimiento).
+
+Cada escenario es una ruta con sus parámetros; se ejecuta con varios clientes
+concurrentes y se mide la latencia y las consultas SQL de cada petición. Con
+medir() cada cliente es un hilo que pasa por la cadena síncrona de Django (WSGI);
+con medir_asgi() los clientes son corrutinas en un solo bucle de eventos (ASGI).
+"""
+
+import asyncio
+import datetime
+import itertools
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from io import StringIO
+
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from ReservaSystemApp.models import DisponibilidadParque, Visitante, Acompañante, Reserva, TipoVisita
+from ReservaSystemApp.calendario import expandir_plantilla, generar_horarios
+from ReservaSystemApp.disponibilidad import invalidar_disponibilidad
+from ReservaSystemApp.documentos import firmar_token
+from ReservaSystemApp.metricas import MedicionSQL, envolver_conexiones
+from ReservaSystemApp.rut import digito_verificador
+
+TIPOS_VISITA = ['Familiar', 'Colegio', 'Turismo']
+TAMANO_LOTE = 1000
+# Diferencias absolutas que se consideran ruido al comparar ejecuciones
+TOLERANCIA_MS = 5
+TOLERANCIA_CONSULTAS = 0.5
+
+
+def rut(cuerpo):
+    return f'{cuerpo}-{digito_verificador(cuerpo)}'
+
+
+def sembrar_datos(reservas, dias, horarios_por_dia, capacidad, acompanantes=2):
+    """
+    Crea los horarios de los próximos días y las reservas repartidas entre
+    ellos, con bulk_create y el resumen de ocupación reconstruido al final.
+    Devuelve el contexto que usan los escenarios.
+    """
+    if not 1 <= horarios_por_dia <= 16:
+        raise ValueError('horarios_por_dia debe estar entre 1 y 16')
+
+    hoy = timezone.localdate()
+    hasta = hoy + datetime.timedelta(days=dias - 1)
+    for nombre in TIPOS_VISITA:
+        TipoVisita.objects.get_or_create(nombre=nombre, defaults={'descripcion': f'Visita {nombre.lower()}'})
+    tipos = dict(TipoVisita.objects.filter(nombre__in=TIPOS_VISITA).values_list('nombre', 'id'))
+
+    generar_horarios(
+        expandir_plantilla(
+            hoy, hasta, set(range(7)), datetime.time(8), datetime.time(8 + horarios_por_dia),
+            datetime.timedelta(hours=1), capacidad
+        ),
+        hoy, hasta, TAMANO_LOTE
+    )
+    horarios = list(DisponibilidadParque.objects.filter(fecha__gte=hoy, fecha__lte=hasta).order_by('fecha', 'horaInicio'))
+    if reservas * (acompanantes + 1) > len(horarios) * capacidad * 0.8:
+        raise ValueError('Las reservas sembradas superan el 80 % de la capacidad: aumente --capacidad o --dias')
+
+    visitantes = Visitante.objects.bulk_create([
+        Visitante(
+            rut=rut(10000000 + numero), rutNormalizado=rut(10000000 + numero),
+            nombre=f'Visitante {numero}', apellido='Carga', telefono='+56900000000',
+            correo=f'visitante{numero}@ejemplo.com', fecha_nacimiento=datetime.date(1990, 1, 1)
+        )
+        for numero in range(reservas)
+    ], batch_size=TAMANO_LOTE)
+
+    # 70 % activas, 20 % utilizadas y 10 % vencidas, repartidas entre todos los horarios
+    estados = [Reserva.Estado.ACTIVO] * 7 + [Reserva.Estado.UTILIZADO] * 2 + [Reserva.Estado.VENCIDO]
+    nuevas = Reserva.objects.bulk_create([
+        Reserva(
+            visitante=visitante,
+            disponibilidad=horarios[numero % len(horarios)],
+            cantidadVisitantes=acompanantes + 1,
+            tipoVisita_id=tipos[TIPOS_VISITA[numero % len(TIPOS_VISITA)]],
+            estadoReserva=estados[numero % len(estados)]
+        )
+        for numero, visitante in enumerate(visitantes)
+    ], batch_size=TAMANO_LOTE)
+    Acompañante.objects.bulk_create([
+        Acompañante(
+            rut=rut(30000000 + reserva.pk * 10 + i), rutVisitante_id=reserva.visitante_id, reserva=reserva,
+            nombre=f'Acompañante {reserva.pk}.{i}', fecha_nacimiento=datetime.date(2010, 1, 1)
+        )
+        for reserva in nuevas
+        for i in range(acompanantes)
+    ], batch_size=TAMANO_LOTE)
+
+    ocupados = {}
+    for reserva in nuevas:
+        ocupados[reserva.disponibilidad_id] = ocupados.get(reserva.disponibilidad_id, 0) + reserva.cantidadVisitantes
+    for horario in horarios:
+        horario.capacidadActual = ocupados.get(horario.id, 0)
+    DisponibilidadParque.objects.bulk_update(horarios, ['capacidadActual'], batch_size=TAMANO_LOTE)
+    call_command('reconstruir_ocupacion', stdout=StringIO())
+    invalidar_disponibilidad()
+
+    return {
+        'hoy': hoy,
+        'fechas': [hoy + datetime.timedelta(days=dia) for dia in range(dias)],
+        'horarios': [horario.id for horario in horarios],
+        'tipos': TIPOS_VISITA,
+        'reservas': [reserva.pk for reserva in nuevas],
+        'tokens': [
+            firmar_token(reserva.pk, reserva.disponibilidad_id, hoy)
+            for reserva in nuevas
+            if reserva.disponibilidad.fecha == hoy and reserva.estadoReserva == Reserva.Estado.ACTIVO
+        ],
+        'numeros': itertools.count(reservas),
+    }
+
+
+class Escenario:
+    """
+    Una ruta a medir. peticion(contexto) devuelve (método, ruta, datos, extra),
+    donde extra son argumentos adicionales del cliente de pruebas (cabeceras, content_type).
+    """
+
+    def __init__(self, nombre, url, peticion, autenticado=False, escribe=False, preparar=None):
+        self.nombre = nombre
+        self.url = url
+        self.peticion = peticion
+        self.autenticado = autenticado
+        self.escribe = escribe
+        self.preparar = preparar
+
+
+def consulta(url, parametros=None, **kwargs):
+    # Escenario GET sin datos dinámicos
+    return Escenario(url, url, lambda contexto: ('get', reverse(url), parametros or {}, {}), **kwargs)
+
+
+def datos_nueva_reserva(contexto):
+    numero = next(contexto['numeros'])
+    datos = {
+        'rut': rut(50000000 + numero),
+        'nombre': f'Visitante {numero}',
+        'apellido': 'Carga',
+        'telefono': '+56900000000',
+        'correo': f'visitante{numero}@ejemplo.com',
+        'fecha_nacimiento': '1990-01-01',
+        'hora': random.choice(contexto['horarios']),
+        'tipoVisita': random.choice(contexto['tipos']),
+        'acompanante_rut_1': rut(60000000 + numero),
+        'acompanante_nombre_1': f'Acompañante {numero}',
+        'acompanante_fecha_nacimiento_1': '2010-01-01',
+    }
+    return 'post', reverse('guardar_reserva'), datos, {}
+
+
+def guardar_etag(contexto):
+    contexto['etag'] = Client().get(reverse('api_disponibilidad'))['ETag']
+
+
+def token_ingreso(contexto):
+    # Cuando se acaban los tokens del día se sigue midiendo el rechazo
+    try:
+        token = contexto['tokens'].pop()
+    except IndexError:
+        token = 'agotado'
+    return 'post', reverse('registrar_ingreso'), {'token': token}, {}
+
+
+ESCENARIOS = [
+    consulta('inicio'),
+    consulta('form'),
+    consulta('mostrar_disponibilidad'),
+    consulta('mostrar_tipo_visita'),
+    consulta('api_disponibilidad'),
+    Escenario(
+        'api_disponibilidad_304', 'api_disponibilidad',
+        lambda contexto: ('get', reverse('api_disponibilidad'), {}, {'HTTP_IF_NONE_MATCH': contexto['etag']}),
+        preparar=guardar_etag
+    ),
+    consulta('login_admin'),
+    Escenario(
+        'validar_reserva', 'validar_reserva',
+        lambda contexto: ('get', reverse('validar_reserva'), {'page': random.randint(1, 50)}, {}),
+        autenticado=True
+    ),
+    Escenario(
+        'validar_reserva_fecha', 'validar_reserva',
+        lambda contexto: ('get', reverse('validar_reserva'), {
+            'fecha': random.choice(contexto['fechas']).isoformat(), 'estado': Reserva.Estado.ACTIVO
+        }, {}),
+        autenticado=True
+    ),
+    Escenario(
+        'exportar_reservas', 'exportar_reservas',
+        lambda contexto: ('get', reverse('exportar_reservas'), {
+            'formato': 'csv', 'fecha': random.choice(contexto['fechas']).isoformat()
+        }, {}),
+        autenticado=True
+    ),
+    Escenario(
+        'modificar_reserva', 'modificar_reserva',
+        lambda contexto: ('get', reverse('modificar_reserva', args=[random.choice(contexto['reservas'])]), {}, {}),
+        autenticado=True
+    ),
+    consulta('dashboard_monitoreo', autenticado=True),
+    Escenario(
+        'manifiesto_acceso', 'manifiesto_acceso',
+        lambda contexto: ('get', reverse('manifiesto_acceso', args=[contexto['hoy']]), {}, {}),
+        autenticado=True
+    ),
+    consulta('metricas', autenticado=True),
+    Escenario('guardar_reserva', 'guardar_reserva', datos_nueva_reserva, escribe=True),
+    Escenario(
+        'retener_cupos', 'retener_cupos',
+        lambda contexto: ('post', reverse('retener_cupos'), {
+            'hora': random.choice(contexto['horarios']), 'cantidadVisitantes': 2
+        }, {}),
+        escribe=True
+    ),
+    Escenario(
+        'guardar_modificacion_reserva', 'guardar_modificacion_reserva',
+        lambda contexto: ('post', reverse('guardar_modificacion_reserva', args=[random.choice(contexto['reservas'])]), {
+            'hora': random.choice(contexto['horarios']), 'tipoVisita': random.choice(contexto['tipos'])
+        }, {}),
+        autenticado=True, escribe=True
+    ),
+    Escenario('registrar_ingreso', 'registrar_ingreso', token_ingreso, autenticado=True, escribe=True),
+    Escenario(
+        'sincronizar_ingresos', 'sincronizar_ingresos',
+        lambda contexto: ('post', reverse('sincronizar_ingresos', args=[contexto['hoy']]), json.dumps({
+            'ingresos': random.sample(contexto['reservas'], min(20, len(contexto['reservas'])))
+        }), {'content_type': 'application/json'}),
+        autenticado=True, escribe=True
+    ),
+]
+
+# Tiempo máximo que un cliente espera a los demás antes de empezar a medir
+ESPERA_BARRERA_SEGUNDOS = 60
+
+# Rutas que no se miden: un alias de otra ruta y el cierre de sesión, que invalida al cliente
+EXCLUIDAS = {'valreserva', 'logout_admin'}
+
+
+def percentil(valores, p):
+    # Método del rango más cercano, sobre los valores ya ordenados
+    return valores[max(0, math.ceil(p / 100 * len(valores)) - 1)]
+
+
+def medir(escenario, contexto, clientes, peticiones, usuario=None):
+    if escenario.preparar:
+        escenario.preparar(contexto)
+
+    # El inicio de sesión escribe en la base: se hace antes de lanzar los hilos para
+    # que un fallo ahí no deje a los demás esperando en la barrera
+    sesiones = []
+    for _ in range(clientes):
+        client = Client(raise_request_exception=False)
+        if escenario.autenticado:
+            client.force_login(usuario)
+        sesiones.append(client)
+
+    muestras = []
+    errores = []
+    lock = threading.Lock()
+    marcas = []
+    barrera = threading.Barrier(clientes, action=lambda: marcas.append(time.perf_counter()))
+
+    def trabajador(client, cantidad):
+        try:
+            conexion = connections[DEFAULT_DB_ALIAS]
+            barrera.wait(timeout=ESPERA_BARRERA_SEGUNDOS)
+
+            for _ in range(cantidad):
+                metodo, ruta, datos, extra = escenario.peticion(contexto)
+                with CaptureQueriesContext(conexion) as consultas:
+                    inicio = time.perf_counter()
+                    response = getattr(client, metodo)(ruta, datos, **extra)
+                    if response.streaming:
+                        for _ in response.streaming_content:
+                            pass
+                    duracion = time.perf_counter() - inicio
+                with lock:
+                    muestras.append((duracion, len(consultas), response.status_code))
+        except BaseException as error:
+            # Rompe la barrera: los hilos que esperan reciben BrokenBarrierError en vez de quedar bloqueados
+            barrera.abort()
+            with lock:
+                errores.append(error)
+        finally:
+            connections.close_all()
+
+    hilos = [
+        threading.Thread(target=trabajador, args=(client, peticiones // clientes + (n < peticiones % clientes)))
+        for n, client in enumerate(sesiones)
+    ]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    if errores:
+        # El error original, no el BrokenBarrierError que recibieron los demás hilos
+        raise next((error for error in errores if not isinstance(error, threading.BrokenBarrierError)), errores[0])
+    total = time.perf_counter() - marcas[0]
+    return resumir(muestras, total)
+
+
+def medir_asgi(escenario, contexto, clientes, peticiones, usuario=None):
+    if escenario.preparar:
+        escenario.preparar(contexto)
+    return asyncio.run(medir_en_bucle(escenario, contexto, clientes, peticiones, usuario))
+
+
+async def medir_en_bucle(escenario, contexto, clientes, peticiones, usuario):
+    muestras = []
+
+    async def nuevo_cliente():
+        client = AsyncClient(raise_request_exception=False)
+        if escenario.autenticado:
+            await client.aforce_login(usuario)
+        return client
+
+    async def pedir(client):
+        # Como ASGIHandler: el código síncrono de cada petición (vistas síncronas,
+        # ORM) corre en un hilo propio, con su conexión a la base de datos
+        async with ThreadSensitiveContext():
+            medicion = MedicionSQL(guardar_sql=False)
+            pila = ExitStack()
+            await sync_to_async(envolver_conexiones)(pila, medicion)
+            try:
+                metodo, ruta, datos, extra = escenario.peticion(contexto)
+                inicio = time.perf_counter()
+                response = await getattr(client, metodo)(ruta, datos, **extra)
+                if response.streaming:
+                    if response.is_async:
+                        async for _ in response.streaming_content:
+                            pass
+                    else:
+                        await sync_to_async(list)(response.streaming_content)
+                duracion = time.perf_counter() - inicio
+            finally:
+                await sync_to_async(pila.close)()
+                await sync_to_async(connections.close_all)()
+
+        muestras.append((duracion, medicion.consultas, response.status_code))
+
+    async def cliente(client, cantidad):
+        for _ in range(cantidad):
+            await pedir(client)
+
+    lista = await asyncio.gather(*(nuevo_cliente() for _ in range(clientes)))
+    await sync_to_async(connections.close_all)()
+    inicio = time.perf_counter()
+    await asyncio.gather(*(
+        cliente(client, peticiones // clientes + (n < peticiones % clientes))
+        for n, client in enumerate(lista)
+    ))
+    return resumir(muestras, time.perf_counter() - inicio)
+
+
+def resumir(muestras, total):
+    """
+    Resume las muestras (duración, consultas, código de estado). Rendimiento,
+    latencias y consultas se calculan solo con las respuestas 2xx y 3xx: un 4xx
+    (sala de espera, ingreso repetido) es barato y no debe inflar la medición.
+    Los demás se cuentan aparte en estados, rechazadas y errores.
+    """
+    estados = Counter(estado for _, _, estado in muestras)
+    exitosas = [(duracion, consultas) for duracion, consultas, estado in muestras if estado < 400]
+    latencias = sorted(duracion * 1000 for duracion, _ in exitosas)
+    consultas = [cantidad for _, cantidad in exitosas]
+    return {
+        'peticiones': len(muestras),
+        'exitosas': len(exitosas),
+        'rechazadas': sum(cantidad for estado, cantidad in estados.items() if 400 <= estado < 500),
+        'errores': sum(cantidad for estado, cantidad in estados.items() if estado >= 500),
+        'estados': {str(estado): cantidad for estado, cantidad in sorted(estados.items())},
+        'peticiones_por_segundo': round(len(exitosas) / total, 1),
+        'p50_ms': round(percentil(latencias, 50), 2) if latencias else None,
+        'p95_ms': round(percentil(latencias, 95), 2) if latencias else None,
+        'p99_ms': round(percentil(latencias, 99), 2) if latencias else None,
+        'consultas_promedio': round(sum(consultas) / len(consultas), 2) if consultas else None,
+        'consultas_max': max(consultas) if consultas else None,
+    }
+
+
+def comparar(base, actual, umbral):
+    """
+    Lista las regresiones de actual respecto de base: p95 o consultas por
+    petición por encima de base * (1 + umbral / 100) y de la tolerancia
+    absoluta, o errores nuevos.
+    """
+    regresiones = []
+    limite = 1 + umbral / 100
+    for nombre, resultado in actual.items():
+        anterior = base.get(nombre)
+        if anterior is None:
+            continue
+        if resultado['p95_ms'] is None or anterior['p95_ms'] is None:
+            # Sin respuestas exitosas no hay latencias que comparar
+            if resultado['p95_ms'] is None and anterior['p95_ms'] is not None:
+                regresiones.append(f"{nombre}: ninguna respuesta exitosa")
+            continue
+        if resultado['p95_ms'] > max(anterior['p95_ms'] * limite, anterior['p95_ms'] + TOLERANCIA_MS):
+            regresiones.append(f"{nombre}: p95 {anterior['p95_ms']} ms -> {resultado['p95_ms']} ms")
+        if resultado['consultas_promedio'] > max(
+            anterior['consultas_promedio'] * limite, anterior['consultas_promedio'] + TOLERANCIA_CONSULTAS
+        ):
+            regresiones.append(
+                f"{nombre}: consultas por petición {anterior['consultas_promedio']} -> {resultado['consultas_promedio']}"
+            )
+        if resultado['errores'] and not anterior['errores']:
+            regresiones.append(f"{nombre}: {resultado['errores']} errores")
+    return regresiones
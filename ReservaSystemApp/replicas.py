@@ -0,0 +1,168 @@
+"""
+Lecturas del panel de administración en réplicas de solo lectura.
+
+Solo las vistas marcadas con @lectura_en_replica leen de una réplica; todo
+lo demás, incluida la reserva, usa la base principal. Tras una escritura, el
+cliente recibe una cookie y durante REPLICAS_SEGUNDOS_PRIMARIA sus lecturas
+vuelven a la principal, para que vea sus propios cambios aunque la réplica vaya con retraso.
+Cada petición elige una réplica al azar en su primera lectura y la usa en
+todas las demás: sus consultas ven un mismo estado de los datos aunque las
+réplicas vayan con distinto retraso.
+"""
+
+import random
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+COOKIE_PRIMARIA = 'sgra_primaria'
+
+_peticion = ContextVar('peticion_replicas', default=None)
+
+
+class EstadoPeticion:
+    def __init__(self, primaria=False):
+        self.primaria = primaria
+        self.en_replica = False
+        self.escribio = False
+        self.replica = None
+
+
+class RouterReplicas:
+    def db_for_read(self, model, **hints):
+        estado = _peticion.get()
+        if estado is None or not estado.en_replica or estado.primaria or estado.escribio:
+            return None
+        if not settings.REPLICAS_LECTURA:
+            return None
+        if estado.replica not in settings.REPLICAS_LECTURA:
+            estado.replica = random.choice(settings.REPLICAS_LECTURA)
+        return estado.replica
+
+    def db_for_write(self, model, **hints):
+        estado = _peticion.get()
+        if estado is not None:
+            estado.escribio = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Las réplicas tienen los mismos datos que la principal
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Las réplicas reciben el esquema por replicación
+        return db not in settings.REPLICAS_LECTURA
+
+
+class ReplicasMiddleware:
+    # Bajo ASGI el estado viaja en el ContextVar: sync_to_async lo copia al hilo
+    # donde el ORM asíncrono ejecuta las consultas
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        estado = EstadoPeticion(primaria=COOKIE_PRIMARIA in request.COOKIES)
+        token = _peticion.set(estado)
+        try:
+            response = self.get_response(request)
+        finally:
+            _peticion.reset(token)
+        return marcar_primaria(response, estado)
+
+    async def __acall__(self, request):
+        estado = EstadoPeticion(primaria=COOKIE_PRIMARIA in request.COOKIES)
+        token = _peticion.set(estado)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _peticion.reset(token)
+        return marcar_primaria(response, estado)
+
+
+def marcar_primaria(response, estado):
+    if estado.escribio:
+        response.set_cookie(
+            COOKIE_PRIMARIA, '1', max_age=settings.REPLICAS_SEGUNDOS_PRIMARIA, httponly=True, samesite='Lax'
+        )
+    return response
+
+
+def iterar_con_estado(iterable, estado):
+    # El contenido de un StreamingHttpResponse se genera después de que la vista
+    # termina: cada fragmento se produce con el estado de la petición activo
+    iterador = iter(iterable)
+    while True:
+        token = _peticion.set(estado)
+        try:
+            fragmento = next(iterador)
+        except StopIteration:
+            return
+        finally:
+            _peticion.reset(token)
+        yield fragmento
+
+
+async def aiterar_con_estado(iterable, estado):
+    # Versión para el contenido asíncrono: sync_to_async copia el estado al hilo de cada consulta
+    iterador = aiter(iterable)
+    while True:
+        token = _peticion.set(estado)
+        try:
+            fragmento = await anext(iterador)
+        except StopAsyncIteration:
+            return
+        finally:
+            _peticion.reset(token)
+        yield fragmento
+
+
+def lectura_en_replica(vista):
+    if iscoroutinefunction(vista):
+        @wraps(vista)
+        async def envoltura_asincrona(request, *args, **kwargs):
+            estado = _peticion.get() or EstadoPeticion()
+            anterior = estado.en_replica
+            estado.en_replica = True
+            token = _peticion.set(estado)
+            try:
+                response = await vista(request, *args, **kwargs)
+            finally:
+                _peticion.reset(token)
+                estado.en_replica = anterior
+            return leer_contenido_en_replica(response, estado)
+        return envoltura_asincrona
+
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        estado = _peticion.get() or EstadoPeticion()
+        anterior = estado.en_replica
+        estado.en_replica = True
+        token = _peticion.set(estado)
+        try:
+            response = vista(request, *args, **kwargs)
+        finally:
+            _peticion.reset(token)
+            estado.en_replica = anterior
+        return leer_contenido_en_replica(response, estado)
+    return envoltura
+
+
+def leer_contenido_en_replica(response, estado):
+    if response.streaming:
+        lectura = EstadoPeticion(primaria=estado.primaria or estado.escribio)
+        lectura.en_replica = True
+        lectura.replica = estado.replica
+        iterar = aiterar_con_estado if response.is_async else iterar_con_estado
+        response.streaming_content = iterar(response.streaming_content, lectura)
+    return response
@@ -0,0 +1,126 @@
+"""
+Retención temporal de cupos mientras se completa el formulario de reserva.
+
+Al elegir un horario se apartan los cupos con el mismo UPDATE condicional que
+usa guardarReserva, y se guarda una RetencionCupo con su vencimiento. Mientras
+la fila exista, sus cupos están sumados en capacidadActual; guardarReserva la
+confirma sin volver a tocar el horario. Las retenciones vencidas no se liberan
+con un temporizador: se devuelven en lote la próxima vez que alguien pide una
+retención o un horario parece lleno (y con manage.py liberar_retenciones).
+
+Cada retención guarda una huella de la IP que la pidió: un mismo cliente no
+puede tener más de RETENCION_MAX_POR_CLIENTE cupos apartados a la vez.
+"""
+
+import datetime
+import secrets
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Sum, Value, When
+from django.utils import timezone
+from django.utils.crypto import salted_hmac
+from ReservaSystemApp.models import DisponibilidadParque, RetencionCupo
+from ReservaSystemApp.disponibilidad import (
+    reservar_capacidad, liberar_capacidad, invalidar_disponibilidad_al_confirmar
+)
+
+class LimiteRetencionesExcedido(Exception):
+    pass
+
+def huella_cliente(ip):
+    # No se guarda la IP: basta con distinguir clientes entre retenciones vigentes
+    return salted_hmac('ReservaSystemApp.retenciones', ip or '').hexdigest()[:32]
+
+def cupos_retenidos_por(cliente):
+    return RetencionCupo.objects.filter(cliente=cliente, expira__gt=timezone.now()).aggregate(
+        cupos=Sum('cantidadVisitantes')
+    )['cupos'] or 0
+
+@transaction.atomic
+def liberar_retenciones_vencidas(disponibilidad_id=None, tamano_lote=500):
+    """
+    Borra hasta tamano_lote retenciones vencidas y devuelve sus cupos con un
+    solo UPDATE para todos los horarios afectados. Devuelve la cantidad liberada.
+    """
+    vencidas = RetencionCupo.objects.select_for_update(skip_locked=True).filter(expira__lte=timezone.now())
+    if disponibilidad_id is not None:
+        vencidas = vencidas.filter(disponibilidad_id=disponibilidad_id)
+    filas = list(vencidas.order_by('expira').values_list('idRetencion', 'disponibilidad_id', 'cantidadVisitantes')[:tamano_lote])
+    if not filas:
+        return 0
+
+    por_horario = {}
+    for _, horario_id, cantidad in filas:
+        por_horario[horario_id] = por_horario.get(horario_id, 0) + cantidad
+
+    RetencionCupo.objects.filter(idRetencion__in=[id for id, _, _ in filas]).delete()
+    DisponibilidadParque.objects.filter(id__in=por_horario).update(
+        capacidadActual=F('capacidadActual') - Case(
+            *[When(id=horario_id, then=Value(cantidad)) for horario_id, cantidad in por_horario.items()]
+        )
+    )
+    invalidar_disponibilidad_al_confirmar()
+    return len(filas)
+
+def reservar_o_reclamar(disponibilidad_id, cantidad):
+    # Si el horario parece lleno, parte de sus cupos puede estar en retenciones vencidas
+    if reservar_capacidad(disponibilidad_id, cantidad):
+        return True
+    return bool(liberar_retenciones_vencidas(disponibilidad_id)) and reservar_capacidad(disponibilidad_id, cantidad)
+
+@transaction.atomic
+def retener_cupos(disponibilidad_id, cantidad, token_anterior=None, cliente=''):
+    """
+    Aparta cantidad cupos del horario por RETENCION_SEGUNDOS. token_anterior
+    es la retención que reemplaza (otro horario u otra cantidad de acompañantes).
+    Devuelve la RetencionCupo creada, o None si no hay cupos. Lanza
+    LimiteRetencionesExcedido si el cliente superaría RETENCION_MAX_POR_CLIENTE.
+    """
+    if token_anterior:
+        soltar_retencion(token_anterior)
+    liberar_retenciones_vencidas()
+
+    limite = settings.RETENCION_MAX_POR_CLIENTE
+    if limite is not None and cupos_retenidos_por(cliente) + cantidad > limite:
+        # La excepción deshace la transacción: se conserva la retención anterior
+        raise LimiteRetencionesExcedido(limite)
+
+    if not reservar_o_reclamar(disponibilidad_id, cantidad):
+        # Sin cupos se conserva la retención anterior
+        transaction.set_rollback(True)
+        return None
+
+    return RetencionCupo.objects.create(
+        token=secrets.token_urlsafe(16),
+        disponibilidad_id=disponibilidad_id,
+        cantidadVisitantes=cantidad,
+        expira=timezone.now() + datetime.timedelta(seconds=settings.RETENCION_SEGUNDOS),
+        cliente=cliente,
+    )
+
+def soltar_retencion(token):
+    # Sirve para retenciones vencidas que aún no se liberan: mientras la fila exista, sus cupos están contados
+    retencion = RetencionCupo.objects.select_for_update().filter(token=token).first()
+    if retencion is None:
+        return
+    retencion.delete()
+    liberar_capacidad(retencion.disponibilidad_id, retencion.cantidadVisitantes)
+
+def tomar_retencion(token, disponibilidad_id):
+    """
+    Consume la retención vigente del token para el horario y devuelve los cupos
+    que ya tenía apartados (0 si no hay). Debe llamarse dentro de la transacción
+    de la reserva, que decide qué hacer con la diferencia.
+    """
+    if not token:
+        return 0
+    retencion = RetencionCupo.objects.select_for_update().filter(
+        token=token,
+        disponibilidad_id=disponibilidad_id,
+        expira__gt=timezone.now()
+    ).first()
+    if retencion is None:
+        return 0
+    retencion.delete()
+    return retencion.cantidadVisitantes
@@ -0,0 +1,24 @@
+def digito_verificador(cuerpo):
+    # Módulo 11 con factores 2..7, según el algoritmo del Registro Civil
+    suma = 0
+    factor = 2
+    for digito in reversed(str(cuerpo)):
+        suma += int(digito) * factor
+        factor = 2 if factor == 7 else factor + 1
+    resto = 11 - suma % 11
+    return {11: '0', 10: 'K'}.get(resto, str(resto))
+
+def normalizar_rut(rut):
+    """
+    Convierte '12.345.678-5', '123456785' o '12345678-5' en '12345678-5'.
+    Lanza ValueError si el formato o el dígito verificador no son válidos.
+    """
+    limpio = (rut or '').replace('.', '').replace('-', '').replace(' ', '').upper()
+    cuerpo, dv = limpio[:-1], limpio[-1:]
+
+    if not cuerpo.isdigit() or len(cuerpo) > 9:
+        raise ValueError(f'RUT no válido: {rut}')
+    if digito_verificador(int(cuerpo)) != dv:
+        raise ValueError(f'Dígito verificador incorrecto en el RUT {rut}')
+
+    return f'{int(cuerpo)}-{dv}'
@@ -0,0 +1,57 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+from ReservaSystemApp.models import DisponibilidadParque, TipoVisita, Reserva
+from ReservaSystemApp.disponibilidad import invalidar_disponibilidad_al_confirmar
+from ReservaSystemApp.ocupacion import (
+    contribucion_reserva, contribucion_guardada, aplicar_cambio_contribucion, recalcular_capacidad
+)
+
+@receiver([post_save, post_delete], sender=DisponibilidadParque)
+@receiver([post_save, post_delete], sender=TipoVisita)
+def invalidar_cache_disponibilidad(sender, **kwargs):
+    invalidar_disponibilidad_al_confirmar()
+
+@receiver(pre_save, sender=DisponibilidadParque)
+def guardar_fecha_anterior(sender, instance, **kwargs):
+    instance._fecha_anterior = None
+    if instance.pk:
+        instance._fecha_anterior = DisponibilidadParque.objects.filter(
+            pk=instance.pk
+        ).values_list('fecha', flat=True).first()
+
+@receiver(post_save, sender=DisponibilidadParque)
+def actualizar_capacidad_diaria(sender, instance, **kwargs):
+    fechas = [instance.fecha]
+    if instance._fecha_anterior:
+        fechas.append(instance._fecha_anterior)
+    recalcular_capacidad(*fechas)
+
+@receiver(post_delete, sender=DisponibilidadParque)
+def descontar_capacidad_diaria(sender, instance, **kwargs):
+    recalcular_capacidad(instance.fecha)
+
+@receiver(pre_save, sender=Reserva)
+def guardar_contribucion_anterior(sender, instance, **kwargs):
+    instance._contribucion_anterior = contribucion_guardada(instance.pk) if instance.pk else None
+
+@receiver(post_save, sender=Reserva)
+def actualizar_ocupacion_diaria(sender, instance, **kwargs):
+    if Reserva.disponibilidad.is_cached(instance) and instance.disponibilidad:
+        fecha = instance.disponibilidad.fecha
+    else:
+        fecha = DisponibilidadParque.objects.filter(
+            pk=instance.disponibilidad_id
+        ).values_list('fecha', flat=True).first()
+
+    nueva = contribucion_reserva(fecha, instance.tipoVisita_id, instance.estadoReserva, instance.cantidadVisitantes)
+    # El resumen se actualiza tras el commit para no alargar la transacción de la reserva
+    # con un bloqueo sobre la fila del día; reconstruir_ocupacion corrige cualquier desvío
+    transaction.on_commit(partial(aplicar_cambio_contribucion, instance._contribucion_anterior, nueva))
+
+@receiver(pre_delete, sender=Reserva)
+def descontar_ocupacion_diaria(sender, instance, **kwargs):
+    anterior = contribucion_guardada(instance.pk)
+    transaction.on_commit(partial(aplicar_cambio_contribucion, anterior, None))
@@ -1,3 +1,1759 @@
-from django.test import TestCase
+import csv
+import datetime
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+import threading
+import time
+import unittest
+import unittest.mock
+
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import call_command, CommandError
+from django.conf import settings
+from django.db import DatabaseError, connection, connections, router
+from django.db.models import F, Sum
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.test import AsyncClient, Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.handlers.asgi import ASGIHandler
+from asgiref.sync import sync_to_async
+from django.urls import reverse, get_resolver
+from django.utils import timezone
+
+from ReservaSystemApp.documentos import firmar_token, verificar_token, generar_documentos, reservas_sin_documento
+from ReservaSystemApp.notificaciones import buffer_notificaciones, guardar_en_outbox
+from ReservaSystemApp import rendimiento
+from ReservaSystemApp import admision
+from ReservaSystemApp.admision import CLAVE_EN_CURSO
+from ReservaSystemApp.metricas import registro_metricas
+from ReservaSystemApp.replicas import COOKIE_PRIMARIA, EstadoPeticion, _peticion
+from ReservaSystemApp.pronostico import pronosticar_ocupacion
+from ReservaSystemApp.retenciones import liberar_retenciones_vencidas
+from ReservaSystemApp.rut import digito_verificador, normalizar_rut
+from ReservaSystemApp.acceso import registrar_ingreso, validar_sin_conexion
+from ReservaSystemApp import views
+from ReservaSystemApp.management.commands.deduplicar_visitantes import Command as DeduplicarVisitantes
+from ReservaSystemApp.views import consultar_reservas, acompanantes_de, iterar_reservas
+
+from ReservaSystemApp.models import (
+    DisponibilidadParque, Visitante, Acompañante, Reserva, TipoVisita,
+    OcupacionDiaria, CapacidadDiaria, SistemaNotificaciones, AlertaCapacidad, DocumentoAcceso, RetencionCupo,
+    PronosticoHorario
+)
 
 # Create your tests here.
+
+# Dentro de la transacción de un TestCase la réplica espejo no ve los datos de la prueba:
+# todas las pruebas leen de la principal salvo ReplicasIntegracionTests
+sin_replicas = override_settings(REPLICAS_LECTURA=[])
+# Las pruebas envían muchas reservas por segundo: la cubeta de admisión solo se prueba en AdmisionReservasTests
+sin_cubeta = override_settings(ADMISION_FICHAS=None)
+
+def setUpModule():
+    sin_replicas.enable()
+    sin_cubeta.enable()
+
+def tearDownModule():
+    sin_cubeta.disable()
+    sin_replicas.disable()
+    # Evita que el vaciado al cerrar el proceso escriba notificaciones de prueba
+    buffer_notificaciones.pendientes.clear()
+
+def rut_valido(cuerpo):
+    return f'{cuerpo}-{digito_verificador(cuerpo)}'
+
+def crear_disponibilidad(fecha=None, hora=9, capacidad_maxima=50, capacidad_actual=0):
+    return DisponibilidadParque.objects.create(
+        fecha=fecha or datetime.date.today() + datetime.timedelta(days=1),
+        horaInicio=datetime.time(hora, 0),
+        horaFin=datetime.time(hora + 1, 0),
+        capacidadMaxima=capacidad_maxima,
+        capacidadActual=capacidad_actual,
+    )
+
+def crear_reserva(disponibilidad, tipo_visita, numero, acompanantes=2, legado=False):
+    # legado: acompañantes sin reserva, como los creados antes de la columna Acompañante.reserva
+    visitante = Visitante.objects.create(
+        rut=rut_valido(10000000 + numero),
+        nombre=f'Visitante {numero}',
+        apellido='Prueba',
+        telefono='+56912345678',
+        correo=f'visitante{numero}@ejemplo.com',
+        fecha_nacimiento=datetime.date(1990, 1, 1),
+    )
+    reserva = Reserva.objects.create(
+        visitante=visitante,
+        disponibilidad=disponibilidad,
+        cantidadVisitantes=acompanantes + 1,
+        tipoVisita=tipo_visita,
+    )
+    for i in range(acompanantes):
+        Acompañante.objects.create(
+            rut=rut_valido(20000000 + numero * 10 + i),
+            rutVisitante=visitante,
+            reserva=None if legado else reserva,
+            nombre=f'Acompañante {numero}.{i}',
+            fecha_nacimiento=datetime.date(2000, 1, 1),
+        )
+    return reserva
+
+
+class ValidarReservaTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', password='clave-segura', is_staff=True)
+        self.client.force_login(self.admin)
+        self.tipo_visita = TipoVisita.objects.create(nombre='Familiar', descripcion='Visita familiar')
+        self.disponibilidad = crear_disponibilidad(capacidad_maxima=10000)
+
+    def contar_consultas(self, **params):
+        with CaptureQueriesContext(connection) as contexto:
+            response = self.client.get(reverse('validar_reserva'), params)
+        self.assertEqual(response.status_code, 200)
+        return len(contexto.captured_queries), response
+
+    def test_cantidad_de_consultas_no_crece_con_las_reservas(self):
+        for numero in range(3):
+            crear_reserva(self.disponibilidad, self.tipo_visita, numero)
+        consultas_pocas, _ = self.contar_consultas()
+
+        for numero in range(3, 60):
+            crear_reserva(self.disponibilidad, self.tipo_visita, numero)
+        consultas_muchas, response = self.contar_consultas(page=2)
+
+        self.assertEqual(consultas_pocas, consultas_muchas)
+        self.assertEqual(len(response.context['reservas'].object_list), 10)
+
+    def test_pagina_incluye_acompanantes_de_cada_reserva(self):
+        reservas = [crear_reserva(self.disponibilidad, self.tipo_visita, numero, acompanantes=numero) for numero in range(4)]
+        _, response = self.contar_consultas()
+
+        filas = {fila['idReserva']: fila for fila in response.context['reservas'].object_list}
+        for reserva in reservas:
+            fila = filas[reserva.idReserva]
+            self.assertEqual(len(fila['acompanantes']), reserva.cantidadVisitantes - 1)
+            self.assertEqual(fila['tipo_visita_nombre'], 'Familiar')
+
+    def test_filtros_fecha_y_estado(self):
+        otra = crear_disponibilidad(fecha=datetime.date.today() + datetime.timedelta(days=5))
+        crear_reserva(self.disponibilidad, self.tipo_visita, 1)
+        esperada = crear_reserva(otra, self.tipo_visita, 2)
+        usada = crear_reserva(otra, self.tipo_visita, 3)
+        usada.estadoReserva = Reserva.Estado.UTILIZADO
+        usada.save()
+
+        _, response = self.contar_consultas(fecha=otra.fecha.isoformat(), estado='ACTIVO')
+
+        ids = [fila['idReserva'] for fila in response.context['reservas'].object_list]
+        self.assertEqual(ids, [esperada.idReserva])
+
+    def test_pagina_fuera_de_rango_muestra_la_ultima(self):
+        primera = crear_reserva(self.disponibilidad, self.tipo_visita, 0)
+        for numero in range(1, 12):
+            crear_reserva(self.disponibilidad, self.tipo_visita, numero)
+
+        _, response = self.contar_consultas(page=99)
+
+        pagina = response.context['reservas']
+        self.assertEqual((pagina.number, pagina.paginator.num_pages), (2, 2))
+        self.assertEqual([fila['idReserva'] for fila in pagina.object_list][-1], primera.idReserva)
+        _, response = self.contar_consultas(page='x')
+        self.assertEqual(response.context['reservas'].number, 1)
+
+
+
+def datos_reserva(disponibilidad, tipo_visita, numero=1, acompanantes=0):
+    datos = {
+        'rut': rut_valido(10000000 + numero),
+        'nombre': f'Visitante {numero}',
+        'apellido': 'Prueba',
+        'telefono': '+56912345678',
+        'correo': f'visitante{numero}@ejemplo.com',
+        'fecha_nacimiento': '1990-01-01',
+        'hora': disponibilidad.id,
+        'tipoVisita': tipo_visita.nombre,
+    }
+    for i in range(1, acompanantes + 1):
+        datos[f'acompanante_rut_{i}'] = rut_valido(20000000 + numero * 100 + i)
+        datos[f'acompanante_nombre_{i}'] = f'Acompañante {numero}.{i}'
+        datos[f'acompanante_fecha_nacimiento_{i}'] = '2000-01-01'
+    return datos
+
+
+class GuardarReservaTests(TestCase):
+    def setUp(self):
+        self.tipo_visita = TipoVisita.objects.create(nombre='Familiar', descripcion='Visita familiar')
+        self.disponibilidad = crear_disponibilidad(capacidad_maxima=100)
+
+    def guardar(self, datos):
+        with CaptureQueriesContext(connection) as contexto:
+            self.client.post(reverse('guardar_reserva'), datos)
+        return len(contexto.captured_queries)
+
+    def test_reserva_grupal_usa_consultas_constantes(self):
+        consultas_individual = self.guardar(datos_reserva(self.disponibilidad, self.tipo_visita, 1, acompanantes=1))
+        consultas_grupal = self.guardar(datos_reserva(self.disponibilidad, self.tipo_visita, 2, acompanantes=40))
+
+        self.assertEqual(consultas_individual, consultas_grupal)
+        self.disponibilidad.refresh_from_db()
+        self.assertEqual(self.disponibilidad.capacidadActual, 2 + 41)
+        self.assertEqual(Acompañante.objects.count(), 41)
+
+    def test_horario_lleno_no_escribe_nada(self):
+        self.disponibilidad.capacidadActual = 99
+        self.disponibilidad.save()
+
+        with CaptureQueriesContext(connection) as contexto:
+            self.client.post(reverse('guardar_reserva'), datos_reserva(self.disponibilidad, self.tipo_visita, acompanantes=3))
+
+        inserciones = [q['sql'] for q in contexto.captured_queries if q['sql'].startswith('INSERT')]
+        self.assertEqual(inserciones, [])
+        self.assertFalse(Visitante.objects.exists())
+        self.disponibilidad.refresh_from_db()
+        self.assertEqual(self.disponibilidad.capacidadActual, 99)
+
+    def test_horario_inexistente_no_se_informa_como_lleno(self):
+        datos = datos_reserva(self.disponibilidad, self.tipo_visita)
+        datos['hora'] = self.disponibilidad.id + 1000
+
+        response = self.client.post(reverse('guardar_reserva'), datos, follow=True)
+
+        mensajes = [str(mensaje) for mensaje in response.context['messages']]
+        self.assertEqual(mensajes, ['El horario seleccionado no existe o ya no está disponible'])
+        self.assertFalse(Reserva.objects.exists())
+
+    def test_datos_incompletos_se_rechazan_antes_de_escribir(self):
+        datos = datos_reserva(self.disponibilidad, self.tipo_visita)
+        datos['fecha_nacimiento'] = ''
+        self.guardar(datos)
+
+        self.assertFalse(Visitante.objects.exists())
+        self.disponibilidad.refresh_from_db()
+        self.assertEqual(self.disponibilidad.capacidadActual, 0)
+
+
+class AdmisionReservasTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tipo_visita = TipoVisita.objects.create(nombre='Familiar', descripcion='Visita familiar')
+        self.disponibilidad = crear_disponibilidad(capacidad_maxima=100)
+        self.clave_horario = f'{CLAVE_EN_CURSO}:{self.disponibilidad.id}'
+
+    def guardar(self, numero=1, **extra):
+        return self.client.post(reverse('guardar_reserva'), {**datos_reserva(self.disponibilidad, self.tipo_visita, numero), **extra})
+
+    @override_settings(ADMISION_CONCURRENCIA_HORARIO=1)
+    def test_horario_saturado_recibe_turno_sin_tocar_la_base(self):
+        # Otra reserva del mismo horario está en curso
+        cache.set(self.clave_horario, 1)
+
+        with CaptureQueriesContext(connection) as contexto:
+            response = self.guardar(retencion='abc')
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(response.context['posicion'], 1)
+        self.assertIn(('retencion', 'abc'), response.context['campos'])
+        self.assertContains(response, 'name="turno" value="1"', status_code=429)
+        self.assertEqual(contexto.captured_queries, [])
+        self.assertFalse(Reserva.objects.exists())
+        # El lugar global tomado antes del rechazo se devuelve
+        self.assertEqual(cache.get(CLAVE_EN_CURSO), 0)
+        self.assertEqual(cache.get(self.clave_horario), 1)
+
+    @override_settings(ADMISION_CONCURRENCIA_HORARIO=1)
+    def test_reintento_conserva_su_turno(self):
+        cache.set(self.clave_horario, 1)
+        self.assertEqual(self.guardar(1).context['turno'], 1)
+        self.assertEqual(self.guardar(2).context['posicion'], 2)
+        self.assertEqual(self.guardar(2, turno='2').context['turno'], 2)
+
+        # Se libera el horario y entra el primer turno: el segundo pasa al frente
+        cache.set(self.clave_horario, 0)
+        self.assertRedirects(self.guardar(1, turno='1'), reverse('inicio'), fetch_redirect_response=False)
+        cache.set(self.clave_horario, 1)
+        response = self.guardar(2, turno='2')
+        self.assertEqual((response.context['turno'], response.context['posicion']), (2, 1))
+
+    @override_settings(ADMISION_FICHAS=1, ADMISION_INTERVALO_SEGUNDOS=3600)
+    def test_cubeta_sin_fichas_pone_en_espera(self):
+        self.assertEqual(self.guardar(1).status_code, 302)
+        self.assertEqual(self.guardar(2).status_code, 429)
+
+        self.assertEqual(Reserva.objects.count(), 1)
+        self.assertEqual(cache.get(CLAVE_EN_CURSO), 0)
+        self.assertEqual(cache.get(self.clave_horario), 0)
+
+    @override_settings(ADMISION_CONCURRENCIA_HORARIO=1)
+    def test_contador_vencido_no_queda_negativo(self):
+        # Una reserva entró, su contador venció y otra lo volvió a crear
+        self.assertEqual(admision.entrar(self.disponibilidad.id), [CLAVE_EN_CURSO, self.clave_horario])
+        cache.delete(self.clave_horario)
+        segunda = admision.entrar(self.disponibilidad.id)
+        admision.salir([self.clave_horario])
+
+        # Las dos terminan: el contador queda en cero y no en -1
+        admision.salir(segunda)
+        self.assertEqual(cache.get(self.clave_horario), 0)
+        self.assertIsNotNone(admision.entrar(self.disponibilidad.id))
+        self.assertIsNone(admision.entrar(self.disponibilidad.id))
+
+    @override_settings(ADMISION_CONCURRENCIA_GLOBAL=None, ADMISION_CONCURRENCIA_HORARIO=None)
+    def test_limites_desactivados(self):
+        self.assertEqual(self.guardar().status_code, 302)
+        self.assertIsNone(cache.get(CLAVE_EN_CURSO))
+
+
+class RetencionCuposTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tipo_visita = TipoVisita.objects.create(nombre='Familiar', descripcion='Visita familiar')
+        self.disponibilidad = crear_disponibilidad(capacidad_maxima=5)
+
+    def retener(self, disponibilidad, cantidad, retencion=''):
+        return self.client.post(reverse('retener_cupos'), {
+            'hora': disponibilidad.id, 'cantidadVisitantes': cantidad, 'retencion': retencion
+        })
+
+    def capacidad_actual(self, disponibilidad):
+        disponibilidad.refresh_from_db()
+        return disponibilidad.capacidadActual
+
+    def retencion_vencida(self, disponibilidad, cantidad):
+        DisponibilidadParque.objects.filter(id=disponibilidad.id).update(capacidadActual=F('capacidadActual') + cantidad)
+        return RetencionCupo.objects.create(
+            token=f'vencida-{disponibilidad.id}-{cantidad}', disponibilidad=disponibilidad,
+            cantidadVisitantes=cantidad, expira=timezone.now() - datetime.timedelta(seconds=1)
+        )
+
+    def test_retencion_cuenta_contra_la_capacidad(self):
+        response = self.retener(self.disponibilidad, 3)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['segundos'], settings.RETENCION_SEGUNDOS)
+        self.assertEqual(self.capacidad_actual(self.disponibilidad), 3)
+        self.assertEqual(self.retener(self.disponibilidad, 3).status_code, 409)
+        self.assertEqual(self.retener(self.disponibilidad, settings.RETENCION_MAX_VISITANTES + 1).status_code, 400)
+
+    def test_reserva_confirma_la_retencion_sin_volver_a_reservar(self):
+        token = self.retener(self.disponibilidad, 2).json()['retencion']
+        datos = {**datos_reserva(self.disponibilidad, self.tipo_visita, acompanantes=1), 'retencion': token}
+
+        with CaptureQueriesContext(connection) as contexto:
+            self.client.post(reverse('guardar_reserva'), datos)
+
+        self.assertEqual(Reserva.objects.get().cantidadVisitantes, 2)
+        self.assertFalse(RetencionCupo.objects.exists())
+        self.assertEqual(self.capacidad_actual(self.disponibilidad), 2)
+        actualizaciones = [q['sql'] for q in contexto.captured_queries if 'UPDATE "disponibilidadParque"' in q['sql']]
+        self.assertEqual(actualizaciones, [])
+
+    def test_reserva_ajusta_la_diferencia_de_visitantes(self):
+        token = self.retener(self.disponibilidad, 3).json()['retencion']
+        self.client.post(reverse('guardar_reserva'), {**datos_reserva(self.disponibilidad, self.tipo_visita), 'retencion': token})
+        self.assertEqual(self.capacidad_actual(self.disponibilidad), 1)
+
+        token = self.retener(self.disponibilidad, 1).json()['retencion']
+        self.client.post(reverse('guardar_reserva'), {
+            **datos_reserva(self.disponibilidad, self.tipo_visita, 2, acompanantes=5), 'retencion': token
+        })
+        # Faltan cupos para la diferencia: la retención se conserva
+        self.assertEqual(Reserva.objects.count(), 1)
+        self.assertTrue(RetencionCupo.objects.filter(token=token).exists())
+        self.assertEqual(self.capacidad_actual(self.disponibilidad), 2)
+
+    def test_reemplazo_sin_cupos_conserva_la_retencion_anterior(self):
+        token = self.retener(self.disponibilidad, 2).json()['retencion']
+
+        self.assertEqual(self.retener(self.disponibilidad, 6, token).status_code, 409)
+        self.assertTrue(RetencionCupo.objects.filter(token=token).exists())
+
+        nuevo = self.retener(self.disponibilidad, 4, token).json()['retencion']
+        self.assertEqual(list(RetencionCupo.objects.values_list('token', flat=True)), [nuevo])
+        self.assertEqual(self.capacidad_actual(self.disponibilidad), 4)
+
+    def test_retenciones_vencidas_se_liberan_en_lote(self):
+        otra = crear_disponibilidad(hora=10, capacidad_maxima=5)
+        self.retencion_vencida(self.disponibilidad, 2)
+        self.retencion_vencida(self.disponibilidad, 1)
+        self.retencion_vencida(otra, 4)
+
+        self.assertEqual(liberar_retenciones_vencidas(), 3)
+
+        self.assertFalse(RetencionCupo.objects.exists())
+        self.assertEqual((self.capacidad_actual(self.disponibilidad), self.capacidad_actual(otra)), (0, 0))
+
+    def test_horario_lleno_por_retenciones_vencidas_acepta_reservas(self):
+        self.retencion_vencida(self.disponibilidad, 5)
+
+        self.client.post(reverse('guardar_reserva'), datos_reserva(self.disponibilidad, self.tipo_visita, acompanantes=1))
+
+        self.assertEqual(Reserva.objects.count(), 1)
+        self.assertEqual(self.capacidad_actual(self.disponibilidad), 2)
+
+    def test_cambio_de_horario_libera_retenciones_vencidas(self):
+        reserva = crear_reserva(crear_disponibilidad(hora=10, capacidad_maxima=5, capacidad_actual=3), self.tipo_visita, 1)
+        self.retencion_vencida(self.disponibilidad, 5)
+        self.client.force_login(User.objects.create_user('admin', password='clave-segura', is_staff=True))
+
+        self.client.post(
+            reverse('guardar_modificacion_reserva', args=[reserva.idReserva]),
+            {'hora': self.disponibilidad.id, 'tipoVisita': self.tipo_visita.nombre}
+        )
+
+        reserva.refresh_from_db()
+        self.assertEqual(reserva.disponibilidad_id, self.disponibilidad.id)
+        self.assertFalse(RetencionCupo.objects.exists())
+        self.assertEqual(self.capacidad_actual(self.disponibilidad), 3)
+
+    def test_comando_libera_las_vencidas(self):
+        self.retencion_vencida(self.disponibilidad, 2)
+        vigente = self.retener(self.disponibilidad, 1).json()['retencion']
+        self.retencion_vencida(self.disponibilidad, 1)
+
+        salida = StringIO()
+        call_command('liberar_retenciones', stdout=salida)
+
+        self.assertIn('1 retenciones vencidas liberadas', salida.getvalue())
+        self.assertEqual(list(RetencionCupo.objects.values_list('token', flat=True)), [vigente])
+        self.assertEqual(self.capacidad_actual(self.disponibilidad), 1)
+
+    @override_settings(RETENCION_MAX_POR_CLIENTE=6)
+    def test_limite_de_cupos_retenidos_por_cliente(self):
+        otra = crear_disponibilidad(hora=10, capacidad_maxima=5)
+        token = self.retener(self.disponibilidad, 4).json()['retencion']
+
+        response = self.retener(otra, 3)
+        self.assertEqual(response.status_code, 429)
+        self.assertFalse(RetencionCupo.objects.filter(disponibilidad=otra).exists())
+        # Reemplazar la propia retención no cuenta contra el límite
+        self.assertEqual(self.retener(otra, 5, token).status_code, 200)
+        # Otra IP tiene su propio límite
+        response = self.client.post(reverse('retener_cupos'), {
+            'hora': self.disponibilidad.id, 'cantidadVisitantes': 5
+        }, REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(ADMISION_CONCURRENCIA_HORARIO=1)
+    def test_horario_saturado_responde_429_sin_retener(self):
+        cache.set(f'{CLAVE_EN_CURSO}:{self.disponibilidad.id}', 1)
+
+        with CaptureQueriesContext(connection) as contexto:
+            response = self.retener(self.disponibilidad, 2)
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], str(response.json()['reintentar']))
+        self.assertEqual(contexto.captured_queries, [])
+        self.assertEqual(self.capacidad_actual(self.disponibilidad), 0)
+
+class DisponibilidadFormTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tipo_visita = TipoVisita.objects.create(nombre='Familiar', descripcion='Visita familiar')
+        self.disponibilidad = crear_disponibilidad(capacidad_maxima=20)
+
+    def test_excluye_horarios_pasados_y_fuera_de_ventana(self):
+        crear_disponibilidad(fecha=datetime.date.today() - datetime.timedelta(days=1))
+        crear_disponibilidad(fecha=datetime.date.today() + datetime.timedelta(days=365))
+
+        response = self.client.get(reverse('form'))
+
+        self.assertEqual([d['id'] for d in response.context['form']], [self.disponibilidad.id])
+        self.assertEqual(response.context['form'][0]['cupos_disponibles'], 20)
+
+    def test_cargas_repetidas_no_consultan_la_base_de_datos(self):
+        self.client.get(reverse('form'))
+        with self.assertNumQueries(0):
+            self.client.get(reverse('form'))
+
+    def test_reserva_invalida_la_cache(self):
+        self.client.get(reverse('form'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('guardar_reserva'), datos_reserva(self.disponibilidad, self.tipo_visita, acompanantes=2))
+
+        response = self.client.get(reverse('form'))
+        self.assertEqual(response.context['form'][0]['cupos_disponibles'], 17)
+        self.assertContains(response, '(Cupos: 17)')
+        self.assertNotContains(response, '(Cupos: 20)')
+
+    def test_fragmentos_se_sirven_desde_la_cache(self):
+        self.client.get(reverse('form'))
+        # Un cambio sin invalidar la versión no se ve: el listado sale del fragmento guardado
+        DisponibilidadParque.objects.filter(pk=self.disponibilidad.pk).update(capacidadMaxima=50)
+        TipoVisita.objects.create(nombre='Legal', descripcion='Visita de abogado')
+
+        response = self.client.get(reverse('form'))
+
+        self.assertContains(response, '(Cupos: 20)')
+        self.assertNotContains(response, 'Legal')
+
+
+class ApiDisponibilidadTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tipo_visita = TipoVisita.objects.create(nombre='Familiar', descripcion='Visita familiar')
+        self.disponibilidad = crear_disponibilidad(capacidad_maxima=20, capacidad_actual=5)
+
+    def test_json_con_cupos_y_cabeceras(self):
+        response = self.client.get(reverse('api_disponibilidad'))
+
+        self.assertEqual(response.status_code, 200)
+        horario = response.json()['horarios'][0]
+        self.assertEqual((horario['id'], horario['cuposDisponibles']), (self.disponibilidad.id, 15))
+        self.assertTrue(response.has_header('ETag'))
+        self.assertIn('max-age=10', response['Cache-Control'])
+
+    def test_misma_version_responde_304_sin_consultas(self):
+        etag = self.client.get(reverse('api_disponibilidad'))['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('api_disponibilidad'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertIn('max-age=10', response['Cache-Control'])
+
+    def test_reserva_cambia_el_etag(self):
+        etag = self.client.get(reverse('api_disponibilidad'))['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('guardar_reserva'), datos_reserva(self.disponibilidad, self.tipo_visita, acompanantes=2))
+
+        response = self.client.get(reverse('api_disponibilidad'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['horarios'][0]['cuposDisponibles'], 12)
+
+    def test_rango_de_fechas(self):
+        lejana = crear_disponibilidad(fecha=datetime.date.today() + datetime.timedelta(days=200))
+        response = self.client.get(reverse('api_disponibilidad'), {'desde': lejana.fecha.isoformat()})
+        self.assertEqual([h['id'] for h in response.json()['horarios']], [lejana.id])
+
+        for params in [{'desde': 'mañana'}, {'desde': '2030-02-01', 'hasta': '2030-01-01'}, {'desde': '2030-01-01', 'hasta': '2031-01-01'}]:
+            self.assertEqual(self.client.get(reverse('api_disponibilidad'), params).status_code, 400)
+
+
+class OcupacionDiariaTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user('admin', password='clave-segura', is_staff=True)
+        self.client.force_login(self.admin)
+        self.familiar = TipoVisita.objects.create(nombre='Familiar', descripcion='Visita familiar')
+        self.escolar = TipoVisita.objects.create(nombre='Escolar', descripcion='Visita escolar')
+        self.manana = crear_disponibilidad(capacidad_maxima=10)
+        self.pasado = crear_disponibilidad(fecha=self.manana.fecha + datetime.timedelta(days=1), capacidad_maxima=10)
+
+    def ocupacion(self, disponibilidad, tipo_visita):
+        fila = OcupacionDiaria.objects.filter(fecha=disponibilidad.fecha, tipoVisita=tipo_visita).first()
+        return (fila.totalReservas, fila.totalVisitantes) if fila else (0, 0)
+
+    def test_resumen_sigue_creacion_modificacion_y_estado(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('guardar_reserva'), datos_reserva(self.manana, self.familiar, acompanantes=2))
+        reserva = Reserva.objects.get()
+        self.assertEqual(self.ocupacion(self.manana, self.familiar), (1, 3))
+        self.assertEqual(CapacidadDiaria.objects.get(fecha=self.manana.fecha).capacidadMaxima, 10)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse('guardar_modificacion_reserva', args=[reserva.idReserva]),
+                {'hora': self.pasado.id, 'tipoVisita': self.escolar.nombre}
+            )
+        self.assertEqual(self.ocupacion(self.manana, self.familiar), (0, 0))
+        self.assertEqual(self.ocupacion(self.pasado, self.escolar), (1, 3))
+
+        reserva.refresh_from_db()
+        reserva.estadoReserva = Reserva.Estado.VENCIDO
+        with self.captureOnCommitCallbacks(execute=True):
+            reserva.save()
+        self.assertEqual(self.ocupacion(self.pasado, self.escolar), (0, 0))
+
+    def test_dashboard_lee_solo_el_resumen(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for numero in range(3):
+                crear_reserva(self.manana, self.familiar, numero, acompanantes=2)
+
+        with CaptureQueriesContext(connection) as contexto:
+            response = self.client.get(reverse('dashboard_monitoreo'), {'tipo_visita': 'Familiar'})
+
+        consultas = ' '.join(q['sql'] for q in contexto.captured_queries)
+        self.assertNotIn('"reserva"', consultas)
+        self.assertEqual(response.context['total_reservas'], 3)
+        self.assertEqual(response.context['total_visitantes'], 9)
+        self.assertEqual(response.context['porcentaje_ocupacion'], 45)
+        self.assertEqual(list(response.context['top_fechas']), [{'fecha': self.manana.fecha, 'count': 9}])
+
+    def test_comando_reconstruye_y_verifica(self):
+        for numero in range(4):
+            crear_reserva(self.manana if numero % 2 else self.pasado, self.familiar, numero, acompanantes=1)
+        OcupacionDiaria.objects.all().delete()
+        CapacidadDiaria.objects.all().delete()
+
+        with self.assertRaises(CommandError):
+            call_command('reconstruir_ocupacion', '--solo-verificar', stdout=StringIO(), stderr=StringIO())
+
+        call_command('reconstruir_ocupacion', stdout=StringIO())
+        self.assertEqual(self.ocupacion(self.manana, self.familiar), (2, 4))
+        self.assertEqual(self.ocupacion(self.pasado, self.familiar), (2, 4))
+        self.assertEqual(CapacidadDiaria.objects.count(), 2)
+
+
+def planes_con_recorrido_completo(queryset, *tablas):
+    # Devuelve las tablas que el plan de ejecución recorre completas, sin usar un índice
+    if connection.vendor == 'mysql':
+        plan = json.loads(queryset.explain(format='json'))
+        recorridos = []
+
+        def visitar(nodo):
+            if isinstance(nodo, dict):
+                if nodo.get('access_type') == 'ALL':
+                    recorridos.append(nodo.get('table_name'))
+                for valor in nodo.values():
+                    visitar(valor)
+            elif isinstance(nodo, list):
+                for valor in nodo:
+                    visitar(valor)
+
+        visitar(plan)
+        return [tabla for tabla in recorridos if tabla in tablas]
+
+    plan = queryset.explain()
+    return [
+        tabla for tabla in tablas
+        for linea in plan.splitlines()
+        if linea.rstrip().endswith(f'SCAN {tabla}')
+    ]
+
+
+class IndicesConsultasTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        tipo_visita = TipoVisita.objects.create(nombre='Familiar', descripcion='Visita familiar')
+        for dia in range(5):
+            disponibilidad = crear_disponibilidad(
+                fecha=datetime.date.today() + datetime.timedelta(days=dia), capacidad_maxima=1000
+            )
+            for numero in range(20):
+                crear_reserva(disponibilidad, tipo_visita, dia * 100 + numero, acompanantes=1)
+        # Distribución de temporada: la mayoría de las reservas ya fueron usadas o vencieron
+        Reserva.objects.filter(idReserva__in=Reserva.objects.order_by('idReserva').values('idReserva')[:60]).update(
+            estadoReserva=Reserva.Estado.VENCIDO
+        )
+        with connection.cursor() as cursor:
+            if connection.vendor == 'mysql':
+                # En MySQL ANALYZE necesita la lista de tablas
+                tablas = [modelo._meta.db_table for modelo in (Reserva, Acompañante, Visitante, DisponibilidadParque, OcupacionDiaria)]
+                cursor.execute('ANALYZE TABLE ' + ', '.join(connection.ops.quote_name(tabla) for tabla in tablas))
+                cursor.fetchall()
+            else:
+                cursor.execute('ANALYZE')
+
+    def assertUsaIndices(self, queryset, *tablas):
+        self.assertEqual(planes_con_recorrido_completo(queryset, *tablas), [], queryset.explain())
+
+    def test_validar_reserva_por_estado(self):
+        self.assertUsaIndices(consultar_reservas(estado=Reserva.Estado.ACTIVO)[:10], 'reserva')
+
+    def test_validar_reserva_por_fecha(self):
+        self.assertUsaIndices(consultar_reservas(fecha=datetime.date.today()), 'reserva', 'disponibilidadParque')
+
+    def test_acompanantes_de_la_pagina(self):
+        # La misma consulta que arma validarReserva para la página
+        reservas = list(consultar_reservas()[:10])
+        self.assertUsaIndices(acompanantes_de(reservas), 'acompañante')
+
+    def test_visitante_por_rut(self):
+        self.assertUsaIndices(Visitante.objects.filter(rut='10000001-1'), 'visitante')
+        self.assertUsaIndices(Visitante.objects.filter(rutNormalizado='10000001-1'), 'visitante')
+
+    def test_ocupacion_por_rango_de_fechas(self):
+        hoy = datetime.date.today()
+        self.assertUsaIndices(
+            OcupacionDiaria.objects.filter(fecha__gte=hoy, fecha__lte=hoy + datetime.timedelta(days=2)),
+            'ocupacionDiaria'
+        )
+        self.assertUsaIndices(
+            Reserva.objects.filter(
+                estadoReserva__in=[Reserva.Estado.ACTIVO, Reserva.Estado.UTILIZADO],
+                disponibilidad__fecha__gte=hoy,
+                disponibilidad__fecha__lte=hoy + datetime.timedelta(days=2)
+            ),
+            'reserva'
+        )
+
+
+@override_settings(NOTIFICACIONES_TAMANO_LOTE=1000, NOTIFICACIONES_INTERVALO=3600)
+class NotificacionesTests(TestCase):
+    def setUp(self):
+        buffer_notificaciones.pendientes.clear()
+        self.tipo_visita = TipoVisita.objects.create(nombre='Familiar', descripcion='Visita familiar')
+        self.disponibilidad = crear_disponibilidad(capacidad_maxima=100)
+
+    def test_reserva_no_escribe_notificacion_en_la_peticion(self):
+        with CaptureQueriesContext(connection) as contexto, self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('guardar_reserva'), datos_reserva(self.disponibilidad, self.tipo_visita))
+
+        self.assertFalse(any('sistemaNotificaciones' in q['sql'] for q in contexto.captured_queries))
+        self.assertEqual(len(buffer_notificaciones.pendientes), 1)
+
+    def test_reserva_rechazada_no_encola(self):
+        self.disponibilidad.capacidadActual = 100
+        self.disponibilidad.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('guardar_reserva'), datos_reserva(self.disponibilidad, self.tipo_visita))
+        self.assertEqual(buffer_notificaciones.pendientes, [])
+
+    def test_rafaga_se_escribe_en_un_solo_insert(self):
+        for numero in range(25):
+            buffer_notificaciones.agregar('Reserva Creada', f'Reserva {numero}')
+
+        with self.assertNumQueries(1):
+            self.assertEqual(buffer_notificaciones.vaciar(), 25)
+        self.assertEqual(SistemaNotificaciones.objects.count(), 25)
+
+    @override_settings(NOTIFICACIONES_TAMANO_LOTE=3)
+    def test_lote_lleno_se_vacia_al_terminar_la_peticion(self):
+        for numero in range(3):
+            buffer_notificaciones.agregar('Reserva Creada', f'Reserva {numero}')
+        self.client.get(reverse('inicio'))
+        self.assertEqual(SistemaNotificaciones.objects.count(), 3)
+
+    def test_comando_vacia_el_outbox(self):
+        with tempfile.TemporaryDirectory() as directorio, override_settings(NOTIFICACIONES_OUTBOX_DIR=directorio):
+            guardar_en_outbox([
+                {'fechaEnvio': '2025-01-01', 'tipo': 'Reserva Creada', 'mensaje': f'Reserva {numero}'}
+                for numero in range(4)
+            ])
+            call_command('vaciar_notificaciones', stdout=StringIO())
+            call_command('vaciar_notificaciones', stdout=StringIO())
+
+        self.assertEqual(SistemaNotificaciones.objects.count(), 4)
+
+    def test_vaciado_fallido_se_reintenta(self):
+        lote = lambda nombre, cantidad: [
+            {'fechaEnvio': '2025-01-01', 'tipo': 'Reserva Creada', 'mensaje': f'{nombre} {numero}'}
+            for numero in range(cantidad)
+        ]
+        with tempfile.TemporaryDirectory() as directorio, override_settings(NOTIFICACIONES_OUTBOX_DIR=directorio):
+            guardar_en_outbox(lote('lote1', 3))
+            with unittest.mock.patch('ReservaSystemApp.notificaciones.escribir_notificaciones', side_effect=DatabaseError('caída')):
+                with self.assertRaises(CommandError):
+                    call_command('vaciar_notificaciones', stdout=StringIO())
+            self.assertEqual(len(os.listdir(directorio)), 1)
+
+            # El mismo proceso vuelve a usar el outbox: el archivo pendiente no se pisa
+            guardar_en_outbox(lote('lote2', 1))
+            call_command('vaciar_notificaciones', stdout=StringIO())
+            self.assertEqual(os.listdir(directorio), [])
+
+        self.assertEqual(SistemaNotificaciones.objects.count(), 4)
+
+
+class AlertasCapacidadTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', password='clave-segura', is_staff=True)
+        self.client.force_login(self.admin)
+        self.lleno = crear_disponibilidad(hora=9, capacidad_maxima=10, capacidad_actual=9)
+        self.libre = crear_disponibilidad(hora=10, capacidad_maxima=10, capacidad_actual=1)
+        self.dia_lleno = crear_disponibilidad(
+            fecha=self.lleno.fecha + datetime.timedelta(days=1), capacidad_maxima=10, capacidad_actual=10
+        )
+
+    def test_evaluador_registra_cada_alerta_una_sola_vez(self):
+        call_command('evaluar_alertas', stdout=StringIO())
+        call_command('evaluar_alertas', stdout=StringIO())
+
+        alertas = set(AlertaCapacidad.objects.values_list('alcance', 'referencia'))
+        self.assertEqual(alertas, {
+            ('HORARIO', str(self.lleno.id)),
+            ('HORARIO', str(self.dia_lleno.id)),
+            ('DIA', self.dia_lleno.fecha.isoformat()),
+        })
+        self.assertEqual(SistemaNotificaciones.objects.filter(tipo='ALERTA DE CAPACIDAD').count(), 3)
+
+    def test_cupos_retenidos_no_generan_alertas(self):
+        libre = crear_disponibilidad(hora=11, capacidad_maxima=10, capacidad_actual=9)
+        RetencionCupo.objects.create(
+            token='retenida', disponibilidad=libre, cantidadVisitantes=8,
+            expira=timezone.now() + datetime.timedelta(minutes=5)
+        )
+
+        call_command('evaluar_alertas', stdout=StringIO())
+
+        self.assertFalse(AlertaCapacidad.objects.filter(referencia=str(libre.id)).exists())
+        self.assertEqual(AlertaCapacidad.objects.get(referencia=str(self.lleno.id)).porcentaje, 90)
+
+    def test_dashboard_no_escribe(self):
+        OcupacionDiaria.objects.create(fecha=self.lleno.fecha, totalReservas=1, totalVisitantes=25)
+
+        with CaptureQueriesContext(connection) as contexto:
+            response = self.client.get(reverse('dashboard_monitoreo'))
+
+        self.assertTrue(response.context['alertas'])
+        self.assertFalse([q for q in contexto.captured_queries if q['sql'].startswith(('INSERT', 'UPDATE'))])
+
+
+class PronosticoOcupacionTests(TestCase):
+    def setUp(self):
+        self.familiar = TipoVisita.objects.create(nombre='Familiar', descripcion='Visita familiar')
+        self.escolar = TipoVisita.objects.create(nombre='Escolar', descripcion='Visita escolar')
+        self.hoy = timezone.localdate()
+        self.numero = 0
+
+        # Cuatro semanas de historia en la misma franja: 4 visitantes con 10 días de
+        # anticipación y 6 el día anterior; 2 escolares sin fecha de creación
+        for semana in range(1, 5):
+            pasado = crear_disponibilidad(fecha=self.hoy - datetime.timedelta(weeks=semana), capacidad_maxima=10)
+            self.reservar(pasado, self.familiar, 4, dias_antes=10)
+            self.reservar(pasado, self.familiar, 6, dias_antes=1)
+            self.reservar(pasado, self.escolar, 2, dias_antes=None)
+
+        self.proximo = crear_disponibilidad(fecha=self.hoy + datetime.timedelta(weeks=1), capacidad_maxima=10)
+        self.reservar(self.proximo, self.familiar, 3, dias_antes=8)
+        self.lejano = crear_disponibilidad(fecha=self.hoy + datetime.timedelta(weeks=2), capacidad_maxima=20)
+        self.sin_historia = crear_disponibilidad(fecha=self.hoy + datetime.timedelta(weeks=1), hora=15, capacidad_maxima=10)
+        self.reservar(self.sin_historia, self.escolar, 2, dias_antes=3)
+
+    def reservar(self, disponibilidad, tipo_visita, visitantes, dias_antes):
+        self.numero += 1
+        reserva = crear_reserva(disponibilidad, tipo_visita, self.numero, acompanantes=visitantes - 1)
+        creada = None
+        if dias_antes is not None:
+            creada = timezone.make_aware(datetime.datetime.combine(
+                disponibilidad.fecha - datetime.timedelta(days=dias_antes), datetime.time(12, 0)
+            ))
+        Reserva.objects.filter(pk=reserva.pk).update(fechaCreacion=creada)
+
+    def test_proyecta_con_la_curva_de_su_franja(self):
+        with self.assertNumQueries(2):
+            pronostico = pronosticar_ocupacion()
+
+        por_id = {horario['id']: horario for horario in pronostico}
+        self.assertEqual([horario['id'] for horario in pronostico], [self.proximo.id, self.sin_historia.id, self.lejano.id])
+
+        # A 7 días de la visita faltaban en promedio los 6 visitantes del último día
+        proximo = por_id[self.proximo.id]
+        self.assertEqual((proximo['reservados'], proximo['demanda'], proximo['porcentaje']), (3, 9.0, 90))
+        self.assertEqual(proximo['por_tipo'], {self.familiar.id: 9.0, self.escolar.id: 0.0})
+
+        # A 14 días aún no llegaba nadie: se espera el total de la franja
+        self.assertEqual((por_id[self.lejano.id]['demanda'], por_id[self.lejano.id]['porcentaje']), (10.0, 50))
+        self.assertEqual(por_id[self.sin_historia.id]['demanda'], 2.0)
+
+    def test_comando_alimenta_el_dashboard(self):
+        with tempfile.TemporaryDirectory() as directorio:
+            ruta = os.path.join(directorio, 'pronostico.csv')
+            salida = StringIO()
+            call_command('pronosticar_ocupacion', '--csv', ruta, stdout=salida)
+            with open(ruta, encoding='utf-8') as archivo:
+                filas = list(csv.DictReader(archivo))
+
+        self.assertIn('3 horarios pronosticados', salida.getvalue())
+        self.assertEqual(filas[0]['Familiar'], '9.0')
+        self.assertEqual(filas[0]['porcentaje'], '90')
+
+        self.client.force_login(User.objects.create_user('admin', password='clave-segura', is_staff=True))
+        response = self.client.get(reverse('dashboard_monitoreo'))
+        en_riesgo = list(response.context['horarios_en_riesgo'])
+        self.assertEqual([(h['disponibilidad__fecha'], h['porcentaje']) for h in en_riesgo], [(self.proximo.fecha, 90)])
+        self.assertContains(response, '90%')
+
+        # Recalcular reemplaza el pronóstico anterior
+        call_command('pronosticar_ocupacion', stdout=StringIO())
+        self.assertEqual(PronosticoHorario.objects.count(), 3)
+
+
+class GenerarHorariosTests(TestCase):
+    def generar(self, *argumentos):
+        salida = StringIO()
+        call_command(
+            'generar_horarios', '--desde', '2030-01-01', '--hasta', '2030-12-31',
+            '--dias', 'mar,mie,jue,vie,sab,dom', '--apertura', '09:00', '--cierre', '17:00',
+            '--duracion', '120', '--capacidad', '50', *argumentos, stdout=salida
+        )
+        return salida.getvalue()
+
+    def test_genera_un_ano_de_horarios(self):
+        inicio = time.perf_counter()
+        self.generar('--cerrado', '2030-12-25', '--cerrado', '2030-01-01')
+        self.assertLess(time.perf_counter() - inicio, 10)
+
+        # 2030 tiene 52 lunes; se cierran además dos días que no son lunes
+        dias_abiertos = 365 - 52 - 2
+        self.assertEqual(DisponibilidadParque.objects.count(), dias_abiertos * 4)
+        self.assertFalse(DisponibilidadParque.objects.filter(fecha=datetime.date(2030, 12, 25)).exists())
+        self.assertEqual(CapacidadDiaria.objects.count(), dias_abiertos)
+        self.assertEqual(CapacidadDiaria.objects.get(fecha=datetime.date(2030, 1, 2)).capacidadMaxima, 200)
+
+        horas = DisponibilidadParque.objects.filter(fecha=datetime.date(2030, 1, 2)).order_by('horaInicio')
+        self.assertEqual(
+            [(h.horaInicio, h.horaFin) for h in horas],
+            [(datetime.time(h), datetime.time(h + 2)) for h in (9, 11, 13, 15)]
+        )
+
+    def test_volver_a_generar_no_duplica(self):
+        self.generar()
+        total = DisponibilidadParque.objects.count()
+        salida = self.generar()
+
+        self.assertEqual(DisponibilidadParque.objects.count(), total)
+        self.assertIn('0 horarios creados', salida)
+
+
+class VencerReservasTests(TestCase):
+    def setUp(self):
+        self.tipo_visita = TipoVisita.objects.create(nombre='Familiar', descripcion='Visita familiar')
+        self.ayer = crear_disponibilidad(fecha=datetime.date.today() - datetime.timedelta(days=1), capacidad_maxima=100)
+        self.manana = crear_disponibilidad(capacidad_maxima=100)
+
+    def test_vence_solo_reservas_activas_de_horarios_pasados(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            pasadas = [crear_reserva(self.ayer, self.tipo_visita, numero, acompanantes=1) for numero in range(7)]
+            usada = crear_reserva(self.ayer, self.tipo_visita, 50)
+            usada.estadoReserva = Reserva.Estado.UTILIZADO
+            usada.save()
+            futura = crear_reserva(self.manana, self.tipo_visita, 60)
+
+        salida = StringIO()
+        call_command('vencer_reservas', '--lote', '3', stdout=salida)
+
+        self.assertIn('7 reservas marcadas como vencidas', salida.getvalue())
+        self.assertEqual(
+            Reserva.objects.filter(estadoReserva=Reserva.Estado.VENCIDO).count(), len(pasadas)
+        )
+        usada.refresh_from_db()
+        futura.refresh_from_db()
+        self.assertEqual(usada.estadoReserva, Reserva.Estado.UTILIZADO)
+        self.assertEqual(futura.estadoReserva, Reserva.Estado.ACTIVO)
+
+        fila = OcupacionDiaria.objects.get(fecha=self.ayer.fecha)
+        self.assertEqual((fila.totalReservas, fila.totalVisitantes), (1, usada.cantidadVisitantes))
+
+    def test_volver_a_ejecutar_no_cambia_nada(self):
+        crear_reserva(self.ayer, self.tipo_visita, 1)
+        call_command('vencer_reservas', stdout=StringIO())
+
+        salida = StringIO()
+        with self.assertNumQueries(1):
+            call_command('vencer_reservas', stdout=salida)
+        self.assertIn('0 reservas', salida.getvalue())
+
+
+class DocumentosAccesoTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        configuracion = override_settings(MEDIA_ROOT=self.media.name)
+        configuracion.enable()
+        self.addCleanup(configuracion.disable)
+        self.tipo_visita = TipoVisita.objects.create(nombre='Familiar', descripcion='Visita familiar')
+        self.disponibilidad = crear_disponibilidad(capacidad_maxima=100)
+        self.reservas = [crear_reserva(self.disponibilidad, self.tipo_visita, numero) for numero in range(5)]
+
+    def generar(self, *argumentos, fecha=None):
+        salida = StringIO()
+        # Los PNG se escriben al confirmar los documentos
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('generar_documentos', '--fecha', (fecha or self.disponibilidad.fecha).isoformat(), *argumentos, stdout=salida)
+        return salida.getvalue()
+
+    def test_genera_un_documento_firmado_por_reserva(self):
+        self.assertIn('5 documentos generados', self.generar('--procesos', '0', '--lote', '2'))
+        self.assertIn('0 documentos generados', self.generar('--procesos', '0'))
+
+        for reserva in self.reservas:
+            documento = DocumentoAcceso.objects.get(reserva=reserva)
+            with documento.codigoQR.open('rb') as imagen:
+                self.assertEqual(imagen.read(8), b'\x89PNG\r\n\x1a\n')
+            with self.assertNumQueries(0):
+                datos = verificar_token(documento.token)
+            self.assertEqual(datos['reserva_id'], reserva.idReserva)
+            self.assertEqual(datos['disponibilidad_id'], self.disponibilidad.id)
+
+    def test_pool_de_procesos(self):
+        self.assertIn('5 documentos generados', self.generar('--procesos', '2'))
+
+    def archivos_qr(self):
+        return sorted(os.listdir(os.path.join(self.media.name, 'qr')))
+
+    def archivos_de_documentos(self):
+        return sorted(os.path.basename(nombre) for nombre in DocumentoAcceso.objects.values_list('codigoQR', flat=True))
+
+    def test_lote_ya_reclamado_no_escribe_otro_png(self):
+        lote = list(reservas_sin_documento(self.disponibilidad.fecha))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(generar_documentos(lote), 5)
+        tokens = dict(DocumentoAcceso.objects.values_list('reserva_id', 'token'))
+
+        # Otro proceso leyó el mismo lote antes de que se insertara
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(generar_documentos(lote), 0)
+
+        self.assertEqual(dict(DocumentoAcceso.objects.values_list('reserva_id', 'token')), tokens)
+        self.assertEqual(self.archivos_qr(), self.archivos_de_documentos())
+
+    def test_sin_confirmar_no_escribe_archivos(self):
+        lote = list(reservas_sin_documento(self.disponibilidad.fecha))
+        with self.captureOnCommitCallbacks(execute=False):
+            generar_documentos(lote)
+        self.assertFalse(os.path.exists(os.path.join(self.media.name, 'qr')))
+
+    def test_fallo_al_escribir_devuelve_la_reserva_a_pendientes(self):
+        lote = list(reservas_sin_documento(self.disponibilidad.fecha))
+        guardar = default_storage.save
+        escritos = []
+
+        def guardar_dos(nombre, contenido):
+            if len(escritos) == 2:
+                raise OSError('disco lleno')
+            escritos.append(nombre)
+            return guardar(nombre, contenido)
+
+        with unittest.mock.patch.object(default_storage, 'save', side_effect=guardar_dos):
+            with self.assertRaises(OSError), self.captureOnCommitCallbacks(execute=True):
+                generar_documentos(lote)
+
+        self.assertEqual(DocumentoAcceso.objects.count(), 2)
+        self.assertEqual(self.archivos_qr(), self.archivos_de_documentos())
+        self.assertIn('3 documentos generados', self.generar('--procesos', '0'))
+
+    def mover(self, reserva, disponibilidad):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse('guardar_modificacion_reserva', args=[reserva.idReserva]),
+                {'hora': disponibilidad.id, 'tipoVisita': self.tipo_visita.nombre}
+            )
+
+    def test_cambio_de_horario_descarta_el_documento(self):
+        self.client.force_login(User.objects.create_user('admin', password='clave-segura', is_staff=True))
+        self.generar('--procesos', '0')
+        reserva = self.reservas[0]
+        anterior = DocumentoAcceso.objects.get(reserva=reserva).token
+        hoy = crear_disponibilidad(fecha=datetime.date.today(), capacidad_maxima=100)
+
+        # El QR no se genera en la petición
+        with unittest.mock.patch('ReservaSystemApp.documentos.generar_png') as generar_png:
+            self.mover(reserva, hoy)
+        generar_png.assert_not_called()
+        self.assertFalse(DocumentoAcceso.objects.filter(reserva=reserva).exists())
+        self.assertEqual(len(self.archivos_qr()), 4)
+        self.assertEqual(registrar_ingreso(anterior, self.disponibilidad.fecha), (reserva.idReserva, 'HORARIO_CAMBIADO'))
+
+        self.generar('--procesos', '0', fecha=hoy.fecha)
+        documento = DocumentoAcceso.objects.get(reserva=reserva)
+        self.assertEqual(verificar_token(documento.token)['disponibilidad_id'], hoy.id)
+        self.assertEqual(len(self.archivos_qr()), 5)
+        self.assertEqual(registrar_ingreso(documento.token, hoy.fecha), (reserva.idReserva, None))
+
+    def test_cambio_revertido_conserva_el_documento(self):
+        self.client.force_login(User.objects.create_user('admin', password='clave-segura', is_staff=True))
+        self.generar('--procesos', '0')
+        reserva = self.reservas[0]
+        documento = DocumentoAcceso.objects.get(reserva=reserva)
+        lleno = crear_disponibilidad(hora=11, capacidad_maxima=1, capacidad_actual=1)
+
+        self.mover(reserva, lleno)
+
+        self.assertEqual(DocumentoAcceso.objects.get(reserva=reserva).token, documento.token)
+        self.assertTrue(documento.codigoQR.storage.exists(documento.codigoQR.name))
+
+    def test_token_alterado_es_rechazado(self):
+        self.generar('--procesos', '0')
+        token = DocumentoAcceso.objects.first().token
+        with self.assertRaises(signing.BadSignature):
+            verificar_token(token[:-2] + ('AA' if not token.endswith('AA') else 'BB'))
+
+
+class IngresoAccesoTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user('portero', password='clave-segura', is_staff=True)
+        self.client.force_login(self.admin)
+        self.tipo_visita = TipoVisita.objects.create(nombre='Familiar', descripcion='Visita familiar')
+        self.hoy = crear_disponibilidad(fecha=datetime.date.today(), capacidad_maxima=100)
+        self.reservas = [crear_reserva(self.hoy, self.tipo_visita, numero) for numero in range(3)]
+
+    def token(self, reserva):
+        return firmar_token(reserva.idReserva, reserva.disponibilidad_id, reserva.disponibilidad.fecha)
+
+    def test_ingreso_en_un_solo_update(self):
+        token = self.token(self.reservas[0])
+        with CaptureQueriesContext(connection) as contexto:
+            response = self.client.post(reverse('registrar_ingreso'), {'token': token})
+
+        self.assertEqual(response.json(), {'aceptado': True, 'reserva': self.reservas[0].idReserva})
+        escrituras = [q['sql'] for q in contexto.captured_queries if 'reserva' in q['sql'] and not q['sql'].startswith('SELECT')]
+        self.assertEqual(len(escrituras), 1)
+        self.reservas[0].refresh_from_db()
+        self.assertEqual(self.reservas[0].estadoReserva, Reserva.Estado.UTILIZADO)
+
+        response = self.client.post(reverse('registrar_ingreso'), {'token': token})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['motivo'], 'UTILIZADO')
+
+    def test_rechaza_token_alterado_y_de_otro_dia(self):
+        response = self.client.post(reverse('registrar_ingreso'), {'token': 'no-es-un-token'})
+        self.assertEqual(response.json()['motivo'], 'TOKEN_INVALIDO')
+
+        otro_dia = firmar_token(self.reservas[1].idReserva, self.hoy.id, self.hoy.fecha + datetime.timedelta(days=1))
+        response = self.client.post(reverse('registrar_ingreso'), {'token': otro_dia})
+        self.assertEqual(response.json()['motivo'], 'FECHA_INCORRECTA')
+
+    def test_manifiesto_y_sincronizacion(self):
+        response = self.client.get(reverse('manifiesto_acceso', args=[self.hoy.fecha]))
+        manifiesto = response.json()
+        self.assertEqual(
+            manifiesto['reservas'],
+            [[r.idReserva, self.hoy.id, r.cantidadVisitantes, None] for r in self.reservas]
+        )
+
+        ingresos = [self.reservas[0].idReserva, self.reservas[1].idReserva, 999999]
+        response = self.client.post(
+            reverse('sincronizar_ingresos', args=[self.hoy.fecha]),
+            json.dumps({'ingresos': ingresos}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.json(), {'aceptadas': sorted(ingresos[:2]), 'rechazadas': [999999]})
+        self.assertEqual(Reserva.objects.filter(estadoReserva=Reserva.Estado.UTILIZADO).count(), 2)
+
+    def test_validacion_sin_conexion_con_el_manifiesto(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        with override_settings(MEDIA_ROOT=media.name):
+            generar_documentos(list(reservas_sin_documento(self.hoy.fecha)))
+        vigente = DocumentoAcceso.objects.get(reserva=self.reservas[0]).token
+        manifiesto = self.client.get(reverse('manifiesto_acceso', args=[self.hoy.fecha])).json()
+
+        self.assertEqual(validar_sin_conexion(vigente, manifiesto), (self.reservas[0].idReserva, None))
+        self.assertEqual(
+            validar_sin_conexion(vigente, manifiesto, registradas={self.reservas[0].idReserva}),
+            (self.reservas[0].idReserva, 'UTILIZADO')
+        )
+        # Bien firmado pero no es el documento vigente de la reserva
+        reemplazado = self.token(self.reservas[0])
+        self.assertEqual(validar_sin_conexion(reemplazado, manifiesto), (None, 'NO_EN_MANIFIESTO'))
+        self.assertEqual(validar_sin_conexion('no-es-un-token', manifiesto), (None, 'NO_EN_MANIFIESTO'))
+
+
+class VisitantePorRutTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', password='clave-segura', is_staff=True)
+        self.tipo_visita = TipoVisita.objects.create(nombre='Familiar', descripcion='Visita familiar')
+        self.disponibilidad = crear_disponibilidad(capacidad_maxima=100)
+
+    def test_normalizar_rut(self):
+        for rut in ['12.345.678-5', '12345678-5', '123456785', ' 12345678 - 5 ']:
+            self.assertEqual(normalizar_rut(rut), '12345678-5')
+        self.assertEqual(normalizar_rut('10.000.013-k'), '10000013-K')
+        for rut in ['12345678-4', 'abc', '', None]:
+            with self.assertRaises(ValueError):
+                normalizar_rut(rut)
+
+    def test_visitante_que_vuelve_no_se_duplica(self):
+        primera = datos_reserva(self.disponibilidad, self.tipo_visita, 1, acompanantes=1)
+        primera['rut'] = '12.345.678-5'
+        segunda = datos_reserva(self.disponibilidad, self.tipo_visita, 2, acompanantes=2)
+        segunda['rut'] = '12345678-5'
+        self.client.post(reverse('guardar_reserva'), primera)
+        self.client.post(reverse('guardar_reserva'), segunda)
+
+        visitante = Visitante.objects.get()
+        self.assertEqual(visitante.rutNormalizado, '12345678-5')
+        # Desde el formulario público no se cambian los datos de un RUT ya registrado
+        self.assertEqual(visitante.correo, primera['correo'])
+        self.assertEqual(Reserva.objects.filter(visitante=visitante).count(), 2)
+
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('validar_reserva'))
+        acompanantes = {fila['cantidadVisitantes']: len(fila['acompanantes']) for fila in response.context['reservas'].object_list}
+        self.assertEqual(acompanantes, {2: 1, 3: 2})
+
+    def test_digito_verificador_incorrecto_no_escribe(self):
+        datos = datos_reserva(self.disponibilidad, self.tipo_visita)
+        datos['rut'] = '12345678-4'
+        self.client.post(reverse('guardar_reserva'), datos)
+
+        self.assertFalse(Visitante.objects.exists())
+        self.disponibilidad.refresh_from_db()
+        self.assertEqual(self.disponibilidad.capacidadActual, 0)
+
+    def test_comando_unifica_duplicados(self):
+        reservas = [
+            crear_reserva(self.disponibilidad, self.tipo_visita, numero, acompanantes=1, legado=True)
+            for numero in range(3)
+        ]
+        for reserva, rut in zip(reservas, ['12.345.678-5', '12345678-5', '123456785']):
+            Visitante.objects.filter(pk=reserva.visitante_id).update(rut=rut)
+        otra = crear_reserva(self.disponibilidad, self.tipo_visita, 10, acompanantes=1)
+
+        call_command('deduplicar_visitantes', '--lote', '2', stdout=StringIO(), stderr=StringIO())
+
+        canonico = Visitante.objects.get(rutNormalizado='12345678-5')
+        self.assertEqual(canonico.pk, reservas[0].visitante_id)
+        self.assertEqual(Visitante.objects.count(), 2)
+        self.assertEqual(Reserva.objects.filter(visitante=canonico).count(), 3)
+        for reserva in reservas:
+            self.assertEqual(
+                list(Acompañante.objects.filter(reserva=reserva).values_list('rutVisitante_id', flat=True)),
+                [canonico.pk]
+            )
+        self.assertEqual(Visitante.objects.get(pk=otra.visitante_id).rutNormalizado, otra.visitante.rut)
+
+    def test_reserva_durante_el_comando_no_aborta_la_normalizacion(self):
+        legado = crear_reserva(self.disponibilidad, self.tipo_visita, 1, acompanantes=1)
+        otro = crear_reserva(self.disponibilidad, self.tipo_visita, 2, acompanantes=1)
+        Visitante.objects.filter(pk=legado.visitante_id).update(rut='10.000.001-' + legado.visitante.rut[-1])
+        agrupar = DeduplicarVisitantes.agrupar
+
+        def agrupar_y_reservar(comando, lote):
+            resultado = agrupar(comando, lote)
+            # Entre agrupar y escribir, el mismo visitante reserva desde el formulario
+            self.client.post(reverse('guardar_reserva'), datos_reserva(self.disponibilidad, self.tipo_visita, 1))
+            return resultado
+
+        with unittest.mock.patch.object(DeduplicarVisitantes, 'agrupar', agrupar_y_reservar):
+            salida = StringIO()
+            call_command('deduplicar_visitantes', stdout=salida, stderr=StringIO())
+
+        self.assertIn('1 visitantes unificados', salida.getvalue())
+        nuevo = Visitante.objects.get(rutNormalizado=legado.visitante.rut)
+        self.assertEqual(Reserva.objects.filter(visitante=nuevo).count(), 2)
+        self.assertFalse(Visitante.objects.filter(pk=legado.visitante_id).exists())
+        self.assertEqual(Visitante.objects.get(pk=otro.visitante_id).rutNormalizado, otro.visitante.rut)
+
+
+class ExportarReservasTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', password='clave-segura', is_staff=True)
+        self.client.force_login(self.admin)
+        self.tipo_visita = TipoVisita.objects.create(nombre='Familiar', descripcion='Visita familiar')
+        self.disponibilidad = crear_disponibilidad(capacidad_maxima=1000)
+        self.reservas = [crear_reserva(self.disponibilidad, self.tipo_visita, numero, acompanantes=numero % 3) for numero in range(7)]
+
+    def exportar(self, **params):
+        response = self.client.get(reverse('exportar_reservas'), params)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_csv_con_filtros(self):
+        usada = self.reservas[0]
+        usada.estadoReserva = Reserva.Estado.UTILIZADO
+        usada.save()
+
+        filas = list(csv.reader(StringIO(self.exportar(formato='csv', estado='ACTIVO'))))
+
+        self.assertEqual(filas[0][0], 'idReserva')
+        self.assertEqual([int(fila[0]) for fila in filas[1:]], [r.idReserva for r in reversed(self.reservas[1:])])
+        self.assertEqual(filas[1][-1].count(';'), 0)
+        self.assertEqual(filas[2][-1].count(';'), 1)
+
+    def test_jsonl_incluye_acompanantes(self):
+        lineas = [json.loads(linea) for linea in self.exportar(formato='jsonl').splitlines()]
+
+        self.assertEqual(len(lineas), 7)
+        for linea, reserva in zip(lineas, reversed(self.reservas)):
+            self.assertEqual(linea['idReserva'], reserva.idReserva)
+            self.assertEqual(len(linea['acompanantes']), reserva.cantidadVisitantes - 1)
+
+    def test_consultas_por_lote_y_no_por_fila(self):
+        # 3 lotes con datos + 1 vacío, y una consulta de acompañantes por lote con datos
+        with self.assertNumQueries(7):
+            lotes = list(iterar_reservas(tamano_lote=3))
+        self.assertEqual([len(lote) for lote in lotes], [3, 3, 1])
+
+class ImportarReservasTests(TestCase):
+    def setUp(self):
+        self.tipo_visita = TipoVisita.objects.create(nombre='Colegio', descripcion='Visita escolar')
+        self.disponibilidad = crear_disponibilidad(capacidad_maxima=10, capacidad_actual=2)
+        self.otra = crear_disponibilidad(hora=11, capacidad_maxima=100)
+
+    def filas_grupo(self, grupo, numero, disponibilidad, acompanantes):
+        titular = [
+            grupo, 'titular', rut_valido(30000000 + numero), f'Profesor {numero}', 'Prueba', '+56912345678',
+            f'profesor{numero}@ejemplo.com', '1980-01-01', disponibilidad.fecha.isoformat(),
+            disponibilidad.horaInicio.strftime('%H:%M'), self.tipo_visita.nombre
+        ]
+        return [titular] + [
+            [grupo, 'acompanante', rut_valido(40000000 + numero * 100 + i), f'Alumno {i}', '', '', '', '2012-05-01', '', '', '']
+            for i in range(acompanantes)
+        ]
+
+    def importar(self, filas, *argumentos):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', newline='', encoding='utf-8', delete=False) as archivo:
+            escritor = csv.writer(archivo)
+            escritor.writerow(['grupo', 'rol', 'rut', 'nombre', 'apellido', 'telefono', 'correo', 'fecha_nacimiento', 'fecha', 'hora', 'tipo_visita'])
+            escritor.writerows(filas)
+        salida, errores = StringIO(), StringIO()
+        call_command('importar_reservas', archivo.name, *argumentos, stdout=salida, stderr=errores)
+        return salida.getvalue(), errores.getvalue()
+
+    def test_asigna_capacidad_y_rechaza_por_fila(self):
+        filas = (
+            self.filas_grupo('A', 1, self.disponibilidad, 4)
+            + self.filas_grupo('B', 2, self.disponibilidad, 4)
+            + self.filas_grupo('C', 3, self.disponibilidad, 1)
+            + self.filas_grupo('D', 4, self.otra, 2)
+        )
+        filas[-1][2] = '12345678-4'
+
+        salida, errores = self.importar(filas)
+
+        self.assertIn('2 grupos importados (7 visitantes) y 2 rechazados', salida)
+        self.assertIn('grupo B): sin capacidad: quedan 3 cupos', errores)
+        self.assertIn(f'Línea {len(filas) + 1} (grupo D)', errores)
+        self.disponibilidad.refresh_from_db()
+        self.assertEqual(self.disponibilidad.capacidadActual, 9)
+        self.assertEqual(DisponibilidadParque.objects.get(pk=self.otra.pk).capacidadActual, 0)
+
+        reservas = Reserva.objects.order_by('idReserva')
+        self.assertEqual([r.visitante.rutNormalizado for r in reservas], [rut_valido(30000001), rut_valido(30000003)])
+        self.assertEqual([r.acompanantes.count() for r in reservas], [4, 1])
+        ocupacion = OcupacionDiaria.objects.get(fecha=self.disponibilidad.fecha, tipoVisita=self.tipo_visita)
+        self.assertEqual((ocupacion.totalReservas, ocupacion.totalVisitantes), (2, 7))
+
+    def test_rol_desconocido_es_error_de_fila(self):
+        filas = self.filas_grupo('A', 1, self.disponibilidad, 2)
+        filas[1][1] = 'profesor'
+
+        salida, errores = self.importar(filas)
+
+        self.assertIn('0 grupos importados', salida)
+        self.assertIn('Línea 3 (grupo A): rol desconocido: profesor', errores)
+        self.assertFalse(Reserva.objects.exists())
+
+    def test_titular_registrado_conserva_sus_datos(self):
+        rut = rut_valido(30000001)
+        existente = Visitante.objects.create(
+            rut=rut, rutNormalizado=rut, nombre='Ana', apellido='Registrada', telefono='+56900000000',
+            correo='ana@ejemplo.com', fecha_nacimiento=datetime.date(1980, 1, 1)
+        )
+
+        self.importar(self.filas_grupo('A', 1, self.otra, 1))
+        existente.refresh_from_db()
+        self.assertEqual((existente.nombre, existente.correo), ('Ana', 'ana@ejemplo.com'))
+        self.assertEqual(Reserva.objects.get().visitante_id, existente.pk)
+
+        self.importar(self.filas_grupo('B', 1, self.disponibilidad, 1), '--actualizar-visitantes')
+        existente.refresh_from_db()
+        self.assertEqual((existente.nombre, existente.correo), ('Profesor 1', 'profesor1@ejemplo.com'))
+        self.assertEqual(Visitante.objects.count(), 1)
+
+    def test_simular_no_escribe(self):
+        salida, _ = self.importar(self.filas_grupo('A', 1, self.disponibilidad, 2), '--simular')
+
+        self.assertIn('1 grupos válidos', salida)
+        self.assertFalse(Reserva.objects.exists())
+
+    def test_consultas_por_horario_y_no_por_grupo(self):
+        def consultas(grupos):
+            Reserva.objects.all().delete()
+            DisponibilidadParque.objects.filter(pk=self.otra.pk).update(capacidadActual=0)
+            filas = [fila for numero in range(grupos) for fila in self.filas_grupo(f'G{numero}', numero, self.otra, 3)]
+            with CaptureQueriesContext(connection) as contexto:
+                self.importar(filas)
+            self.assertEqual(Reserva.objects.count(), grupos)
+            return len(contexto)
+
+        consultas(1)
+        self.assertEqual(consultas(2), consultas(20))
+
+
+class RendimientoTests(TransactionTestCase):
+    def test_escenarios_cubren_todas_las_rutas(self):
+        nombres = {patron.name for patron in get_resolver('ReservaSystemApp.urls').url_patterns}
+        medidas = {escenario.url for escenario in rendimiento.ESCENARIOS}
+        self.assertEqual(nombres - rendimiento.EXCLUIDAS, medidas)
+
+    def test_percentiles_y_regresiones(self):
+        valores = list(range(1, 101))
+        self.assertEqual([rendimiento.percentil(valores, p) for p in (50, 95, 99)], [50, 95, 99])
+
+        base = {'form': {'p95_ms': 100, 'consultas_promedio': 2, 'errores': 0}}
+        self.assertEqual(rendimiento.comparar(base, {'form': {'p95_ms': 119, 'consultas_promedio': 2.4, 'errores': 0}}, 20), [])
+        regresiones = rendimiento.comparar(base, {'form': {'p95_ms': 130, 'consultas_promedio': 4, 'errores': 1}}, 20)
+        self.assertEqual(len(regresiones), 3)
+
+    def test_respuestas_4xx_no_cuentan_como_exitosas(self):
+        muestras = [(0.010, 3, 302), (0.020, 5, 200), (0.001, 0, 429), (0.001, 0, 429), (0.5, 9, 500)]
+        resultado = rendimiento.resumir(muestras, total=1)
+
+        self.assertEqual(resultado['estados'], {'200': 1, '302': 1, '429': 2, '500': 1})
+        self.assertEqual((resultado['exitosas'], resultado['rechazadas'], resultado['errores']), (2, 2, 1))
+        self.assertEqual(resultado['peticiones_por_segundo'], 2)
+        self.assertEqual((resultado['consultas_promedio'], resultado['p99_ms']), (4, 20))
+
+        solo_rechazos = rendimiento.resumir([(0.001, 0, 429)], total=1)
+        self.assertIsNone(solo_rechazos['p95_ms'])
+        self.assertEqual(rendimiento.comparar({'x': resultado}, {'x': solo_rechazos}, 20), ['x: ninguna respuesta exitosa'])
+
+    def test_mide_con_clientes_concurrentes(self):
+        contexto = rendimiento.sembrar_datos(reservas=30, dias=3, horarios_por_dia=2, capacidad=50)
+        usuario = User.objects.create_user('admin', password='clave-segura', is_staff=True)
+        escenarios = {escenario.nombre: escenario for escenario in rendimiento.ESCENARIOS}
+
+        resultado = rendimiento.medir(escenarios['validar_reserva'], contexto, clientes=2, peticiones=6, usuario=usuario)
+        self.assertEqual((resultado['peticiones'], resultado['errores']), (6, 0))
+        self.assertLessEqual(resultado['p50_ms'], resultado['p99_ms'])
+
+        resultado = rendimiento.medir(escenarios['api_disponibilidad_304'], contexto, clientes=2, peticiones=4)
+        self.assertEqual(resultado['consultas_max'], 0)
+
+    def test_error_de_un_cliente_no_bloquea_a_los_demas(self):
+        contexto = rendimiento.sembrar_datos(reservas=3, dias=1, horarios_por_dia=1, capacidad=50)
+        escenario = {escenario.nombre: escenario for escenario in rendimiento.ESCENARIOS}['form']
+        reales = rendimiento.connections
+        fallos = iter([DatabaseError('database is locked')])
+
+        def conexion(alias):
+            # Solo el primer cliente falla, antes de llegar a la barrera
+            error = next(fallos, None)
+            if error:
+                raise error
+            return reales[alias]
+
+        with unittest.mock.patch.object(rendimiento, 'connections') as conexiones:
+            conexiones.__getitem__.side_effect = conexion
+            conexiones.close_all = reales.close_all
+            resultado = []
+
+            def medir():
+                try:
+                    rendimiento.medir(escenario, contexto, clientes=3, peticiones=6)
+                except DatabaseError as error:
+                    resultado.append(error)
+
+            hilo = threading.Thread(target=medir)
+            hilo.start()
+            hilo.join(timeout=30)
+
+        self.assertFalse(hilo.is_alive())
+        self.assertEqual([str(error) for error in resultado], ['database is locked'])
+
+    def test_mide_bajo_asgi(self):
+        contexto = rendimiento.sembrar_datos(reservas=30, dias=3, horarios_por_dia=2, capacidad=50)
+        usuario = User.objects.create_user('admin', password='clave-segura', is_staff=True)
+        escenarios = {escenario.nombre: escenario for escenario in rendimiento.ESCENARIOS}
+
+        resultado = rendimiento.medir_asgi(escenarios['validar_reserva'], contexto, clientes=3, peticiones=6, usuario=usuario)
+        self.assertEqual((resultado['peticiones'], resultado['errores']), (6, 0))
+        self.assertGreater(resultado['consultas_promedio'], 0)
+
+        resultado = rendimiento.medir_asgi(escenarios['exportar_reservas'], contexto, clientes=2, peticiones=2, usuario=usuario)
+        self.assertEqual(resultado['errores'], 0)
+
+
+class MetricasTests(TestCase):
+    def setUp(self):
+        registro_metricas.reiniciar()
+        self.admin = User.objects.create_user('admin', password='clave-segura', is_staff=True)
+        self.tipo_visita = TipoVisita.objects.create(nombre='Familiar', descripcion='Visita familiar')
+        self.disponibilidad = crear_disponibilidad()
+
+    def test_histograma_y_sql_por_ruta(self):
+        self.client.post(reverse('guardar_reserva'), datos_reserva(self.disponibilidad, self.tipo_visita, acompanantes=1))
+        self.client.force_login(self.admin)
+        for _ in range(3):
+            self.client.get(reverse('validar_reserva'))
+
+        response = self.client.get(reverse('metricas'))
+
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        texto = response.content.decode()
+        self.assertIn('sgra_peticion_duracion_segundos_bucket{vista="validar_reserva",le="+Inf"} 3', texto)
+        self.assertIn('sgra_peticion_duracion_segundos_count{vista="guardar_reserva"} 1', texto)
+        consultas = registro_metricas.vistas['validar_reserva'].consultas
+        self.assertGreater(consultas, 0)
+        self.assertIn(f'sgra_sql_consultas_total{{vista="validar_reserva"}} {consultas}', texto)
+        if connection.vendor == 'sqlite':
+            # SQLite no informa las filas leídas: el contador no se publica
+            self.assertNotIn('sgra_sql_filas_total', texto)
+        else:
+            self.assertIn('sgra_sql_filas_total{vista="validar_reserva"}', texto)
+
+    def test_respuesta_en_streaming_se_mide_al_cerrar(self):
+        for numero in range(3):
+            crear_reserva(self.disponibilidad, self.tipo_visita, numero)
+        self.client.force_login(self.admin)
+
+        response = self.client.get(reverse('exportar_reservas'), {'formato': 'csv'})
+        self.assertNotIn('exportar_reservas', registro_metricas.vistas)
+        b''.join(response.streaming_content)
+
+        # Las consultas de iterar_reservas corren mientras se envía el archivo
+        self.assertGreaterEqual(registro_metricas.vistas['exportar_reservas'].consultas, 3)
+        self.assertEqual(registro_metricas.vistas['exportar_reservas'].peticiones, 1)
+
+    def test_solo_personal(self):
+        User.objects.create_user('visita', password='clave-segura')
+        self.client.login(username='visita', password='clave-segura')
+        self.assertEqual(self.client.get(reverse('metricas')).status_code, 403)
+
+    @override_settings(METRICAS_UMBRAL_LENTO_MS=0)
+    def test_registro_de_peticiones_lentas_con_sql(self):
+        self.client.force_login(self.admin)
+        with self.assertLogs('ReservaSystemApp.metricas', 'WARNING') as registros:
+            self.client.get(reverse('validar_reserva'))
+        self.assertIn('Petición lenta GET /validar-reserva/ (validar_reserva)', registros.output[0])
+        self.assertIn('SELECT', registros.output[0])
+
+
+class ReplicasLecturaTests(TestCase):
+    def enrutar_lectura(self, estado):
+        token = _peticion.set(estado)
+        try:
+            return router.db_for_read(Reserva)
+        finally:
+            _peticion.reset(token)
+
+    @override_settings(REPLICAS_LECTURA=['replica'])
+    def test_router_solo_en_vistas_marcadas_y_sin_escrituras(self):
+        marcada = EstadoPeticion()
+        marcada.en_replica = True
+        self.assertEqual(self.enrutar_lectura(marcada), 'replica')
+
+        self.assertEqual(self.enrutar_lectura(EstadoPeticion()), 'default')
+        self.assertEqual(self.enrutar_lectura(None), 'default')
+
+        con_cookie = EstadoPeticion(primaria=True)
+        con_cookie.en_replica = True
+        self.assertEqual(self.enrutar_lectura(con_cookie), 'default')
+
+        token = _peticion.set(marcada)
+        try:
+            self.assertEqual(router.db_for_write(Reserva), 'default')
+        finally:
+            _peticion.reset(token)
+        self.assertEqual(self.enrutar_lectura(marcada), 'default')
+
+    @override_settings(REPLICAS_LECTURA=['replica', 'otra'])
+    def test_una_replica_por_peticion(self):
+        primera = EstadoPeticion()
+        primera.en_replica = True
+        elegida = self.enrutar_lectura(primera)
+
+        with unittest.mock.patch('ReservaSystemApp.replicas.random.choice') as elegir:
+            self.assertEqual({self.enrutar_lectura(primera) for _ in range(20)}, {elegida})
+        elegir.assert_not_called()
+
+        segunda = EstadoPeticion()
+        segunda.en_replica = True
+        with unittest.mock.patch('ReservaSystemApp.replicas.random.choice', return_value='otra'):
+            self.assertEqual(self.enrutar_lectura(segunda), 'otra')
+
+    @override_settings(REPLICAS_LECTURA=[])
+    def test_sin_replicas_todo_va_a_la_principal(self):
+        marcada = EstadoPeticion()
+        marcada.en_replica = True
+        self.assertEqual(self.enrutar_lectura(marcada), 'default')
+
+
+@unittest.skipUnless('replica' in settings.DATABASES, 'requiere una réplica, p. ej. SGRAproject.settings_local')
+@override_settings(REPLICAS_LECTURA=['replica'])
+class ReplicasIntegracionTests(TransactionTestCase):
+    # La réplica es un espejo de la base de pruebas: solo ve lo confirmado, como una réplica real.
+    # El runner reúne los alias de todas las clases, aunque se omitan, así que solo se declara si existe
+    databases = {'default'} | ({'replica'} & set(settings.DATABASES))
+
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', password='clave-segura', is_staff=True)
+        self.client.force_login(self.admin)
+        self.tipo_visita = TipoVisita.objects.create(nombre='Familiar', descripcion='Visita familiar')
+        self.disponibilidad = crear_disponibilidad()
+
+    def test_panel_lee_de_la_replica_hasta_que_el_cliente_escribe(self):
+        crear_reserva(self.disponibilidad, self.tipo_visita, 1)
+
+        with CaptureQueriesContext(connections['replica']) as replica:
+            response = self.client.get(reverse('validar_reserva'))
+            b''.join(self.client.get(reverse('exportar_reservas')).streaming_content)
+        self.assertEqual(len(response.context['reservas'].object_list), 1)
+        self.assertGreaterEqual(len(replica), 3)
+        self.assertNotIn(COOKIE_PRIMARIA, response.cookies)
+
+        response = self.client.post(
+            reverse('guardar_reserva'), datos_reserva(self.disponibilidad, self.tipo_visita, 2)
+        )
+        self.assertIn(COOKIE_PRIMARIA, response.cookies)
+
+        with CaptureQueriesContext(connections['replica']) as replica:
+            response = self.client.get(reverse('validar_reserva'))
+        self.assertEqual(len(replica), 0)
+        self.assertEqual(len(response.context['reservas'].object_list), 2)
+
+class EstaticosProduccionTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.destino = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.destino)
+        produccion = override_settings(
+            DEBUG=False,
+            STATIC_ROOT=cls.destino,
+            STORAGES={
+                'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+                'staticfiles': {'BACKEND': 'ReservaSystemApp.estaticos.AlmacenEstaticos'},
+            },
+        )
+        produccion.enable()
+        cls.addClassCleanup(produccion.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    def test_collectstatic_minifica_y_comprime_con_hash(self):
+        nombre = staticfiles_storage.stored_name('js/bootstrap.bundle.js')
+        self.assertRegex(nombre, r'^js/bootstrap\.bundle\.[0-9a-f]{12}\.js$')
+
+        original = os.path.getsize(os.path.join(settings.BASE_DIR, 'static', 'js', 'bootstrap.bundle.js'))
+        minificado = os.path.getsize(os.path.join(self.destino, nombre))
+        self.assertLess(minificado, original * 0.7)
+        for extension in ['.gz', '.br']:
+            self.assertLess(os.path.getsize(os.path.join(self.destino, nombre + extension)), minificado / 3)
+
+    def test_servidos_con_cache_de_largo_plazo_y_brotli(self):
+        nombre = staticfiles_storage.stored_name('css/bootstrap.min.css')
+        response = Client().get(f'/static/{nombre}', HTTP_ACCEPT_ENCODING='gzip, br')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=315360000', response['Cache-Control'])
+        response.close()
+
+    async def test_servidos_bajo_asgi(self):
+        nombre = staticfiles_storage.stored_name('css/bootstrap.min.css')
+        response = await AsyncClient().get(f'/static/{nombre}', headers={'Accept-Encoding': 'gzip'})
+
+        self.assertEqual((response.status_code, response['Content-Encoding']), (200, 'gzip'))
+        response.close()
+
+    def test_plantillas_usan_los_nombres_con_hash(self):
+        url = staticfiles_storage.url('js/bootstrap.bundle.js')
+        self.assertRegex(url, r'bootstrap\.bundle\.[0-9a-f]{12}\.js$')
+        self.assertIn(url, self.client.get(reverse('inicio')).content.decode())
+
+
+class VistasAsincronasTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        registro_metricas.reiniciar()
+        self.admin = User.objects.create_user('admin', password='clave-segura', is_staff=True)
+        self.tipo_visita = TipoVisita.objects.create(nombre='Familiar', descripcion='Visita familiar')
+        self.disponibilidad = crear_disponibilidad(capacidad_maxima=20, capacidad_actual=4)
+
+    def test_cadena_de_middleware_sin_adaptar_a_sincrono(self):
+        # Django registra en DEBUG cada middleware que obliga a pasar a un hilo
+        with override_settings(DEBUG=True), self.assertNoLogs('django.request', 'DEBUG'):
+            ASGIHandler()
+
+    async def test_formulario(self):
+        response = await self.async_client.get(reverse('form'))
+
+        self.assertContains(response, '(Cupos: 16)')
+        self.assertContains(response, 'Familiar')
+
+    async def test_dashboard_y_metricas(self):
+        crear = sync_to_async(crear_reserva)
+        await crear(self.disponibilidad, self.tipo_visita, 1)
+        await sync_to_async(call_command)('reconstruir_ocupacion', stdout=StringIO())
+        await self.async_client.aforce_login(self.admin)
+
+        response = await self.async_client.get(reverse('dashboard_monitoreo'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.context['total_reservas'], response.context['total_visitantes']), (1, 3))
+        self.assertEqual([tipo.nombre for tipo in response.context['tipos_visita']], ['Familiar'])
+        # El middleware de métricas cuenta las consultas del ORM asíncrono
+        self.assertGreater(registro_metricas.vistas['dashboard_monitoreo'].consultas, 0)
+
+    async def test_api_disponibilidad_sin_cache_sincrona(self):
+        # El ETag se calcula con la caché asíncrona, sin bloquear el bucle de eventos
+        with unittest.mock.patch('ReservaSystemApp.disponibilidad.version_disponibilidad') as version:
+            etag = (await self.async_client.get(reverse('api_disponibilidad')))['ETag']
+            response = await self.async_client.get(reverse('api_disponibilidad'), headers={'if-none-match': etag})
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        version.assert_not_called()
+
+    async def test_validar_reserva(self):
+        reserva = await sync_to_async(crear_reserva)(self.disponibilidad, self.tipo_visita, 1, acompanantes=2)
+        await self.async_client.aforce_login(self.admin)
+
+        response = await self.async_client.get(reverse('validar_reserva'))
+
+        fila, = response.context['reservas'].object_list
+        self.assertEqual((fila['idReserva'], len(fila['acompanantes'])), (reserva.idReserva, 2))
+
+    async def test_exportacion_se_envia_lote_a_lote(self):
+        for numero in range(5):
+            await sync_to_async(crear_reserva)(self.disponibilidad, self.tipo_visita, numero, acompanantes=1)
+        await self.async_client.aforce_login(self.admin)
+        eventos = []
+        alistar = views.alistar
+
+        async def alistar_registrando(queryset):
+            filas = await alistar(queryset)
+            eventos.append(f'lote {len(filas)}')
+            return filas
+
+        with unittest.mock.patch.object(views, 'LOTE_EXPORTACION', 2), \
+                unittest.mock.patch.object(views, 'alistar', alistar_registrando):
+            response = await self.async_client.get(reverse('exportar_reservas'), {'formato': 'csv'})
+            self.assertTrue(response.is_async)
+            async for fragmento in response.streaming_content:
+                eventos.append(f'fragmento {len(fragmento.splitlines())}')
+            await sync_to_async(response.close)()
+
+        # Cada lote se lee cuando se va a enviar, no todo antes del primer fragmento
+        self.assertEqual(eventos, [
+            'fragmento 1', 'lote 2', 'fragmento 2', 'lote 2', 'fragmento 2', 'lote 1', 'fragmento 1', 'lote 0'
+        ])
+        self.assertEqual(registro_metricas.vistas['exportar_reservas'].peticiones, 1)
+        self.assertGreater(registro_metricas.vistas['exportar_reservas'].consultas, 3)
+
+
+class CapacidadConcurrenteTests(TransactionTestCase):
+    hilos = 8
+    intentos_por_hilo = 10
+
+    def setUp(self):
+        self.tipo_visita = TipoVisita.objects.create(nombre='Familiar', descripcion='Visita familiar')
+        self.disponibilidad = crear_disponibilidad(capacidad_maxima=30)
+
+    def reservar(self, hilo, intento):
+        numero = hilo * 1000 + intento
+        Client().post(reverse('guardar_reserva'), datos_reserva(self.disponibilidad, self.tipo_visita, numero, acompanantes=1))
+
+    def trabajador(self, hilo, barrera):
+        barrera.wait()
+        try:
+            for intento in range(self.intentos_por_hilo):
+                try:
+                    self.reservar(hilo, intento)
+                except Exception:
+                    # Un bloqueo de la base de datos cuenta como reserva rechazada
+                    pass
+        finally:
+            connections.close_all()
+
+    def test_reservas_concurrentes_no_sobrevenden(self):
+        barrera = threading.Barrier(self.hilos)
+        hilos = [threading.Thread(target=self.trabajador, args=(n, barrera)) for n in range(self.hilos)]
+
+        inicio = time.perf_counter()
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        duracion = time.perf_counter() - inicio
+
+        self.disponibilidad.refresh_from_db()
+        reservas = Reserva.objects.filter(disponibilidad=self.disponibilidad)
+        visitantes = reservas.aggregate(total=Sum('cantidadVisitantes'))['total'] or 0
+
+        self.assertLessEqual(self.disponibilidad.capacidadActual, self.disponibilidad.capacidadMaxima)
+        self.assertEqual(self.disponibilidad.capacidadActual, visitantes)
+        print(
+            f"\n{self.hilos * self.intentos_por_hilo} intentos, {reservas.count()} reservas aceptadas, "
+            f"{self.hilos * self.intentos_por_hilo / duracion:.1f} solicitudes/s, "
+            f"{reservas.count() / duracion:.1f} reservas/s"
+        )
@@ -1,20 +1,44 @@
-from django.urls import path
+import datetime
+
+from django.urls import path, register_converter
 from . import views
 
+
+class FechaConverter:
+    regex = r'\d{4}-\d{2}-\d{2}'
+
+    def to_python(self, value):
+        return datetime.date.fromisoformat(value)
+
+    def to_url(self, value):
+        return value.isoformat() if isinstance(value, datetime.date) else value
+
+
+register_converter(FechaConverter, 'fecha')
+
 urlpatterns = [
     path('', views.inicio, name='inicio'),
     path('form/', views.form, name='form'),
     path('disponibilidad/', views.mostrarDisponibilidad, name='mostrar_disponibilidad'),
+    path('api/disponibilidad/', views.apiDisponibilidad, name='api_disponibilidad'),
     path('guardar-reserva/', views.guardarReserva, name='guardar_reserva'),
+    path('reserva/retener/', views.retenerCupos, name='retener_cupos'),
     path('tipos-visita/', views.mostrarTipoVisita, name='mostrar_tipo_visita'),
     path('valreserva', views.validarReserva, name='valreserva'),
     path('validar-reserva/', views.validarReserva, name='validar_reserva'),
+    path('validar-reserva/exportar/', views.exportarReservas, name='exportar_reservas'),
 
     path('reserva/modificar/<int:reserva_id>/', views.modificarReserva, name='modificar_reserva'),
     path('reserva/guardar-modificacion/<int:reserva_id>/', views.guardarModificacionReserva, name='guardar_modificacion_reserva'),
 
     path('monitoreo/dashboard/', views.dashboardMonitoreo, name='dashboard_monitoreo'),
 
+    path('acceso/ingreso/', views.registrarIngreso, name='registrar_ingreso'),
+    path('acceso/manifiesto/<fecha:fecha>/', views.manifiestoAcceso, name='manifiesto_acceso'),
+    path('acceso/sincronizar/<fecha:fecha>/', views.sincronizarIngresos, name='sincronizar_ingresos'),
+
+    path('metricas/', views.metricasPrometheus, name='metricas'),
+
     path('admins/login/', views.login_admin, name='login_admin'),
     path('admins/logout/', views.logout_admin, name='logout_admin'),
 ]
\ No newline at end of file
@@ -0,0 +1,40 @@
+from django.db import transaction
+from django.utils import timezone
+from ReservaSystemApp.models import Reserva
+from ReservaSystemApp.ocupacion import registrar_cambio_estado
+
+def fechas_con_reservas_activas(hasta_fecha):
+    return list(Reserva.objects.filter(
+        estadoReserva=Reserva.Estado.ACTIVO,
+        disponibilidad__fecha__lt=hasta_fecha
+    ).values_list('disponibilidad__fecha', flat=True).distinct().order_by('disponibilidad__fecha'))
+
+def vencer_lote(fecha, tamano_lote):
+    # Transacción corta por lote: bloquea a lo sumo tamano_lote reservas de un día pasado
+    with transaction.atomic():
+        ids = list(Reserva.objects.select_for_update(skip_locked=True, of=('self',)).filter(
+            estadoReserva=Reserva.Estado.ACTIVO,
+            disponibilidad__fecha=fecha
+        ).order_by('idReserva').values_list('idReserva', flat=True)[:tamano_lote])
+
+        if not ids:
+            return 0
+
+        reservas = Reserva.objects.filter(idReserva__in=ids, estadoReserva=Reserva.Estado.ACTIVO)
+        registrar_cambio_estado(reservas, Reserva.Estado.ACTIVO, Reserva.Estado.VENCIDO)
+        return reservas.update(estadoReserva=Reserva.Estado.VENCIDO)
+
+def vencer_reservas(hasta_fecha=None, tamano_lote=500):
+    """
+    Marca como VENCIDO las reservas ACTIVO de horarios anteriores a hasta_fecha
+    (hoy por defecto), día por día y en lotes. Produce (fecha, cantidad) por lote.
+    Es idempotente: si se interrumpe, basta con volver a ejecutarlo.
+    """
+    hasta_fecha = hasta_fecha or timezone.localdate()
+
+    for fecha in fechas_con_reservas_activas(hasta_fecha):
+        while True:
+            vencidas = vencer_lote(fecha, tamano_lote)
+            if not vencidas:
+                break
+            yield fecha, vencidas
@@ -1,26 +1,52 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.exceptions import PermissionDenied
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.views.decorators.http import require_GET, require_POST, require_safe
+from django.views.decorators.cache import cache_control
+from django.conf import settings
 from django.contrib import messages
-from django.db import transaction
-from django.db.models import Sum, Count, Q
+from django.db import connection, transaction
+from django.db.models import Sum, Count, Q, F
 from django.core.paginator import Paginator
-from django.db import connection
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_date
+from django.utils.http import quote_etag
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.forms import AuthenticationForm
 from decimal import Decimal 
+from asgiref.sync import sync_to_async
+import asyncio
+import csv
+import datetime
+import json
 from ReservaSystemApp.models import (
     DisponibilidadParque, Visitante, Acompañante, Reserva, TipoVisita,
-    RegistroCambioReserva, SistemaNotificaciones
+    RegistroCambioReserva, OcupacionDiaria, CapacidadDiaria
+)
+from ReservaSystemApp.notificaciones import encolar_notificacion
+from ReservaSystemApp.metricas import registro_metricas
+from ReservaSystemApp.replicas import lectura_en_replica
+from ReservaSystemApp.rut import normalizar_rut
+from ReservaSystemApp.documentos import descartar_documento
+from ReservaSystemApp.acceso import registrar_ingreso, manifiesto_del_dia, sincronizar_ingresos
+from ReservaSystemApp.admision import admision_reservas, admision_retenciones
+from ReservaSystemApp.pronostico import horarios_en_riesgo
+from ReservaSystemApp.retenciones import (
+    retener_cupos, tomar_retencion, reservar_o_reclamar, huella_cliente, LimiteRetencionesExcedido
+)
+from ReservaSystemApp.disponibilidad import (
+    liberar_capacidad, rango_ventana,
+    aobtener_disponibilidades, aobtener_tipos_visita, aversion_disponibilidad, aversion_fragmentos
 )
 
 # Create your views here.
 def crear_notificacion(tipo, mensaje):
-    SistemaNotificaciones.objects.create(
-        fechaEnvio=timezone.now().date(),
-        tipo=tipo,
-        mensaje=mensaje
-    )
+    # Se escribe en lote fuera de la petición (ver notificaciones.BufferNotificaciones)
+    encolar_notificacion(tipo, mensaje)
 
 def mostrarTipoVisita(request):
     tipos_visita = TipoVisita.objects.all().order_by('nombre')
@@ -32,170 +58,318 @@ def mostrarTipoVisita(request):
 def inicio(request):
     return render(request, 'index.html')
 
-def form(request):
-    return mostrarDisponibilidad(request)
+async def arender(request, template_name, context=None):
+    # Los procesadores de contexto leen el usuario y los mensajes de la sesión con
+    # el ORM síncrono: se renderiza en el hilo de la petición, con el usuario ya cargado
+    request.user = await request.auser()
+    return await sync_to_async(render)(request, template_name, context)
 
-def mostrarDisponibilidad(request):
+async def form(request):
+    return await mostrarDisponibilidad(request)
+
+async def mostrarDisponibilidad(request):
     try:
-        disponibilidades = DisponibilidadParque.objects.all().order_by('fecha', 'horaInicio')
-        
-        for disp in disponibilidades:
-            disp.cupos_disponibles = disp.capacidadMaxima - disp.capacidadActual
-        
-        tipos_visita = TipoVisita.objects.all().order_by('nombre')
+        # Solo horarios desde hoy hasta el fin de la ventana, servidos desde la caché compartida
+        disponibilidades, tipos_visita, version = await asyncio.gather(
+            aobtener_disponibilidades(), aobtener_tipos_visita(), aversion_fragmentos()
+        )
+        fragmentos = {
+            'version_fragmentos': version,
+            'cache_timeout': settings.DISPONIBILIDAD_CACHE_TIMEOUT,
+        }
         
-        if not disponibilidades.exists():
-            return render(request, 'form.html', {
+        if not disponibilidades:
+            return await arender(request, 'form.html', {
                 'error': 'No hay horarios disponibles',
-                'tipos_visita': tipos_visita
+                'tipos_visita': tipos_visita,
+                **fragmentos
             })
         
         context = {
             'form': disponibilidades,
             'tipos_visita': tipos_visita,
-            'hay_datos': True
+            'hay_datos': True,
+            **fragmentos
         }
-        return render(request, 'form.html', context)
+        return await arender(request, 'form.html', context)
     except Exception as e:
         print(f"Error al obtener disponibilidades: {e}")
-        return render(request, 'form.html', {'error': 'Error al cargar los horarios'})
+        return await arender(request, 'form.html', {'error': 'Error al cargar los horarios'})
+
+def leer_rango_api(request):
+    # Por defecto, la misma ventana que se publica en el formulario
+    fecha_desde, fecha_hasta = rango_ventana()
+    if request.GET.get('desde'):
+        fecha_desde = parse_date(request.GET['desde'])
+        if fecha_desde:
+            fecha_hasta = fecha_desde + datetime.timedelta(days=settings.DISPONIBILIDAD_DIAS_VENTANA)
+    if request.GET.get('hasta'):
+        fecha_hasta = parse_date(request.GET['hasta'])
+
+    if not fecha_desde or not fecha_hasta or fecha_desde > fecha_hasta:
+        raise ValueError('Rango de fechas no válido, use desde=AAAA-MM-DD&hasta=AAAA-MM-DD')
+    if (fecha_hasta - fecha_desde).days > settings.DISPONIBILIDAD_DIAS_VENTANA:
+        raise ValueError(f'El rango no puede superar {settings.DISPONIBILIDAD_DIAS_VENTANA} días')
+    return fecha_desde, fecha_hasta
+
+@require_safe
+@cache_control(public=True, max_age=settings.DISPONIBILIDAD_API_MAX_AGE)
+async def apiDisponibilidad(request):
+    try:
+        fecha_desde, fecha_hasta = leer_rango_api(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    # La versión solo cambia cuando cambia la capacidad o el calendario, así que
+    # un cliente que repite la consulta recibe 304 sin tocar la base de datos.
+    # Se calcula aquí con la caché asíncrona: @condition llama a etag_func de
+    # forma síncrona y bloquearía el bucle de eventos en cada petición
+    etag = quote_etag(f'disponibilidad-{await aversion_disponibilidad()}-{fecha_desde}-{fecha_hasta}')
+    no_modificada = get_conditional_response(request, etag=etag)
+    if no_modificada is not None:
+        no_modificada['ETag'] = etag
+        return no_modificada
+
+    horarios = [
+        {
+            'id': disponibilidad['id'],
+            'fecha': disponibilidad['fecha'],
+            'horaInicio': disponibilidad['horaInicio'],
+            'horaFin': disponibilidad['horaFin'],
+            'capacidadMaxima': disponibilidad['capacidadMaxima'],
+            'cuposDisponibles': disponibilidad['cupos_disponibles'],
+        }
+        for disponibilidad in await aobtener_disponibilidades(fecha_desde, fecha_hasta)
+    ]
+    response = JsonResponse({'desde': fecha_desde, 'hasta': fecha_hasta, 'horarios': horarios})
+    response['ETag'] = etag
+    return response
+
+def leer_datos_reserva(post):
+    # Valida toda la solicitud antes de tocar la base de datos
+    visitante_data = {
+        'rut': post.get('rut'),
+        'nombre': post.get('nombre'),
+        'apellido': post.get('apellido'), 
+        'telefono': post.get('telefono'),
+        'correo': post.get('correo'),
+        'fecha_nacimiento': parse_date(post.get('fecha_nacimiento') or ''), 
+    }
+
+    if not all(visitante_data.values()):
+        raise ValueError('Faltan datos del visitante principal')
+
+    visitante_data['rut'] = normalizar_rut(visitante_data['rut'])
 
+    acompanantes_data = []
+    i = 1
+    while f'acompanante_rut_{i}' in post:
+        acompanante_data = {
+            'rut': post.get(f'acompanante_rut_{i}'),
+            'nombre': post.get(f'acompanante_nombre_{i}'),
+            'fecha_nacimiento': parse_date(post.get(f'acompanante_fecha_nacimiento_{i}') or ''), 
+        }
+        
+        if acompanante_data['rut'] and acompanante_data['nombre'] and acompanante_data['fecha_nacimiento']:
+            acompanante_data['rut'] = normalizar_rut(acompanante_data['rut'])
+            acompanantes_data.append(acompanante_data)
+        i += 1
+
+    disponibilidad_id = post.get('hora')
+    if not disponibilidad_id or not disponibilidad_id.isdigit():
+        raise ValueError('Debe seleccionar una fecha y hora válida')
+
+    return visitante_data, acompanantes_data, int(disponibilidad_id), post.get('tipoVisita')
+
+def guardar_visitante(visitante_data):
+    # Por RUT normalizado: un visitante que vuelve reutiliza su registro sin duplicarse. El
+    # formulario es público, así que no cambia los datos personales de un RUT ya registrado
+    visitante, _ = Visitante.objects.get_or_create(
+        rutNormalizado=visitante_data['rut'],
+        defaults=visitante_data
+    )
+    return visitante
+
+# Síncrona a propósito: la transacción y el UPDATE condicional de la capacidad usan
+# el ORM síncrono; bajo ASGI, Django la ejecuta con sync_to_async en el hilo de la petición.
+# La admisión va por fuera de la transacción: una reserva en espera no abre ninguna
+@admision_reservas
 @transaction.atomic
 def guardarReserva(request):
     if request.method == 'POST':
         try:
-            visitante_data = {
-                'rut': request.POST.get('rut'),
-                'nombre': request.POST.get('nombre'),
-                'apellido': request.POST.get('apellido'), 
-                'telefono': request.POST.get('telefono'),
-                'correo': request.POST.get('correo'),
-                'fecha_nacimiento': request.POST.get('fecha_nacimiento'), 
-            }
-
-            visitante = Visitante.objects.create(
-                rut=visitante_data['rut'],
-                nombre=visitante_data['nombre'],
-                apellido=visitante_data['apellido'],
-                telefono=visitante_data['telefono'],
-                correo=visitante_data['correo'],
-                fecha_nacimiento=visitante_data['fecha_nacimiento']
-            )
+            visitante_data, acompanantes_data, disponibilidad_id, tipo_visita_nombre = leer_datos_reserva(request.POST)
+            cantidad_visitantes = 1 + len(acompanantes_data)
 
-            cantidad_visitantes = 1
-            i = 1
-            while f'acompanante_rut_{i}' in request.POST:
-                acompanante_data = {
-                    'rut': request.POST.get(f'acompanante_rut_{i}'),
-                    'nombre': request.POST.get(f'acompanante_nombre_{i}'),
-                    'fecha_nacimiento': request.POST.get(f'acompanante_fecha_nacimiento_{i}'), 
-                }
-                
-                if acompanante_data['rut'] and acompanante_data['nombre'] and acompanante_data['fecha_nacimiento']:
-                    Acompañante.objects.create(
-                        rut=acompanante_data['rut'],
-                        rutVisitante=visitante,
-                        nombre=acompanante_data['nombre'],
-                        fecha_nacimiento=acompanante_data['fecha_nacimiento']
-                    )
-                    cantidad_visitantes += 1
-                i += 1
-            
-            disponibilidad_id = request.POST.get('hora')
-            disponibilidad = DisponibilidadParque.objects.get(id=disponibilidad_id)
+            tipo_visita = TipoVisita.objects.get(nombre=tipo_visita_nombre)
 
-            if disponibilidad.capacidadActual + cantidad_visitantes > disponibilidad.capacidadMaxima:
-                messages.error(request, 'No hay suficiente capacidad para la cantidad de visitantes')
+            # La capacidad se reclama antes de cualquier inserción: un horario lleno no escribe nada.
+            # Con una retención vigente solo se ajusta la diferencia de visitantes
+            retenidos = tomar_retencion(request.POST.get('retencion'), disponibilidad_id)
+            if retenidos > cantidad_visitantes:
+                liberar_capacidad(disponibilidad_id, retenidos - cantidad_visitantes)
+            elif retenidos < cantidad_visitantes and not reservar_o_reclamar(disponibilidad_id, cantidad_visitantes - retenidos):
+                # El UPDATE condicional no distingue un horario lleno de uno inexistente: solo al fallar se consulta
+                existe = DisponibilidadParque.objects.filter(id=disponibilidad_id).exists()
+                transaction.set_rollback(True)
+                if existe:
+                    messages.error(request, 'No hay suficiente capacidad para la cantidad de visitantes')
+                else:
+                    messages.error(request, 'El horario seleccionado no existe o ya no está disponible')
                 return redirect('form')
 
-            tipo_visita_nombre = request.POST.get('tipoVisita')
-            tipo_visita = TipoVisita.objects.get(nombre=tipo_visita_nombre)
+            visitante = guardar_visitante(visitante_data)
 
             reserva = Reserva.objects.create(
                 visitante=visitante,
-                disponibilidad=disponibilidad,
+                disponibilidad_id=disponibilidad_id,
                 cantidadVisitantes=cantidad_visitantes,
                 tipoVisita=tipo_visita,
                 estadoReserva=Reserva.Estado.ACTIVO
             )
 
-            disponibilidad.capacidadActual += cantidad_visitantes
-            disponibilidad.save()
+            Acompañante.objects.bulk_create([
+                Acompañante(rutVisitante=visitante, reserva=reserva, **acompanante_data)
+                for acompanante_data in acompanantes_data
+            ])
 
             messages.success(request, 'Reserva creada exitosamente')
             crear_notificacion('Reserva Creada', f'Reserva {reserva.idReserva} creada para {visitante.nombre}.')
             return redirect('inicio')
 
+        except TipoVisita.DoesNotExist:
+            messages.error(request, 'Error al procesar la reserva: tipo de visita no válido')
+            return redirect('form')
+
         except Exception as e:
+            transaction.set_rollback(True)
             messages.error(request, f'Error al procesar la reserva: {str(e)}')
             return redirect('form')
 
     return redirect('form')
 
-@login_required 
-def validarReserva(request):
-    fecha = request.GET.get('fecha')
-    estado = request.GET.get('estado')
-    page_number = request.GET.get('page', 1)
-    
-    query = """
-        SELECT 
-            r.idReserva,
-            r.visitante_id,              
-            v.rut as visitante_rut,      
-            v.fecha_nacimiento as visitante_fecha_nacimiento,
-            r.disponibilidad_id,
-            r.cantidadVisitantes,
-            r.estadoReserva,
-            v.nombre as visitante_nombre,
-            v.apellido as visitante_apellido,
-            v.telefono as visitante_telefono,
-            v.correo as visitante_correo,
-            d.fecha as disponibilidad_fecha,
-            d.horaInicio,
-            d.horaFin,
-            r.tipoVisita_id as tipo_visita_nombre
-        FROM reserva r
-        INNER JOIN visitante v ON r.visitante_id = v.idVisitante
-        INNER JOIN disponibilidadParque d ON r.disponibilidad_id = d.id
-        WHERE 1=1
-    """
-    
-    params = []
-    
+@require_POST
+@admision_retenciones
+def retenerCupos(request):
+    disponibilidad_id = request.POST.get('hora', '')
+    cantidad = request.POST.get('cantidadVisitantes', '')
+    if not disponibilidad_id.isdigit() or not cantidad.isdigit():
+        return JsonResponse({'error': 'Se esperaba hora y cantidadVisitantes'}, status=400)
+    if not 1 <= int(cantidad) <= settings.RETENCION_MAX_VISITANTES:
+        return JsonResponse({'error': f'Se pueden retener de 1 a {settings.RETENCION_MAX_VISITANTES} cupos'}, status=400)
+
+    try:
+        retencion = retener_cupos(
+            int(disponibilidad_id), int(cantidad), request.POST.get('retencion'),
+            cliente=huella_cliente(request.META.get('REMOTE_ADDR'))
+        )
+    except LimiteRetencionesExcedido as limite:
+        return JsonResponse({'error': f'No se pueden retener más de {limite} cupos a la vez'}, status=429)
+    if retencion is None:
+        return JsonResponse({'error': 'No hay suficientes cupos en el horario seleccionado'}, status=409)
+    return JsonResponse({
+        'retencion': retencion.token,
+        'expira': retencion.expira,
+        'segundos': settings.RETENCION_SEGUNDOS,
+    })
+
+def consultar_reservas(fecha=None, estado=None):
+    reservas = Reserva.objects.filter(disponibilidad__isnull=False)
+
     if fecha:
-        query += " AND d.fecha = %s"
-        params.append(fecha)
-    
+        reservas = reservas.filter(disponibilidad__fecha=fecha)
+
     if estado:
-        query += " AND r.estadoReserva = %s"
-        params.append(estado)
-    
-    query += " ORDER BY r.idReserva DESC"
-    
-    with connection.cursor() as cursor:
-        cursor.execute(query, params)
-        columns = [col[0] for col in cursor.description]
-        reservas_data = [dict(zip(columns, row)) for row in cursor.fetchall()]
-        
-        for reserva in reservas_data:
-            visitante_pk_id = reserva['visitante_id'] 
-            
-            cursor.execute("""
-                SELECT rut, nombre, fecha_nacimiento /* CAMBIO: Reemplazado 'edad' por 'fecha_nacimiento' */
-                FROM acompañante 
-                WHERE rutVisitante_id = %s 
-            """, [visitante_pk_id])
-            
-            acompanantes_columns = [col[0] for col in cursor.description]
-            reserva['acompanantes'] = [
-                dict(zip(acompanantes_columns, row)) 
-                for row in cursor.fetchall()
-            ]
+        reservas = reservas.filter(estadoReserva=estado)
+
+    return reservas.order_by('-idReserva').values(
+        'idReserva',
+        'visitante_id',
+        'disponibilidad_id',
+        'cantidadVisitantes',
+        'estadoReserva',
+        visitante_rut=F('visitante__rut'),
+        visitante_fecha_nacimiento=F('visitante__fecha_nacimiento'),
+        visitante_nombre=F('visitante__nombre'),
+        visitante_apellido=F('visitante__apellido'),
+        visitante_telefono=F('visitante__telefono'),
+        visitante_correo=F('visitante__correo'),
+        disponibilidad_fecha=F('disponibilidad__fecha'),
+        horaInicio=F('disponibilidad__horaInicio'),
+        horaFin=F('disponibilidad__horaFin'),
+        tipo_visita_nombre=F('tipoVisita__nombre'),
+    )
 
-    
-    paginator = Paginator(reservas_data, 10)
-    page_obj = paginator.get_page(page_number)
+def consultar_acompanantes(reserva_ids, visitante_ids):
+    # Los acompañantes anteriores a la columna reserva se siguen asociando por visitante
+    return Acompañante.objects.filter(
+        Q(reserva_id__in=reserva_ids) | Q(reserva__isnull=True, rutVisitante_id__in=visitante_ids)
+    ).values('idAcompañante', 'reserva_id', 'rutVisitante_id', 'rut', 'nombre', 'fecha_nacimiento')
+
+def acompanantes_de(reservas):
+    return consultar_acompanantes(
+        [reserva['idReserva'] for reserva in reservas],
+        {reserva['visitante_id'] for reserva in reservas}
+    )
+
+def adjuntar_acompanantes(reservas):
+    # Una sola consulta para los acompañantes de todas las reservas recibidas
+    acompanantes = list(acompanantes_de(reservas)) if reservas else []
+    return repartir_acompanantes(reservas, acompanantes)
+
+async def aadjuntar_acompanantes(reservas):
+    acompanantes = [a async for a in acompanantes_de(reservas)] if reservas else []
+    return repartir_acompanantes(reservas, acompanantes)
+
+def repartir_acompanantes(reservas, acompanantes):
+    por_reserva = {}
+    por_visitante = {}
+
+    for acompanante in sorted(acompanantes, key=lambda a: a['idAcompañante']):
+        reserva_id = acompanante.pop('reserva_id')
+        visitante_id = acompanante.pop('rutVisitante_id')
+        if reserva_id:
+            por_reserva.setdefault(reserva_id, []).append(acompanante)
+        else:
+            por_visitante.setdefault(visitante_id, []).append(acompanante)
+
+    for reserva in reservas:
+        reserva['acompanantes'] = por_reserva.get(reserva['idReserva']) or por_visitante.get(reserva['visitante_id'], [])
+
+    return reservas
+
+async def alistar(queryset):
+    return [fila async for fila in queryset]
+
+def numero_pagina(valor):
+    # Mismo criterio que Paginator.get_page: lo que no es un entero válido es la primera página
+    try:
+        return max(int(valor), 1)
+    except (TypeError, ValueError):
+        return 1
+
+@login_required 
+@lectura_en_replica
+async def validarReserva(request):
+    fecha = request.GET.get('fecha')
+    estado = request.GET.get('estado')
+    numero = numero_pagina(request.GET.get('page', 1))
+    por_pagina = 10
+
+    # COUNT + LIMIT/OFFSET en la base de datos; solo la página visible llega a Python.
+    # El total y la página pedida se consultan a la vez; si la página quedó fuera
+    # de rango se lee la última, como hace get_page
+    reservas = consultar_reservas(fecha, estado)
+    paginator = Paginator(reservas, por_pagina)
+    total, filas = await asyncio.gather(
+        reservas.acount(),
+        alistar(reservas[(numero - 1) * por_pagina:numero * por_pagina])
+    )
+    paginator.count = total
+    page_obj = paginator.get_page(numero)
+    if page_obj.number != numero:
+        filas = await alistar(page_obj.object_list)
+    page_obj.object_list = await aadjuntar_acompanantes(filas)
     
     context = {
         'reservas': page_obj,
@@ -205,7 +379,111 @@ def validarReserva(request):
         }
     }
     
-    return render(request, 'reservas.html', context)
+    return await arender(request, 'reservas.html', context)
+
+# Reservas por consulta al exportar: acota la memoria del streaming
+LOTE_EXPORTACION = 1000
+
+def iterar_reservas(fecha=None, estado=None, tamano_lote=None):
+    # Paginación por clave (idReserva < último visto): memoria constante y sin OFFSET creciente
+    reservas = consultar_reservas(fecha, estado)
+    tamano_lote = tamano_lote or LOTE_EXPORTACION
+    ultimo_id = None
+
+    while True:
+        lote = reservas if ultimo_id is None else reservas.filter(idReserva__lt=ultimo_id)
+        lote = list(lote[:tamano_lote])
+        if not lote:
+            break
+
+        yield adjuntar_acompanantes(lote)
+        ultimo_id = lote[-1]['idReserva']
+
+async def aiterar_reservas(fecha=None, estado=None, tamano_lote=None):
+    # Igual que iterar_reservas con el ORM asíncrono: bajo ASGI cada lote se lee cuando se va a enviar
+    reservas = consultar_reservas(fecha, estado)
+    tamano_lote = tamano_lote or LOTE_EXPORTACION
+    ultimo_id = None
+
+    while True:
+        lote = reservas if ultimo_id is None else reservas.filter(idReserva__lt=ultimo_id)
+        lote = await alistar(lote[:tamano_lote])
+        if not lote:
+            break
+
+        yield await aadjuntar_acompanantes(lote)
+        ultimo_id = lote[-1]['idReserva']
+
+COLUMNAS_EXPORTACION = [
+    'idReserva', 'disponibilidad_fecha', 'horaInicio', 'horaFin', 'tipo_visita_nombre', 'estadoReserva',
+    'cantidadVisitantes', 'visitante_rut', 'visitante_nombre', 'visitante_apellido', 'visitante_telefono',
+    'visitante_correo', 'visitante_fecha_nacimiento',
+]
+
+class EcoCSV:
+    # csv.writer escribe en un objeto con write(); aquí se devuelve la línea para el streaming
+    def write(self, valor):
+        return valor
+
+def encabezado_csv():
+    return csv.writer(EcoCSV()).writerow(COLUMNAS_EXPORTACION + ['acompanantes'])
+
+def lote_csv(lote):
+    writer = csv.writer(EcoCSV())
+    return ''.join(
+        writer.writerow([reserva[columna] for columna in COLUMNAS_EXPORTACION] + [
+            '; '.join(f"{a['rut']} {a['nombre']} {a['fecha_nacimiento'] or ''}".strip() for a in reserva['acompanantes'])
+        ])
+        for reserva in lote
+    )
+
+def lote_jsonl(lote):
+    return ''.join(
+        json.dumps({
+            **{columna: reserva[columna] for columna in COLUMNAS_EXPORTACION},
+            'acompanantes': reserva['acompanantes'],
+        }, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+        for reserva in lote
+    )
+
+def filas_csv(fecha, estado):
+    yield encabezado_csv()
+    for lote in iterar_reservas(fecha, estado):
+        yield lote_csv(lote)
+
+def filas_jsonl(fecha, estado):
+    for lote in iterar_reservas(fecha, estado):
+        yield lote_jsonl(lote)
+
+async def afilas_csv(fecha, estado):
+    yield encabezado_csv()
+    async for lote in aiterar_reservas(fecha, estado):
+        yield lote_csv(lote)
+
+async def afilas_jsonl(fecha, estado):
+    async for lote in aiterar_reservas(fecha, estado):
+        yield lote_jsonl(lote)
+
+@login_required 
+@lectura_en_replica
+def exportarReservas(request):
+    fecha = request.GET.get('fecha')
+    estado = request.GET.get('estado')
+    # Bajo ASGI, Django convierte un iterador síncrono en una lista antes de enviar el
+    # primer byte: ahí el contenido es asíncrono para seguir enviando lote a lote
+    asincrono = isinstance(request, ASGIRequest)
+
+    if request.GET.get('formato') == 'jsonl':
+        filas = afilas_jsonl if asincrono else filas_jsonl
+        response = StreamingHttpResponse(filas(fecha, estado), content_type='application/x-ndjson; charset=utf-8')
+        extension = 'jsonl'
+    else:
+        filas = afilas_csv if asincrono else filas_csv
+        response = StreamingHttpResponse(filas(fecha, estado), content_type='text/csv; charset=utf-8')
+        extension = 'csv'
+
+    response['Content-Disposition'] = f'attachment; filename="reservas.{extension}"'
+    return response
 
 @login_required 
 def modificarReserva(request, reserva_id):
@@ -214,7 +492,9 @@ def modificarReserva(request, reserva_id):
     disponibilidades = DisponibilidadParque.objects.all().order_by('fecha', 'horaInicio')
     tipos_visita = TipoVisita.objects.all().order_by('nombre')
     
-    acompanantes = Acompañante.objects.filter(rutVisitante=reserva.visitante)
+    acompanantes = Acompañante.objects.filter(
+        Q(reserva=reserva) | Q(reserva__isnull=True, rutVisitante=reserva.visitante)
+    )
     
     context = {
         'reserva': reserva,
@@ -244,15 +524,11 @@ def guardarModificacionReserva(request, reserva_id):
             new_tipo_visita = TipoVisita.objects.get(nombre=new_tipo_visita_nombre)
             
             if old_disponibilidad:
-                old_disponibilidad.capacidadActual -= old_cantidad_visitantes
-                old_disponibilidad.save()
+                liberar_capacidad(old_disponibilidad.id, old_cantidad_visitantes)
 
-            capacidad_requerida = new_cantidad_visitantes
-            capacidad_disponible = new_disponibilidad.capacidadMaxima - new_disponibilidad.capacidadActual
-
-            if capacidad_requerida > capacidad_disponible:
-                old_disponibilidad.capacidadActual += old_cantidad_visitantes
-                old_disponibilidad.save()
+            # Como en guardarReserva: un horario lleno solo por retenciones vencidas las libera y acepta el cambio
+            if not reservar_o_reclamar(new_disponibilidad.id, new_cantidad_visitantes):
+                transaction.set_rollback(True)
                 messages.error(request, 'ERROR: La nueva disponibilidad seleccionada no tiene capacidad suficiente.')
                 return redirect('modificar_reserva', reserva_id=reserva_id)
 
@@ -261,8 +537,8 @@ def guardarModificacionReserva(request, reserva_id):
             reserva.tipoVisita = new_tipo_visita
             reserva.save()
 
-            new_disponibilidad.capacidadActual += new_cantidad_visitantes
-            new_disponibilidad.save()
+            if old_disponibilidad is None or old_disponibilidad.id != new_disponibilidad.id:
+                descartar_documento(reserva.idReserva)
 
             descripcion = f"Modificación. Fecha/Hora de {old_disponibilidad} a {new_disponibilidad}. Tipo de {old_tipo_visita.nombre} a {new_tipo_visita.nombre}. Cantidad de {old_cantidad_visitantes} a {new_cantidad_visitantes} visitantes."
             RegistroCambioReserva.objects.create(
@@ -277,41 +553,54 @@ def guardarModificacionReserva(request, reserva_id):
             return redirect('validar_reserva')
 
         except Exception as e:
-            try:
-                if 'old_disponibilidad' in locals():
-                    old_disponibilidad.capacidadActual += old_cantidad_visitantes
-                    old_disponibilidad.save()
-            except Exception:
-                pass
-
+            transaction.set_rollback(True)
             messages.error(request, f'Error al guardar la modificación: {str(e)}')
             return redirect('modificar_reserva', reserva_id=reserva_id)
             
     return redirect('validar_reserva')
 
 @login_required 
-def dashboardMonitoreo(request):
+@lectura_en_replica
+async def dashboardMonitoreo(request):
     fecha_inicio = request.GET.get('fecha_inicio')
     fecha_fin = request.GET.get('fecha_fin')
     tipo_visita_filtro = request.GET.get('tipo_visita')
     
-    reservas_base = Reserva.objects.filter(estadoReserva__in=[Reserva.Estado.ACTIVO, Reserva.Estado.UTILIZADO])
+    # Se lee solo el resumen diario, mantenido al crear o modificar reservas
+    ocupacion_base = OcupacionDiaria.objects.all()
+    capacidad_base = CapacidadDiaria.objects.all()
     
     if fecha_inicio:
-        reservas_base = reservas_base.filter(disponibilidad__fecha__gte=fecha_inicio)
+        ocupacion_base = ocupacion_base.filter(fecha__gte=fecha_inicio)
+        capacidad_base = capacidad_base.filter(fecha__gte=fecha_inicio)
     if fecha_fin:
-        reservas_base = reservas_base.filter(disponibilidad__fecha__lte=fecha_fin)
+        ocupacion_base = ocupacion_base.filter(fecha__lte=fecha_fin)
+        capacidad_base = capacidad_base.filter(fecha__lte=fecha_fin)
     if tipo_visita_filtro:
-        reservas_base = reservas_base.filter(tipoVisita__nombre=tipo_visita_filtro)
+        ocupacion_base = ocupacion_base.filter(tipoVisita__nombre=tipo_visita_filtro)
 
-    total_reservas = reservas_base.count()
-    
-    total_visitantes = reservas_base.aggregate(Sum('cantidadVisitantes'))['cantidadVisitantes__sum'] or 0
+    top_fechas = ocupacion_base.values(
+        'fecha'
+    ).annotate(
+        count=Sum('totalVisitantes')
+    ).filter(count__gt=0).order_by('-count')[:5]
+
+    # Las consultas son independientes: se lanzan juntas. El pronóstico lo
+    # calcula manage.py pronosticar_ocupacion y aquí solo se lee
+    totales, capacidad, top_fechas, tipos_visita, en_riesgo = await asyncio.gather(
+        ocupacion_base.aaggregate(
+            total_reservas=Sum('totalReservas'),
+            total_visitantes=Sum('totalVisitantes')
+        ),
+        capacidad_base.aaggregate(Sum('capacidadMaxima')),
+        alistar(top_fechas),
+        alistar(TipoVisita.objects.all().order_by('nombre')),
+        alistar(horarios_en_riesgo(settings.ALERTAS_UMBRAL_HORARIO))
+    )
+    total_reservas = totales['total_reservas'] or 0
+    total_visitantes = totales['total_visitantes'] or 0
     
-    capacidad_data = DisponibilidadParque.objects.filter(
-        fecha__gte=fecha_inicio or '2000-01-01', 
-        fecha__lte=fecha_fin or '2999-12-31'
-    ).aggregate(Sum('capacidadMaxima'))['capacidadMaxima__sum']
+    capacidad_data = capacidad['capacidadMaxima__sum']
     
     capacidad_agregada = capacidad_data or 0
     
@@ -325,24 +614,20 @@ def dashboardMonitoreo(request):
 
     alertas = []
     if porcentaje_ocupacion > 80:
+        # Solo se muestra; las notificaciones de capacidad las registra manage.py evaluar_alertas
         alertas.append("ALERTA: Ocupación alta. Más del 80% de la capacidad reservada en el período seleccionado.")
-        crear_notificacion('ALERTA DE CAPACIDAD', f'Ocupación del parque al {porcentaje_ocupacion}% en el periodo monitoreado.')
     
     if 'generar_informe' in request.GET:
         messages.success(request, f'Informe automático generado. Total de visitantes: {total_visitantes}.')
-    
-    top_fechas = reservas_base.values(
-        'disponibilidad__fecha'
-    ).annotate(
-        count=Sum('cantidadVisitantes')
-    ).order_by('-count')[:5]
 
     context = {
         'total_reservas': total_reservas,
         'total_visitantes': total_visitantes,
         'porcentaje_ocupacion': porcentaje_ocupacion,
         'top_fechas': top_fechas,
-        'tipos_visita': TipoVisita.objects.all().order_by('nombre'),
+        'horarios_en_riesgo': en_riesgo,
+        'umbral_riesgo': settings.ALERTAS_UMBRAL_HORARIO,
+        'tipos_visita': tipos_visita,
         'filtros': {
             'fecha_inicio': fecha_inicio,
             'fecha_fin': fecha_fin,
@@ -351,7 +636,7 @@ def dashboardMonitoreo(request):
         'alertas': alertas
     }
     
-    return render(request, 'dashboard_monitoreo.html', context)
+    return await arender(request, 'dashboard_monitoreo.html', context)
 
 def login_admin(request):
     if request.method == 'POST':
@@ -378,4 +663,37 @@ def login_admin(request):
 def logout_admin(request):
     logout(request)
     messages.info(request, "Sesión cerrada exitosamente.")
-    return redirect('inicio')
\ No newline at end of file
+    return redirect('inicio')
+
+@login_required 
+@require_POST
+def registrarIngreso(request):
+    reserva_id, motivo = registrar_ingreso(request.POST.get('token', ''), timezone.localdate())
+
+    if motivo:
+        return JsonResponse({'aceptado': False, 'reserva': reserva_id, 'motivo': motivo}, status=409)
+    return JsonResponse({'aceptado': True, 'reserva': reserva_id})
+
+@login_required 
+@require_GET
+@lectura_en_replica
+def manifiestoAcceso(request, fecha):
+    return JsonResponse(manifiesto_del_dia(fecha))
+
+@login_required 
+@require_POST
+def sincronizarIngresos(request, fecha):
+    try:
+        reserva_ids = [int(reserva_id) for reserva_id in json.loads(request.body)['ingresos']]
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Se esperaba {"ingresos": [id, ...]}'}, status=400)
+
+    aceptadas, rechazadas = sincronizar_ingresos(reserva_ids, fecha)
+    return JsonResponse({'aceptadas': aceptadas, 'rechazadas': rechazadas})
+
+@login_required 
+@require_GET
+def metricasPrometheus(request):
+    if not request.user.is_staff:
+        raise PermissionDenied
+    return HttpResponse(registro_metricas.exportar(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -16,7 +16,7 @@ import os
 BASE_DIR = Path(__file__).resolve().parent.parent
 TEMPLATE_DIR = os.path.join(BASE_DIR, 'templates')
 STATIC_DIR = os.path.join(BASE_DIR, 'static')
-# MEDIA_DIR = os.path.join(BASE_DIR, 'media')
+MEDIA_DIR = os.path.join(BASE_DIR, 'media')
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
 
@@ -46,6 +46,11 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Sirve los archivos estáticos antes del resto de la cadena
+    'ReservaSystemApp.estaticos.WhiteNoiseAsincrono',
+    # Antes que los demás, para medir también su trabajo (los estáticos no se miden)
+    'ReservaSystemApp.metricas.MetricasMiddleware',
+    'ReservaSystemApp.replicas.ReplicasMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -56,12 +61,19 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'SGRAproject.urls'
 
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [TEMPLATE_DIR],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # En producción las plantillas se compilan una vez por proceso; en desarrollo
+            # se releen en cada petición para ver los cambios sin reiniciar
+            'loaders': TEMPLATE_LOADERS if DEBUG else [('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)],
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
@@ -87,9 +99,90 @@ DATABASES = {
             'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
             'charset': 'utf8mb4'
         }
+    },
+    # Réplicas de solo lectura: cualquier alias que empiece por "replica", p. ej.
+    # 'replica1': {
+    #     'ENGINE': 'mysql.connector.django',
+    #     'NAME': 'sgra_db',
+    #     'HOST': 'replica1.interna',
+    #     ...
+    #     'TEST': {'MIRROR': 'default'},
+    # },
+}
+
+# Solo las vistas marcadas con @lectura_en_replica leen de ellas (ver ReservaSystemApp.replicas)
+DATABASE_ROUTERS = ['ReservaSystemApp.replicas.RouterReplicas']
+REPLICAS_LECTURA = [alias for alias in DATABASES if alias.startswith('replica')]
+# Tras una escritura, el cliente lee de la principal durante estos segundos
+REPLICAS_SEGUNDOS_PRIMARIA = 10
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# En producción debe apuntar a un backend compartido entre workers (Redis o Memcached)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'sgra',
     }
 }
 
+# Disponibilidad publicada en el formulario de reservas
+
+DISPONIBILIDAD_DIAS_VENTANA = 90
+DISPONIBILIDAD_CACHE_TIMEOUT = 300
+# Segundos que los clientes de /api/disponibilidad/ pueden reutilizar una respuesta sin revalidarla
+DISPONIBILIDAD_API_MAX_AGE = 10
+
+# Retención de cupos al elegir un horario (ver ReservaSystemApp.retenciones)
+
+RETENCION_SEGUNDOS = 600
+RETENCION_MAX_VISITANTES = 10
+# Cupos retenidos a la vez desde una misma IP; None lo desactiva
+RETENCION_MAX_POR_CLIENTE = 30
+
+# Control de admisión de guardarReserva (ver ReservaSystemApp.admision); None desactiva cada límite
+
+# Reservas en curso a la vez, en total y por horario
+ADMISION_CONCURRENCIA_GLOBAL = 20
+ADMISION_CONCURRENCIA_HORARIO = 5
+# Cubeta de fichas: reservas admitidas por intervalo entre todos los workers
+ADMISION_FICHAS = 30
+ADMISION_INTERVALO_SEGUNDOS = 1
+ADMISION_ESPERA_MAXIMA_SEGUNDOS = 30
+# Vencimiento de los contadores de reservas en curso, contado desde la última entrada
+ADMISION_TTL_SEGUNDOS = 60
+
+# Métricas por ruta de ReservaSystemApp.metricas, publicadas en /metricas/ para el personal
+
+METRICAS_LIMITES_SEGUNDOS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+# Peticiones más lentas que esto se registran con sus consultas SQL; None lo desactiva
+METRICAS_UMBRAL_LENTO_MS = 1000
+METRICAS_SQL_LENTO_MAX = 20
+
+# Alertas de capacidad (porcentaje de ocupación), evaluadas por manage.py evaluar_alertas
+
+ALERTAS_UMBRAL_HORARIO = 80
+ALERTAS_UMBRAL_DIA = 80
+
+# Pronóstico de ocupación por horario, calculado por manage.py pronosticar_ocupacion
+
+PRONOSTICO_DIAS_HISTORIA = 365
+# Anticipación máxima de las curvas de llenado; la ventana publicada no permite reservar antes
+PRONOSTICO_DIAS_ANTICIPACION = DISPONIBILIDAD_DIAS_VENTANA
+
+# Documentos de acceso con código QR, generados por manage.py generar_documentos
+
+DOCUMENTOS_QR_PROCESOS = 4
+DOCUMENTOS_QR_LOTE = 200
+
+# Notificaciones: se escriben en lotes al terminar las peticiones y al cerrar el proceso
+
+NOTIFICACIONES_TAMANO_LOTE = 50
+NOTIFICACIONES_INTERVALO = 5
+NOTIFICACIONES_OUTBOX_DIR = os.path.join(BASE_DIR, 'outbox')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -127,6 +220,28 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 STATICFILES_DIRS = [STATIC_DIR]
+# Destino de manage.py collectstatic, servido por WhiteNoise
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+
+# En producción collectstatic minifica JS y CSS, agrega el hash del contenido al
+# nombre y genera las variantes .gz y .br; los archivos con hash se sirven con
+# caché de un año (immutable). En desarrollo se sirven los originales.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': (
+            'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+            else 'ReservaSystemApp.estaticos.AlmacenEstaticos'
+        ),
+    },
+}
+# Archivos sin hash (p. ej. favicon): una hora
+WHITENOISE_MAX_AGE = 3600
+
+MEDIA_URL = 'media/'
+MEDIA_ROOT = MEDIA_DIR
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
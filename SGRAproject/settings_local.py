@@ -0,0 +1,22 @@
+# Desarrollo local sin MySQL: dos bases SQLite, la principal y una réplica de lectura.
+# La réplica no se sincroniza sola; copie db.sqlite3 a db_replica.sqlite3 para actualizarla
+# (sirve para probar el retraso de replicación y la lectura de la principal tras escribir).
+#
+#     python manage.py migrate --settings=SGRAproject.settings_local
+#     python manage.py test --settings=SGRAproject.settings_local
+
+from .settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db_replica.sqlite3',
+        # En las pruebas la réplica es la misma base de pruebas que la principal
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+REPLICAS_LECTURA = ['replica']
@@ -0,0 +1,34 @@
+# Configuración para manage.py medir_rendimiento: la misma aplicación sobre una
+# base SQLite temporal, que el comando crea al empezar y borra al terminar
+
+from .settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'rendimiento.sqlite3',
+        # Espera a que se libere el bloqueo de escritura en vez de fallar de inmediato. IMMEDIATE
+        # toma ese bloqueo al abrir la transacción: una que lee antes de escribir (p. ej. al
+        # liberar retenciones vencidas) no puede quedar en espera mutua con otra y fallar
+        'OPTIONS': {'timeout': 30, 'transaction_mode': 'IMMEDIATE'},
+        'TEST': {'NAME': BASE_DIR / 'rendimiento.sqlite3'},
+    }
+}
+
+# Las respuestas 4xx esperadas (ingresos repetidos, reservas sin cupo) no se registran
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'loggers': {
+        'django.request': {'level': 'ERROR'},
+    },
+}
+
+# Plantillas compiladas una vez, como en producción
+TEMPLATES[0]['OPTIONS']['loaders'] = [('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)]
+
+# El comando ya mide la latencia: bajo carga casi todas las peticiones superarían el umbral
+METRICAS_UMBRAL_LENTO_MS = None
+
+# Todos los clientes simulados salen de 127.0.0.1: con el límite por IP, retener_cupos mediría rechazos
+RETENCION_MAX_POR_CLIENTE = None